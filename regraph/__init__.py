@@ -6,6 +6,14 @@ from regraph.neo4j.hierarchy import Neo4jHierarchy
 
 from regraph.rules import Rule
 
+from regraph.networkx.matching import (CompiledPattern,
+                                       MatchingBudget,
+                                       MatchingResult)
+
+from regraph.networkx.incremental import IncrementalMatcher
+
+from regraph.networkx.engine import RuleSystem, RunReport
+
 from regraph.exceptions import *
 
 from regraph.networkx.plotting import *
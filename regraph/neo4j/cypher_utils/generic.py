@@ -342,6 +342,12 @@ def constraint_query(node_var, node_label, node_property):
     return query
 
 
+def index_query(node_label, node_property):
+    """Generate query for creating an index on a property."""
+    query = "INDEX ON :{}({})".format(node_label, node_property)
+    return query
+
+
 def merge_properties(var_list, new_props_var, carry_vars=None,
                      method='union'):
     """Merge properties of a list of nodes/edges.
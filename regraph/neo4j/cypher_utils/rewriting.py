@@ -5,6 +5,7 @@ from regraph.attribute_sets import (FiniteSet,
                                     IntegerSet,
                                     RegexSet)
 from regraph.exceptions import ReGraphError
+from regraph.utils import normalize_attrs
 
 
 def add_node(var_name, node_id, node_id_var, node_label,
@@ -223,7 +224,8 @@ def remove_attributes(var_name, attrs):
 def cloning_query(original_var, clone_var, clone_id, clone_id_var,
                   node_label, edge_labels, sucs_to_ignore=None,
                   preds_to_ignore=None,
-                  carry_vars=None, ignore_naming=False):
+                  carry_vars=None, ignore_naming=False,
+                  sucs_to_ignore_expr=None, preds_to_ignore_expr=None):
     """Generate query for cloning a node.
 
     Parameters
@@ -248,6 +250,12 @@ def cloning_query(original_var, clone_var, clone_id, clone_id_var,
         while reconnecting edges to the new clone node
     carry_vars : iterable
         Collection of variables to carry
+    sucs_to_ignore_expr : str, optional
+        Cypher expression (e.g. a parameter) evaluating to the list of
+        ids of successors to ignore, used instead of `sucs_to_ignore`
+    preds_to_ignore_expr : str, optional
+        Cypher expression evaluating to the list of ids of predecessors
+        to ignore, used instead of `preds_to_ignore`
 
     Returns
     -------
@@ -326,11 +334,15 @@ def cloning_query(original_var, clone_var, clone_id, clone_id_var,
     carry_vars.add(clone_id_var)
     carry_vars.add(clone_var)
 
+    if sucs_to_ignore_expr is None:
+        sucs_to_ignore_expr = "[{}]".format(
+            ", ".join("'{}'".format(n) for n in sucs_to_ignore))
+    if preds_to_ignore_expr is None:
+        preds_to_ignore_expr = "[{}]".format(
+            ", ".join("'{}'".format(n) for n in preds_to_ignore))
     query += (
-        "WITH [{}] as sucIgnore, ".format(
-            ", ".join("'{}'".format(n) for n in sucs_to_ignore)) +
-        "[{}] as predIgnore, ".format(
-            ", ".join("'{}'".format(n) for n in preds_to_ignore)) +
+        "WITH {} as sucIgnore, ".format(sucs_to_ignore_expr) +
+        "{} as predIgnore, ".format(preds_to_ignore_expr) +
         ", ".join(carry_vars) + " \n"
     )
 
@@ -719,10 +731,93 @@ def merging_query1(original_vars, merged_var, merged_id, merged_id_var,
     return query, carry_vars
 
 
+# Cache of the templates of matching queries, keys are pattern shapes
+_matching_templates = dict()
+
+
+def _matching_shape(pattern, pattern_nodes, node_label, edge_label,
+                    nodes, pattern_typing):
+    """Get the shape of a pattern (everything but values of the parameters).
+
+    Returns the shape (a hashable object) together with the attributes of
+    the nodes given as lists of pairs (key, values), in the order of the
+    keys in the shape.
+    """
+    indices = dict((n, i) for i, n in enumerate(pattern_nodes))
+    edges = tuple(sorted(
+        (indices[u], indices[v]) for u, v in pattern.edges()))
+
+    node_attrs = []
+    attr_keys = []
+    for n in pattern_nodes:
+        normalized_attrs = dict(pattern.node[n])
+        normalize_attrs(normalized_attrs)
+        attrs = []
+        for k in sorted(normalized_attrs.keys(), key=str):
+            values = [el for el in normalized_attrs[k]]
+            if len(values) > 0:
+                attrs.append((k, values))
+        node_attrs.append(attrs)
+        attr_keys.append(tuple(k for k, _ in attrs))
+
+    typing_graphs = []
+    if pattern_typing is not None:
+        for typing_graph in sorted(pattern_typing.keys(), key=str):
+            typed = tuple(
+                i for i, n in enumerate(pattern_nodes)
+                if n in pattern_typing[typing_graph].keys())
+            if len(typed) > 0:
+                typing_graphs.append((typing_graph, typed))
+
+    shape = (
+        node_label, edge_label, len(pattern_nodes), edges,
+        tuple(attr_keys), tuple(typing_graphs), nodes is not None
+    )
+    return shape, node_attrs
+
+
+def _matching_template(shape):
+    """Generate a parameterized matching query for a pattern shape."""
+    (node_label, edge_label, n_nodes, edges,
+     attr_keys, typing_graphs, filter_nodes) = shape
+
+    patterns = ["(n{}:{})".format(i, node_label) for i in range(n_nodes)]
+    patterns += [
+        "(n{})-[:{}]->(n{})".format(u, edge_label, v) for u, v in edges]
+    conditions = []
+    for j, (typing_graph, typed) in enumerate(typing_graphs):
+        for i in typed:
+            patterns.append(
+                "(n{})-[:typing]->(t{}_{}:{})".format(i, i, j, typing_graph))
+            conditions.append("t{}_{}.id = $type_{}_{}".format(i, j, i, j))
+    if filter_nodes:
+        conditions += [
+            "n{}.id IN $nodes".format(i) for i in range(n_nodes)]
+    for i, keys in enumerate(attr_keys):
+        for j, k in enumerate(keys):
+            conditions.append(
+                "ALL(v IN $attr_{}_{} WHERE v IN n{}.`{}`)".format(
+                    i, j, i, k))
+
+    query = "MATCH {}\n".format(", ".join(patterns))
+    if len(conditions) > 0:
+        query += "WHERE " + " AND ".join(conditions) + "\n"
+    query += "RETURN {}".format(
+        ", ".join("n{}".format(i) for i in range(n_nodes)))
+    return query
+
+
 def find_matching(pattern, node_label, edge_label,
                   nodes=None, pattern_typing=None):
     """Query that performs pattern match in the graph.
 
+    The query is parameterized: ids of the nodes, typing and attributes
+    are not inlined into the query, but passed as parameters. The
+    query only depends on the shape of the pattern (its edges, the keys
+    of the attributes of its nodes and the typing graphs of its nodes),
+    the generated queries are cached per shape, so that the database
+    can reuse the execution plans of the queries.
+
     Parameters
     ----------
     pattern : nx.(Di)Graph
@@ -733,58 +828,43 @@ def find_matching(pattern, node_label, edge_label,
         Label of the node to match, default is 'node'
     edge_label
         Label of the edges to match, default is 'edge'
-    """
-    query =\
-        "MATCH {}".format(
-            ", ".join(
-                "({}:{})".format(n, node_label)
-                for n in pattern.nodes()))
-    if len(pattern.edges()) > 0:
-        query += ", {}".format(
-            ", ".join("({})-[:{}]->({})".format(
-                u, edge_label, v)
-                for u, v in pattern.edges())) + "\n"
-    else:
-        query += "\n"
+    pattern_typing : dict, optional
+        Dictionary whose keys are labels of the typing graphs and whose
+        values are (partial) typings of the pattern nodes
 
+    Returns
+    -------
+    query : str
+        Generated query, returns the images of the pattern nodes
+        in the variables `n0`, `n1`, ...
+    parameters : dict
+        Parameters of the query
+    variables : dict
+        Dictionary whose keys are the returned variables and whose values
+        are the corresponding nodes of the pattern
+    """
+    pattern_nodes = list(pattern.nodes())
+    shape, node_attrs = _matching_shape(
+        pattern, pattern_nodes, node_label, edge_label,
+        nodes, pattern_typing)
+    if shape not in _matching_templates.keys():
+        _matching_templates[shape] = _matching_template(shape)
+    query = _matching_templates[shape]
+
+    parameters = dict()
     if nodes is not None:
-        query +=\
-            "WHERE " + " AND ".join(
-                "{}.id IN [{}]".format(
-                    pattern_n, ", ".join("'{}'".format(n) for n in nodes))
-                for pattern_n in pattern.nodes()) + "\n"
-
-    if pattern_typing is not None:
-        if nodes is not None and len(nodes) > 0:
-            query += " AND "
-        else:
-            query += " WHERE "
-        for typing_graph, mapping in pattern_typing.items():
-            query +=\
-                " AND ".join(
-                    "({})-[:typing]->(:{} {{id: '{}'}})".format(
-                        n, typing_graph, pattern_typing[typing_graph][n])
-                    for n in pattern.nodes() if n in pattern_typing[typing_graph].keys()
-                ) + "\n "
-
-    nodes_with_attrs = []
-    for n, attrs in pattern.nodes(data=True):
-        if len(attrs) != 0:
-            for k in attrs.keys():
-                for el in attrs[k]:
-                    if type(el) == str:
-                        nodes_with_attrs.append((n, k, "'{}'".format(el)))
-                    else:
-                        nodes_with_attrs.append((n, k, "{}".format(el)))
-    if len(nodes_with_attrs) != 0:
-        query += (
-            "WHERE " +
-            " AND ".join(["{} IN {}.{}".format(
-                v, n, k) for n, k, v in nodes_with_attrs]) + "\n"
-        )
+        parameters["nodes"] = ["{}".format(n) for n in nodes]
+    for j, (typing_graph, typed) in enumerate(shape[5]):
+        for i in typed:
+            parameters["type_{}_{}".format(i, j)] = "{}".format(
+                pattern_typing[typing_graph][pattern_nodes[i]])
+    for i, attrs in enumerate(node_attrs):
+        for j, (_, values) in enumerate(attrs):
+            parameters["attr_{}_{}".format(i, j)] = values
 
-    query += "RETURN {}".format(", ".join(pattern.nodes()))
-    return query
+    variables = dict(
+        ("n{}".format(i), n) for i, n in enumerate(pattern_nodes))
+    return query, parameters, variables
 
 
 def match_pattern_instance(pattern, pattern_vars, instance,
@@ -821,6 +901,47 @@ def match_pattern_instance(pattern, pattern_vars, instance,
     return query
 
 
+def match_pattern_batch(pattern, pattern_vars, row_var,
+                        node_label, edge_label):
+    """Query to match the instances of the pattern given by the rows.
+
+    The ids of the nodes are not inlined into the query: the node
+    of the pattern whose variable is `v` is matched by the id
+    `<row_var>.v`, where `row_var` is a map variable (e.g. introduced
+    by `UNWIND $instances AS <row_var>`).
+
+    Parameters
+    ----------
+    pattern : nx.(Di)Graph
+        Graph object representing a pattern
+    pattern_vars : dict
+        Dictionary whose keys are nodes of the pattern and whose
+        values are the names of the variables to use
+    row_var : str
+        Name of the variable of the current instance
+    node_label :
+    edge_label :
+    """
+    if len(pattern.nodes()) == 0:
+        return ""
+    query = "MATCH " + ", ".join(
+        "({}:{} {{ id : {}.{} }})".format(
+            pattern_vars[n], node_label, row_var, pattern_vars[n])
+        for n in pattern.nodes())
+    if len(pattern.edges()) > 0:
+        query +=\
+            ", " +\
+            ", ".join(
+                "({})-[{}:{}]->({})".format(
+                    pattern_vars[u],
+                    str(pattern_vars[u]) + "_" + str(pattern_vars[v]),
+                    edge_label,
+                    pattern_vars[v])
+                for u, v in pattern.edges())
+    query += "\n"
+    return query
+
+
 def merging_from_list(list_var, merged_var, merged_id, merged_id_var,
                       node_label, edge_label, merge_typing=False,
                       carry_vars=None, ignore_naming=False,
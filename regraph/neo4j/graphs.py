@@ -54,12 +54,15 @@ class Neo4jGraph(object):
 
         if unique_node_ids:
             self.set_constraint('id')
+        else:
+            # Matching queries look up nodes by ids
+            self.set_index('id')
 
-    def execute(self, query):
-        """Execute a Cypher query."""
+    def execute(self, query, parameters=None):
+        """Execute a Cypher query (optionally, with parameters)."""
         with self._driver.session() as session:
             if len(query) > 0:
-                result = session.run(query)
+                result = session.run(query, parameters)
                 return result
 
     def _clear(self):
@@ -92,6 +95,22 @@ class Neo4jGraph(object):
         result = self.execute(query)
         return result
 
+    def set_index(self, prop):
+        """Create an index on the property.
+
+        Parameters
+        ----------
+        prop : str
+            Name of the property to index
+
+        Returns
+        -------
+        result : BoltStatementResult
+        """
+        query = "CREATE " + cypher.index_query(self._node_label, prop)
+        result = self.execute(query)
+        return result
+
     def _drop_constraint(self, prop):
         """Drop a uniqueness constraint on the property.
 
@@ -529,19 +548,19 @@ class Neo4jGraph(object):
     def find_matching(self, pattern, nodes=None, pattern_typing=None):
         """Find matchings of a pattern in the graph."""
         if len(pattern.nodes()) != 0:
-            result = self.execute(
-                cypher.find_matching(
-                    pattern,
-                    node_label=self._node_label,
-                    edge_label=self._edge_label,
-                    nodes=nodes,
-                    pattern_typing=pattern_typing))
+            query, parameters, variables = cypher.find_matching(
+                pattern,
+                node_label=self._node_label,
+                edge_label=self._edge_label,
+                nodes=nodes,
+                pattern_typing=pattern_typing)
+            result = self.execute(query, parameters)
             instances = list()
 
             for record in result:
                 instance = dict()
                 for k, v in record.items():
-                    instance[k] = dict(v)["id"]
+                    instance[variables[k]] = dict(v)["id"]
                 instances.append(instance)
         else:
             instances = []
@@ -569,3 +588,44 @@ class Neo4jGraph(object):
             rhs_vars_inverse[k]: v for k, v in rhs_g.items()
         }
         return rhs_g
+
+    def rewrite_many(self, rule, instances):
+        """Perform SqPO rewriting of many instances of a rule at once.
+
+        The instances have to be parallel independent (see
+        `regraph.rules.Rule.apply_to_all`). The rule is applied to all
+        the instances by a single parameterized query (see
+        `regraph.rules.Rule.to_cypher_batch`) executed in one
+        transaction.
+
+        Returns
+        -------
+        rhs_gs : list of dict
+            Dictionaries mapping the nodes of the rhs to the nodes
+            of the resulting graph (one per instance, in the order
+            of `instances`)
+
+        Raises
+        ------
+        RewritingError
+            If the instances are not parallel independent (checked
+            before the query is run)
+        """
+        if len(instances) == 0:
+            return []
+        query, parameters, rhs_vars_inverse = rule.to_cypher_batch(
+            instances, self._node_label, self._edge_label)
+
+        with self._driver.session() as session:
+            tx = session.begin_transaction()
+            records = list(tx.run(query, parameters))
+            tx.commit()
+
+        rhs_gs = [dict() for _ in instances]
+        for record in records:
+            rhs_g = rhs_gs[record["instance_index"]]
+            for k, v in record.items():
+                if k in rhs_vars_inverse.keys() and v is not None and\
+                   v["id"] is not None:
+                    rhs_g[rhs_vars_inverse[k]] = v["id"]
+        return rhs_gs
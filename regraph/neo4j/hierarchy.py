@@ -9,7 +9,7 @@ from . import cypher_utils as cypher
 from regraph.exceptions import (HierarchyError,
                                 InvalidHomomorphism,
                                 RewritingError)
-from regraph.utils import (normalize_attrs, keys_by_value)
+from regraph.utils import normalize_attrs
 
 
 class Neo4jHierarchy(object):
@@ -639,6 +639,46 @@ class Neo4jHierarchy(object):
 
         return self, rhs_g
 
+    def rewrite_many(self, graph_id, rule, instances,
+                     rhs_typing=None, strict=True):
+        """Rewrite many instances of a rule and propagate the changes.
+
+        The instances have to be parallel independent (see
+        `regraph.rules.Rule.apply_to_all`), they are rewritten with
+        a single batched query (see `Neo4jGraph.rewrite_many`) and
+        the changes are propagated once. `rhs_typing` is the typing
+        of the rhs of the rule (shared by all the instances), the
+        other parameters are the same as in `rewrite`.
+
+        Returns
+        -------
+        hierarchy : Neo4jHierarchy
+        rhs_gs : list of dict
+            Matchings of the rhs in the rewritten graph (one per
+            instance)
+        """
+        if rhs_typing is None:
+            rhs_typing = {}
+
+        if strict is True:
+            for instance in instances:
+                self._check_rhs_typing(graph_id, rule, instance, rhs_typing)
+
+        g = self._access_graph(graph_id)
+        rhs_gs = g.rewrite_many(rule, instances)
+
+        if len(rule.added_nodes()) > 0 and rhs_typing:
+            for rhs_g in rhs_gs:
+                self._add_tmp_typing(graph_id, rhs_g, rhs_typing)
+
+        if len(instances) > 0:
+            if rule.is_restrictive():
+                self._propagate_up(graph_id, rule)
+            if strict is False and rule.is_relaxing():
+                self._propagate_down(graph_id, graph_id, rule)
+
+        return self, rhs_gs
+
     def _propagate_up(self, graph_id, rule):
         predecessors = self.predecessors(graph_id)
         for predecessor in predecessors:
@@ -768,10 +808,11 @@ class Neo4jHierarchy(object):
 
     def _check_rhs_typing(self, graph_id, rule, instance, rhs_typing):
         # Check the rhs typing can be consistently inferred
-        if rule.is_relaxing():
+        plan = rule.plan()
+        if plan.is_relaxing:
             for s in self.successors(graph_id):
                 # check if there are no untyped new nodes
-                for n in rule.added_nodes():
+                for n in plan.added_nodes:
                     if s not in rhs_typing.keys() or\
                        n not in rhs_typing[s].keys():
                         raise RewritingError(
@@ -782,7 +823,7 @@ class Neo4jHierarchy(object):
 
                 # check if there are no merges of different types
                 merges = {}
-                for rhs_node, p_nodes in rule.merged_nodes().items():
+                for rhs_node, p_nodes in plan.merged_nodes.items():
                     merged_types = set(
                         [self.node_type(
                             graph_id, instance[rule.p_lhs[n]])[s] for n in p_nodes])
@@ -800,27 +841,26 @@ class Neo4jHierarchy(object):
                 # check if there are no forbidden edges
                 preserved_nodes = {}
                 for n in rule.rhs.nodes():
-                    if n not in rule.merged_nodes() and\
-                       n not in rule.added_nodes():
-                        preserved_nodes[n] = list(
-                            keys_by_value(rule.p_rhs, n))[0]
+                    if n not in plan.merged_nodes and\
+                       n not in plan.added_nodes:
+                        preserved_nodes[n] = plan.rhs_preimages[n][0]
 
-                for source, target in rule.added_edges():
-                    if source in rule.added_nodes():
+                for source, target in plan.added_edges:
+                    if source in plan.added_nodes:
                         source_typing = rhs_typing[s][source]
                     elif source in merges.keys():
                         source_typing = merges[source]
                     else:
-                        p_source = keys_by_value(rule.p_rhs, source)[0]
+                        p_source = plan.rhs_preimages[source][0]
                         source_typing = self.node_type(
                             graph_id, instance[rule.p_lhs[p_source]])[s]
 
-                    if target in rule.added_nodes():
+                    if target in plan.added_nodes:
                         target_typing = rhs_typing[s][target]
                     elif target in merges.keys():
                         target_typing = merges[target]
                     else:
-                        p_target = keys_by_value(rule.p_rhs, target)[0]
+                        p_target = plan.rhs_preimages[target][0]
                         target_typing = self.node_type(
                             graph_id, instance[rule.p_lhs[p_target]])[s]
 
@@ -832,8 +872,8 @@ class Neo4jHierarchy(object):
                             "is no edge '{}'->'{}'' in the graph '{}')!".format(
                                 source_typing, target_typing, s))
 
-                for n, attrs in rule.added_node_attrs().items():
-                    if n in rule.added_nodes():
+                for n, attrs in plan.added_node_attrs.items():
+                    if n in plan.added_nodes:
                         typing = rhs_typing[s][n]
                     elif n in merges.keys():
                         typing = merges[n]
@@ -845,14 +885,14 @@ class Neo4jHierarchy(object):
                             "'{}' from P added by the rule are not present in ".format(n) +
                             "'{}' of the graph {}!".format(typing, s))
 
-                for (source, target), attrs in rule.added_edge_attrs().items():
-                    if source in rule.added_nodes():
+                for (source, target), attrs in plan.added_edge_attrs.items():
+                    if source in plan.added_nodes:
                         source_typing = rhs_typing[s][source]
                     elif source in merges.keys():
                         source_typing = merges[source]
                     else:
                         source_typing = preserved_nodes[source]
-                    if target in rule.added_nodes():
+                    if target in plan.added_nodes:
                         target_typing = rhs_typing[s][target]
                     elif target in merges.keys():
                         target_typing = merges[target]
@@ -3,11 +3,15 @@ import networkx as nx
 import copy
 
 from regraph.networkx.primitives import *
+from regraph.networkx.overlay import overlay_graph
 from regraph.utils import (keys_by_value,
                            merge_attributes,
                            restrict_mapping,
                            dict_sub,
                            id_of,
+                           DeltaMapping,
+                           IdentityMapping,
+                           IndexedMapping,
                            valid_attributes,
                            attrs_intersection)
 from regraph.exceptions import (InvalidHomomorphism, ReGraphError)
@@ -29,7 +33,27 @@ def subgraph(graph, nodes):
 
 
 def compose(d1, d2):
-    """Compose two homomorphisms given by dicts."""
+    """Compose two homomorphisms given by dicts.
+
+    If `d1` is a `DeltaMapping` over the identity (e.g. the
+    homomorphism produced by `pullback_complement`), the result is
+    a new layer over `d2` (see `DeltaMapping.layer`) and the cost of
+    the composition is proportional to the size of the delta of `d1`.
+    In this case the keys of `d2` are assumed to be in the domain of
+    the identity.
+    """
+    if isinstance(d1, DeltaMapping) and\
+       isinstance(d1.base, IdentityMapping):
+        res = DeltaMapping.layer(d2)
+        for key in d1.removed:
+            if key in res:
+                del res[key]
+        for key, value in d1.local.items():
+            if value in d2:
+                res[key] = d2[value]
+            elif key in res:
+                del res[key]
+        return res
     res = dict()
     for key, value in d1.items():
         if value in d2.keys():
@@ -61,7 +85,7 @@ def check_homomorphism(source, target, dictionary, total=True):
     # check if there is mapping for all the nodes of source graph
     if total:
         check_totality(source.nodes(), dictionary)
-    if not set(dictionary.values()).issubset(target.nodes()):
+    if not all(exists_node(target, n) for n in dictionary.values()):
         raise InvalidHomomorphism(
             "Some of the image nodes in mapping %s do not "
             "exist in target graph (target graph nodes %s) "
@@ -73,24 +97,13 @@ def check_homomorphism(source, target, dictionary, total=True):
 
     # check connectivity
     for s, t in source.edges():
-        try:
-            if (s in dictionary.keys() and
-                    t in dictionary.keys() and
-                    not (dictionary[s], dictionary[t])
-                    in target.edges()):
-                if not target.is_directed():
-                    if not (dictionary[t], dictionary[s]) in target.edges():
-                        raise InvalidHomomorphism(
-                            "Connectivity is not preserved!"
-                            " Was expecting an edge '%s' and '%s'" %
-                            (dictionary[t], dictionary[s]))
-                else:
-                    raise InvalidHomomorphism(
-                        "Connectivity is not preserved!"
-                        " Was expecting an edge between '%s' and '%s'" %
-                        (dictionary[s], dictionary[t]))
-        except KeyError:
-            pass
+        if (s in dictionary.keys() and
+                t in dictionary.keys() and
+                not target.has_edge(dictionary[s], dictionary[t])):
+            raise InvalidHomomorphism(
+                "Connectivity is not preserved!"
+                " Was expecting an edge between '%s' and '%s'" %
+                (dictionary[s], dictionary[t]))
 
     for s, t in dictionary.items():
             # check sets of attributes of nodes (here homomorphism = set
@@ -133,6 +146,9 @@ def compose_chain(chain):
 
 def get_unique_map_to_pullback(p, p_a, p_b, z_a, z_b):
     """Find a unique map to pullback."""
+    # index the inverses of the maps to z (see `keys_by_value`)
+    z_a = IndexedMapping.of(z_a)
+    z_b = IndexedMapping.of(z_b)
     z_p = dict()
     for value in p:
         z_keys_from_a = set()
@@ -154,6 +170,9 @@ def get_unique_map_to_pullback(p, p_a, p_b, z_a, z_b):
 
 def get_unique_map_from_pushout(p, a_p, b_p, a_z, b_z):
     """Find a unique map to pushout."""
+    # index the inverses of the maps to p (see `keys_by_value`)
+    a_p = IndexedMapping.of(a_p)
+    b_p = IndexedMapping.of(b_p)
     p_z = dict()
     for value in p:
         z_values = set()
@@ -216,15 +235,18 @@ def is_monic(f):
         len(set(f.values()))
 
 
-def nary_pullback(b, cds, total=True):
-    """Find a pullback with multiple conspans."""
+def nary_pullback(b, cds, total=True, check=True):
+    """Find a pullback with multiple conspans.
+
+    If `check` is False, the homomorphisms are not checked.
+    """
     # 1. find individual pullbacks
     pullbacks = []
     for c_name, (c, d, b_d, c_d) in cds.items():
         if total:
-            pb = pullback(b, c, d, b_d, c_d)
+            pb = pullback(b, c, d, b_d, c_d, check=check)
         else:
-            pb = partial_pullback(b, c, d, b_d, c_d)
+            pb = partial_pullback(b, c, d, b_d, c_d, check=check)
         pullbacks.append((
             c_name, pb
         ))
@@ -235,12 +257,13 @@ def nary_pullback(b, cds, total=True):
         a_c = dict([(c_name1, a_c1)])
         for i in range(1, len(pullbacks)):
             c_name2, (a2, a_b2, a_c2) = pullbacks[i]
+            # The pullbacks found above are valid by construction
             if total:
                 a1, a1_old_a1, a1_a2 = pullback(
-                    a1, a2, b, a_b1, a_b2)
+                    a1, a2, b, a_b1, a_b2, check=False)
             else:
                 a1, a1_old_a1, a1_a2 = partial_pullback(
-                    a1, a2, b, a_b1, a_b2)
+                    a1, a2, b, a_b1, a_b2, check=False)
             a_b1 = compose(a1_old_a1, a_b1)
             # update a_c
             for c_name, old_a_c in a_c.items():
@@ -251,23 +274,29 @@ def nary_pullback(b, cds, total=True):
         a_b = a_b1
         a = a1
 
-        check_homomorphism(a, b, a_b, total=False)
-        for c_name, a_c_guy in a_c.items():
-            check_homomorphism(a, cds[c_name][0], a_c_guy, total=False)
+        if check:
+            check_homomorphism(a, b, a_b, total=False)
+            for c_name, a_c_guy in a_c.items():
+                check_homomorphism(a, cds[c_name][0], a_c_guy, total=False)
         return (a, a_b, a_c)
 
 
-def partial_pullback(b, c, d, b_d, c_d):
-    """Find partail pullback."""
-    check_homomorphism(b, d, b_d, total=False)
-    check_homomorphism(c, d, c_d, total=False)
+def partial_pullback(b, c, d, b_d, c_d, check=True):
+    """Find partail pullback.
+
+    If `check` is False, the homomorphisms are not checked.
+    """
+    if check:
+        check_homomorphism(b, d, b_d, total=False)
+        check_homomorphism(c, d, c_d, total=False)
 
     bd_dom = subgraph(b, b_d.keys())
     cd_dom = subgraph(c, c_d.keys())
 
     bd_b = {n: n for n in bd_dom.nodes()}
     cd_c = {n: n for n in cd_dom.nodes()}
-    (tmp, tmp_bddom, tmp_cddom) = pullback(bd_dom, cd_dom, d, b_d, c_d)
+    (tmp, tmp_bddom, tmp_cddom) = pullback(
+        bd_dom, cd_dom, d, b_d, c_d, check=check)
     (b2, tmp_b2, b2_b) = pullback_complement(
         tmp, bd_dom, b, tmp_bddom, bd_b)
     (c2, tmp_c2, c2_c) = pullback_complement(
@@ -278,11 +307,16 @@ def partial_pullback(b, c, d, b_d, c_d):
     return(new, hom1, hom2)
 
 
-def pullback(b, c, d, b_d, c_d, inplace=False):
+def pullback(b, c, d, b_d, c_d, inplace=False, check=True):
     """Find the pullback from b -> d <- c.
 
     Given h1 : B -> D; h2 : C -> D returns A, rh1, rh2
     with rh1 : A -> B; rh2 : A -> C and A the pullback.
+
+    The nodes of A are found by joining the nodes of B and C on their
+    images in D (the nodes of C are hashed by their images), the edges
+    of A are found from the adjacency of the nodes of B. If `check`
+    is False, the input and the output homomorphisms are not checked.
     """
     if inplace is True:
         a = b
@@ -290,53 +324,56 @@ def pullback(b, c, d, b_d, c_d, inplace=False):
         a = type(b)()
 
     # Check homomorphisms
-    check_homomorphism(b, d, b_d)
-    check_homomorphism(c, d, c_d)
+    if check:
+        check_homomorphism(b, d, b_d)
+        check_homomorphism(c, d, c_d)
 
     hom1 = {}
     hom2 = {}
 
-    f = b_d
-    g = c_d
+    c_by_image = dict()
+    for n2 in c.nodes():
+        c_by_image.setdefault(c_d[n2], []).append(n2)
 
+    # Nodes of A projected to every node of B
+    a_by_b = dict()
     for n1 in b.nodes():
-        for n2 in c.nodes():
-            if f[n1] == g[n2]:
-                new_attrs = merge_attributes(b.node[n1],
-                                             c.node[n2],
-                                             'intersection')
-                if n1 not in a.nodes():
-                    add_node(a, n1, new_attrs)
-                    hom1[n1] = n1
-                    hom2[n1] = n2
-                else:
-                    i = 1
+        for n2 in c_by_image.get(b_d[n1], []):
+            new_attrs = merge_attributes(b.node[n1],
+                                         c.node[n2],
+                                         'intersection')
+            if n1 not in a.node:
+                new_name = n1
+            else:
+                i = 1
+                new_name = str(n1) + str(i)
+                while new_name in a.node:
+                    i += 1
                     new_name = str(n1) + str(i)
-                    while new_name in a.nodes():
-                        i += 1
-                        new_name = str(n1) + str(i)
-                    # if n2 not in a.nodes():
-                    add_node(a, new_name, new_attrs)
-                    hom1[new_name] = n1
-                    hom2[new_name] = n2
-
-    for n1 in a.nodes():
-        for n2 in a.nodes():
-            if (hom1[n1], hom1[n2]) in b.edges() or \
-               ((not a.is_directed()) and (hom1[n2], hom1[n1]) in b.edges()):
-                if (hom2[n1], hom2[n2]) in c.edges() or \
-                   ((not a.is_directed) and (hom2[n2], hom2[n1]) in c.edges()):
-                    add_edge(a, n1, n2)
-                    set_edge(
-                        a,
-                        n1,
-                        n2,
+            add_node(a, new_name, new_attrs)
+            hom1[new_name] = n1
+            hom2[new_name] = n2
+            a_by_b.setdefault(n1, []).append(new_name)
+
+    if b.is_directed():
+        b_succ = b.succ
+        c_succ = c.succ
+    else:
+        b_succ = b.adj
+        c_succ = c.adj
+    for n1 in list(hom1.keys()):
+        for b_target in b_succ[hom1[n1]]:
+            for n2 in a_by_b.get(b_target, []):
+                if hom2[n2] in c_succ[hom2[n1]] and not a.has_edge(n1, n2):
+                    add_edge(
+                        a, n1, n2,
                         merge_attributes(
                             get_edge(b, hom1[n1], hom1[n2]),
                             get_edge(c, hom2[n1], hom2[n2]),
                             'intersection'))
-    check_homomorphism(a, b, hom1)
-    check_homomorphism(a, c, hom2)
+    if check:
+        check_homomorphism(a, b, hom1)
+        check_homomorphism(a, c, hom2)
     return (a, hom1, hom2)
 
 
@@ -364,108 +401,113 @@ def partial_pushout(a, b, c, a_b, a_c):
     return(d, b_d, c_d)
 
 
-def pushout(a, b, c, a_b, a_c, inplace=False):
-    """Find the pushour of the span b <- a -> c."""
-    def get_classes_to_merge():
-        pass
+def _find(parent, element):
+    """Find the representative of an element in a union-find forest."""
+    root = element
+    while parent[root] != root:
+        root = parent[root]
+    # Path compression
+    while parent[element] != root:
+        parent[element], element = root, parent[element]
+    return root
 
+
+def _union(parent, element1, element2):
+    """Unite the classes of two elements in a union-find forest."""
+    parent.setdefault(element1, element1)
+    parent.setdefault(element2, element2)
+    root1 = _find(parent, element1)
+    root2 = _find(parent, element2)
+    if root1 != root2:
+        parent[root2] = root1
+
+
+def _merge_classes(graph, parent, nodes):
+    """Merge the nodes of a graph by the classes of a union-find forest.
+
+    `nodes` -- nodes of the graph from the forest (defines the order
+    in which the classes are merged). Every class is merged with a
+    single `merge_nodes` call, returns a dictionary mapping the nodes
+    to the resulting nodes.
+    """
+    classes = dict()
+    for node in nodes:
+        classes.setdefault(_find(parent, node), []).append(node)
+    renaming = dict()
+    for members in classes.values():
+        if len(members) > 1:
+            new_name = merge_nodes(graph, members)
+        else:
+            new_name = members[0]
+        for member in members:
+            renaming[member] = new_name
+    return renaming
+
+
+def pushout(a, b, c, a_b, a_c, inplace=False, overlay=False):
+    """Find the pushour of the span b <- a -> c.
+
+    The mapping `a_c` is inverted once, the nodes of `b` identified by
+    the pushout are found with a union-find structure and every class
+    of identified nodes is merged at once. If `overlay` is True (and
+    `inplace` is False), the result is a copy-on-write overlay of `b`
+    (see `regraph.networkx.overlay`) instead of a deep copy.
+    """
     check_homomorphism(a, b, a_b)
     check_homomorphism(a, c, a_c)
 
     if inplace is True:
         d = b
+    elif overlay is True:
+        d = overlay_graph(b)
     else:
         d = copy.deepcopy(b)
 
     b_d = id_of(b.nodes())
     c_d = dict()
 
-    # Add/merge nodes
-    merged_nodes = dict()
+    c_preimages = dict()
+    for a_n, c_n in a_c.items():
+        c_preimages.setdefault(c_n, []).append(a_n)
+
+    # Merge nodes: the images in b of the preimages of
+    # the same node of c are identified
+    parent = dict()
+    for a_keys in c_preimages.values():
+        for k in a_keys:
+            _union(parent, a_b[a_keys[0]], a_b[k])
+    b_d.update(_merge_classes(
+        d, parent, [n for n in b.nodes() if n in parent]))
+
+    # Add/keep nodes
     for c_n in c.nodes():
-        a_keys = keys_by_value(a_c, c_n)
-        # Add nodes
-        if len(a_keys) == 0:
-            if c_n not in d.nodes():
+        if c_n in c_preimages:
+            c_d[c_n] = b_d[a_b[c_preimages[c_n][0]]]
+        else:
+            if c_n not in d.node:
                 new_name = c_n
             else:
                 new_name = unique_node_id(d, c_n)
             add_node(d, new_name, c.node[c_n])
             c_d[c_n] = new_name
-        # Keep nodes
-        elif len(a_keys) == 1:
-            c_d[a_c[a_keys[0]]] = a_b[a_keys[0]]
-        # Merge nodes
-        else:
-            nodes_to_merge = set()
-            # find the nodes that need to be merged
-            for k in a_keys:
-                nodes_to_merge.add(a_b[k])
-
-            # find if exists already some merged node to
-            # which the new node should be merged
-            groups_to_remove = set()
-            new_groups = set()
-            merge_done = False
-            for k in merged_nodes.keys():
-                if nodes_to_merge.issubset(merged_nodes[k]):
-                    merge_done = True
-                else:
-                    intersect_with_group = nodes_to_merge.intersection(
-                        merged_nodes[k])
-                    if len(intersect_with_group) > 0:
-                        new_nodes_to_merge =\
-                            nodes_to_merge.difference(merged_nodes[k])
-                        if len(new_nodes_to_merge) > 0:
-                            new_nodes_to_merge.add(k)
-                            new_name = merge_nodes(d, new_nodes_to_merge)
-                            merged_nodes[new_name] = merged_nodes[k].union(
-                                nodes_to_merge)
-                            groups_to_remove.add(k)
-                            new_groups.add(new_name)
-
-            if len(groups_to_remove) > 0:
-                new_name = merge_nodes(d, new_groups)
-                merged_nodes[new_name] = set()
-                for g in new_groups:
-                    merge_nodes[new_name] = merge_nodes[new_name].union(
-                        merged_nodes[g])
-                for group in groups_to_remove:
-                    del merged_nodes[group]
-            elif not merge_done:
-                new_name = merge_nodes(d, nodes_to_merge)
-                merged_nodes[new_name] = nodes_to_merge
-            for node in nodes_to_merge:
-                c_d[c_n] = new_name
-                b_d[node] = new_name
 
     # Add edges
     for (n1, n2) in c.edges():
-        if b.is_directed():
-            if (c_d[n1], c_d[n2]) not in d.edges():
-                add_edge(
-                    d, c_d[n1], c_d[n2],
-                    get_edge(c, n1, n2))
-        else:
-            if (c_d[n1], c_d[n2]) not in d.edges() and\
-               (c_d[n2], c_d[n1]) not in d.edges():
-                add_edge(
-                    d, c_d[n1], c_d[n2],
-                    get_edge(c, n1, n2)
-                )
+        if not d.has_edge(c_d[n1], c_d[n2]):
+            add_edge(
+                d, c_d[n1], c_d[n2],
+                get_edge(c, n1, n2))
 
     # Add node attrs
-    for c_n in c.nodes():
-        a_keys = keys_by_value(a_c, c_n)
+    for c_n, a_keys in c_preimages.items():
         # Add attributes to the nodes which stayed invariant
         if len(a_keys) == 1:
             attrs_to_add = dict_sub(
                 c.node[c_n],
                 a.node[a_keys[0]]
             )
-            add_node_attrs(d, c_d[c_n], attrs_to_add)
         # Add attributes to the nodes which were merged
-        elif len(a_keys) > 1:
+        else:
             merged_attrs = {}
             for k in a_keys:
                 merged_attrs = merge_attributes(
@@ -473,37 +515,34 @@ def pushout(a, b, c, a_b, a_c, inplace=False):
                     a.node[k]
                 )
             attrs_to_add = dict_sub(c.node[c_n], merged_attrs)
-            add_node_attrs(d, c_d[c_n], attrs_to_add)
+        add_node_attrs(d, c_d[c_n], attrs_to_add)
 
     # Add edge attrs
     for (n1, n2) in c.edges():
         d_n1 = c_d[n1]
         d_n2 = c_d[n2]
-        if d.is_directed():
-            attrs_to_add = dict_sub(
-                get_edge(c, n1, n2),
-                get_edge(d, d_n1, d_n2)
-            )
-            add_edge_attrs(
-                d, c_d[n1], c_d[n2],
-                attrs_to_add
-            )
-        else:
-            attrs_to_add = dict_sub(
-                get_edge(c, n1, n2),
-                get_edge(d, d_n1, d_n2)
-            )
-            add_edge_attrs(
-                d, c_d[n1], c_d[n2],
-                attrs_to_add
-            )
+        attrs_to_add = dict_sub(
+            get_edge(c, n1, n2),
+            get_edge(d, d_n1, d_n2)
+        )
+        add_edge_attrs(d, d_n1, d_n2, attrs_to_add)
     return (d, b_d, c_d)
 
 
-def pullback_complement(a, b, d, a_b, b_d, inplace=False):
+def pullback_complement(a, b, d, a_b, b_d, inplace=False, overlay=False):
     """Find the final pullback complement from a->b->d.
 
-    Makes changes to d inplace.
+    Makes changes to d inplace. If `overlay` is True (and `inplace`
+    is False), the result is a copy-on-write overlay of `d`
+    (see `regraph.networkx.overlay`) instead of a deep copy.
+
+    Apart from the copy of `d`, the cost of the construction depends
+    only on `a`, `b` and the neighbourhood of the image of `b`:
+    the homomorphism `c_d` is returned as a `DeltaMapping` over the
+    identity on the nodes of `d`, which stores only the removed
+    nodes and the clones. The identity part of `c_d` is a view of
+    the nodes of `d`, unless `inplace` is True: `d` is then modified
+    and the identity is defined on a snapshot of its nodes.
     """
 
     check_homomorphism(a, b, a_b, total=True)
@@ -517,52 +556,49 @@ def pullback_complement(a, b, d, a_b, b_d, inplace=False):
 
     if inplace is True:
         c = d
+        c_d = DeltaMapping(IdentityMapping(set(d.nodes())))
     else:
-        c = copy.deepcopy(d)
+        if overlay is True:
+            c = overlay_graph(d)
+        else:
+            c = copy.deepcopy(d)
+        c_d = DeltaMapping(IdentityMapping(d.node))
 
     a_c = dict()
-    c_d = id_of(c.nodes())
+
+    b_preimages = dict()
+    for a_node, b_node in a_b.items():
+        b_preimages.setdefault(b_node, []).append(a_node)
 
     # Remove/clone nodes
     for b_node in b.nodes():
-        a_keys = keys_by_value(a_b, b_node)
+        a_keys = b_preimages.get(b_node, [])
         # Remove nodes
         if len(a_keys) == 0:
-            remove_node(c, b_d[b_node])
             del c_d[b_d[b_node]]
+            remove_node(c, b_d[b_node])
         # Keep nodes
         elif len(a_keys) == 1:
             a_c[a_keys[0]] = b_d[b_node]
         # Clone nodes
         else:
-            i = 1
-            for k in a_keys:
-                if i == 1:
+            for i, k in enumerate(a_keys):
+                if i == 0:
                     a_c[k] = b_d[b_node]
-                    c_d[b_d[b_node]] = b_d[b_node]
                 else:
                     new_name = clone_node(c, b_d[b_node])
                     a_c[k] = new_name
                     c_d[new_name] = b_d[b_node]
-                i += 1
 
     # Remove edges
     for (b_n1, b_n2) in b.edges():
-        a_keys_1 = keys_by_value(a_b, b_n1)
-        a_keys_2 = keys_by_value(a_b, b_n2)
-        if len(a_keys_1) > 0 and len(a_keys_2) > 0:
-            for k1 in a_keys_1:
-                for k2 in a_keys_2:
-                    if d.is_directed():
-                        if (k1, k2) not in a.edges() and\
-                           (a_c[k1], a_c[k2]) in c.edges():
-                            remove_edge(c, a_c[k1], a_c[k2])
-                    else:
-                        if (k1, k2) not in a.edges() and\
-                           (k2, k1) not in a.edges():
-                            if (a_c[k1], a_c[k2]) in d.edges() or\
-                               (a_c[k2], a_c[k1]) in d.edges():
-                                remove_edge(c, a_c[k1], a_c[k2])
+        a_keys_1 = b_preimages.get(b_n1, [])
+        a_keys_2 = b_preimages.get(b_n2, [])
+        for k1 in a_keys_1:
+            for k2 in a_keys_2:
+                if not a.has_edge(k1, k2) and\
+                   c.has_edge(a_c[k1], a_c[k2]):
+                    remove_edge(c, a_c[k1], a_c[k2])
     # Remove node attrs
     for a_node in a.nodes():
         attrs_to_remove = dict_sub(
@@ -741,28 +777,24 @@ def pushout_from_relation(g1, g2, relation, inplace=False):
     g1_g12 = id_of(g12.nodes())
     g2_g12 = dict()
 
-    for node in g1.nodes():
-        if node in left_dict.keys():
-            for g2_node in left_dict[node]:
-                g2_g12[g2_node] = node
+    # Merge the nodes of g1 related to the same nodes of g2
+    parent = dict()
+    for g1_nodes in right_dict.values():
+        g1_nodes = list(g1_nodes)
+        for g1_node in g1_nodes:
+            _union(parent, g1_nodes[0], g1_node)
+    g1_g12.update(_merge_classes(
+        g12, parent, [n for n in g1.nodes() if n in parent]))
 
     for node in g2.nodes():
         if node not in right_dict.keys():
             node_id = node
-            if node_id in g12.nodes():
+            if node_id in g12.node:
                 node_id = unique_node_id(g12, node)
             add_node(g12, node_id, g2.node[node])
             g2_g12[node] = node_id
-        elif len(right_dict[node]) == 1:
-            node_attrs_diff = dict_sub(
-                g2.node[node],
-                g1.node[list(right_dict[node])[0]])
-            add_node_attrs(
-                g12, list(right_dict[node])[0], node_attrs_diff)
-        elif len(right_dict[node]) > 1:
-            new_name = merge_nodes(g12, right_dict[node])
-            for g1_node in right_dict[node]:
-                g1_g12[g1_node] = new_name
+        else:
+            new_name = g1_g12[next(iter(right_dict[node]))]
             g2_g12[node] = new_name
             node_attrs_diff = dict_sub(
                 g2.node[node],
@@ -770,7 +802,7 @@ def pushout_from_relation(g1, g2, relation, inplace=False):
             add_node_attrs(g12, new_name, node_attrs_diff)
 
     for u, v in g2.edges():
-        if (g2_g12[u], g2_g12[v]) not in g12.edges():
+        if not g12.has_edge(g2_g12[u], g2_g12[v]):
             add_edge(g12, g2_g12[u], g2_g12[v], get_edge(g2, u, v))
         else:
             edge_attrs_diff = dict_sub(
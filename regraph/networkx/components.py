@@ -27,13 +27,15 @@ import copy
 
 from regraph.attribute_sets import AttributeSet
 from regraph.networkx.category_utils import compose
+from regraph.networkx.matching import CompiledPattern
 from regraph.primitives import (equal,
                                 graph_to_json,
                                 graph_from_json)
 from regraph.rules import Rule
-from regraph.utils import (to_set,
+from regraph.utils import (DeltaMapping,
+                           IndexedMapping,
+                           to_set,
                            replace_source,
-                           replace_target,
                            normalize_attrs)
 
 
@@ -169,6 +171,33 @@ class RuleNode(AttributeContainter):
             self.attrs = dict()
         return
 
+    @property
+    def rule(self):
+        """Rule of the node."""
+        return self._rule
+
+    @rule.setter
+    def rule(self, rule):
+        """Set the rule of the node (drops the compiled lhs)."""
+        self._rule = rule
+        self._compiled_lhs = None
+
+    def compiled_lhs(self):
+        """Get the lhs of the rule compiled for matching.
+
+        The compiled pattern is cached and rebuilt only if the
+        rule (or its lhs) is replaced, or if `drop_compiled_lhs`
+        is called after an in-place modification of the lhs.
+        """
+        if self._compiled_lhs is None or\
+           self._compiled_lhs.pattern is not self._rule.lhs:
+            self._compiled_lhs = CompiledPattern(self._rule.lhs)
+        return self._compiled_lhs
+
+    def drop_compiled_lhs(self):
+        """Drop the cached compiled lhs of the rule."""
+        self._compiled_lhs = None
+
     def __eq__(self, other):
         """Equality of rule nodes."""
         return isinstance(other, RuleNode) and self.rule == other.rule
@@ -203,26 +232,50 @@ class RuleNode(AttributeContainter):
 class Typing(AttributeContainter):
     """Data structure incapsulating a homomorphism between graphs.
 
+    The mapping of a typing is a `regraph.utils.IndexedMapping`
+    maintaining the inverse of the typing (the instances of every
+    type are found with `mapping.preimage(type)`). It wraps either a
+    dictionary or a layered mapping (`regraph.utils.DeltaMapping`):
+    a base dictionary shared with the previous versions of the typing
+    and a delta of the nodes changed by rewritings. The delta is folded
+    into a new base when its size exceeds `compaction_ratio` times
+    the size of the base.
+
     Attributes
     ----------
-    mapping : dict
-        Dictionary containing a map from nodes of a source graph
-        to nodes of a target.
+    mapping : regraph.utils.IndexedMapping
+        Mapping from nodes of a source graph to nodes of a target.
     total : bool
         Flag indication if the typing is forced to be total
     attrs : dict
         Dictionary with attrs of the typing
     """
 
+    compaction_ratio = 0.25
+
     def __init__(self, mapping, attrs=None):
         """Initialize homomorphism."""
-        self.mapping = mapping
+        self.mapping = IndexedMapping.of(mapping)
         if attrs:
             self.attrs = attrs
         else:
             self.attrs = dict()
+        self.compact(force=False)
         return
 
+    def compact(self, force=True):
+        """Fold the delta of a layered mapping into its base.
+
+        If `force` is False, the mapping is compacted only if
+        the size of its delta exceeds `compaction_ratio` times
+        the size of its base.
+        """
+        data = self.mapping.data
+        if isinstance(data, DeltaMapping):
+            if force or data.delta_size() >\
+               self.compaction_ratio * len(data.base):
+                data.compact()
+
     def is_total(self):
         """Test typing totality attribute."""
         return self.total
@@ -233,7 +286,8 @@ class Typing(AttributeContainter):
 
     def rename_target(self, old_name, new_name):
         """Rename typing of typing."""
-        replace_target(old_name, new_name, self.mapping)
+        for key in self.mapping.preimage(old_name):
+            self.mapping[key] = new_name
 
     def __rmul__(self, other):
         """Right multiplication operation."""
@@ -261,7 +315,7 @@ class Typing(AttributeContainter):
 
     def to_json(self):
         return {
-            "mapping": self.mapping,
+            "mapping": dict(self.mapping),
             "attrs": self.attrs_to_json()
         }
 
@@ -288,14 +342,17 @@ class RuleTyping(AttributeContainter):
     lhs -> graph and rhs -> graph, such that they commute
     (p -> lhs -> graph and p -> rhs -> graph commute).
 
+    The mappings are `regraph.utils.IndexedMapping` objects
+    maintaining the inverses of the typings (see `Typing`).
+
     Attributes
     ----------
-    lhs_mapping : dict
-        Dictionary containing a map from nodes of the lhs of
-        the rule to nodes of a target graph.
-    rhs_mapping : dict
-        Dictionary containing a map from nodes of the rhs of
-        the rule to nodes of a target graph.
+    lhs_mapping : regraph.utils.IndexedMapping
+        Mapping from nodes of the lhs of the rule to nodes
+        of a target graph.
+    rhs_mapping : regraph.utils.IndexedMapping
+        Mapping from nodes of the rhs of the rule to nodes
+        of a target graph.
     lhs_total : bool
         Flag indication if the typing of the lhs is forced to be total
     rhs_total : bool
@@ -307,8 +364,8 @@ class RuleTyping(AttributeContainter):
     def __init__(self, lhs_mapping, rhs_mapping,
                  lhs_total=False, rhs_total=False, attrs=None):
         """Initialize homomorphism."""
-        self.lhs_mapping = copy.deepcopy(lhs_mapping)
-        self.rhs_mapping = copy.deepcopy(rhs_mapping)
+        self.lhs_mapping = IndexedMapping(dict(lhs_mapping))
+        self.rhs_mapping = IndexedMapping(dict(rhs_mapping))
         self.lhs_total = lhs_total
         self.rhs_total = rhs_total
         if attrs:
@@ -324,8 +381,9 @@ class RuleTyping(AttributeContainter):
 
     def rename_target(self, old_name, new_name):
         """Name the target of the rule typing."""
-        replace_target(old_name, new_name, self.lhs_mapping)
-        replace_target(old_name, new_name, self.rhs_mapping)
+        for mapping in [self.lhs_mapping, self.rhs_mapping]:
+            for key in mapping.preimage(old_name):
+                mapping[key] = new_name
 
     def all_total(self):
         """All the components of the rule are totally typed."""
@@ -345,8 +403,8 @@ class RuleTyping(AttributeContainter):
 
     def to_json(self):
         return {
-            "lhs_mapping": self.lhs_mapping,
-            "rhs_mapping": self.rhs_mapping,
+            "lhs_mapping": dict(self.lhs_mapping),
+            "rhs_mapping": dict(self.rhs_mapping),
             "lhs_total": self.lhs_total,
             "rhs_total": self.rhs_total,
             "attrs": self.attrs_to_json()
@@ -0,0 +1,190 @@
+"""Execution of systems of rewriting rules on hierarchies.
+
+* `RuleSystem` -- applies the rules of a hierarchy to one of its graphs
+  with a strategy, until no rule is applicable or a step limit;
+* `RunReport` -- statistics of a run of a rule system.
+"""
+import random
+import time
+
+from regraph.exceptions import ReGraphError
+from regraph.networkx.incremental import IncrementalMatcher
+
+
+class RunReport(object):
+    """Report of a run of a rule system.
+
+    Attributes
+    ----------
+    steps : int
+        Number of rewritings of the graph performed
+    fixpoint : bool
+        True if the run stopped because no rule was applicable
+    applications : dict
+        Dictionary whose keys are rule ids and whose values are the
+        numbers of instances of the rules rewritten
+    rewritings : dict
+        Dictionary whose keys are rule ids and whose values are the
+        numbers of rewritings performed with the rules (many instances
+        can be rewritten by a single rewriting)
+    time : dict
+        Dictionary whose keys are rule ids and whose values are the
+        times (in seconds) spent to rewrite the instances of the rules
+        (including the propagation and the update of the matchings)
+    matching_time : float
+        Time (in seconds) spent to find the initial instances
+    """
+
+    def __init__(self, rule_ids):
+        """Initialize an empty report."""
+        self.steps = 0
+        self.fixpoint = False
+        self.applications = dict((r, 0) for r in rule_ids)
+        self.rewritings = dict((r, 0) for r in rule_ids)
+        self.time = dict((r, 0.0) for r in rule_ids)
+        self.matching_time = 0.0
+
+    def __str__(self):
+        lines = ["Steps: %d (fixpoint: %s)" % (self.steps, self.fixpoint)]
+        lines.append("Matching time: %.4fs" % self.matching_time)
+        for rule_id in self.applications.keys():
+            lines.append(
+                "%s: %d instances, %d rewritings, %.4fs" %
+                (rule_id, self.applications[rule_id],
+                 self.rewritings[rule_id], self.time[rule_id]))
+        return "\n".join(lines) + "\n"
+
+
+class RuleSystem(object):
+    """System of rules of a hierarchy applied to one of its graphs.
+
+    The rules are applied with one of the following strategies:
+
+    - `"alap"` (as long as possible) -- every step tries the rules in
+      turn, each applicable rule is applied at once to a maximal set of
+      its parallel independent instances;
+    - `"priority"` -- every step applies the first applicable rule (in
+      the order of `rule_ids`) at once to a maximal set of its parallel
+      independent instances;
+    - `"random"` -- every step applies a rule to one instance chosen at
+      random among the instances of all the rules.
+
+    Rewriting many instances at once (see
+    `NetworkXHierarchy.rewrite_many`) type checks the rewriting and
+    propagates it in the hierarchy only once. The instances of the rules
+    are found once and then maintained between the steps with an
+    `IncrementalMatcher`, so only the instances created by a rewriting
+    are searched for.
+
+    The run stops when no rule is applicable (a fixpoint is reached)
+    or after the specified number of steps. Note that a run of rules
+    that remain applicable after their application (e.g. rules adding
+    nodes without removing any) never reaches a fixpoint.
+
+    Attributes
+    ----------
+    hierarchy : regraph.networkx.hierarchy.NetworkXHierarchy
+    graph_id : hashable
+        Id of the rewritten graph
+    rule_ids : list
+        Ids of the rules of the hierarchy (in the order of priority)
+    strategy : str
+        Strategy of the application of the rules
+    """
+
+    strategies = ["alap", "priority", "random"]
+
+    def __init__(self, hierarchy, graph_id, rule_ids, strategy="alap",
+                 seed=None):
+        """Initialize a rule system.
+
+        `seed` is the seed of the random choices of the
+        `"random"` strategy.
+        """
+        if strategy not in self.strategies:
+            raise ReGraphError(
+                "Unknown strategy '%s' (available strategies: %s)!" %
+                (strategy, ", ".join(self.strategies)))
+        self.hierarchy = hierarchy
+        self.graph_id = graph_id
+        self.rule_ids = list(rule_ids)
+        self.strategy = strategy
+        self._random = random.Random(seed)
+
+    def run(self, max_steps=None):
+        """Apply the rules until a fixpoint or a number of steps.
+
+        Parameters
+        ----------
+        max_steps : int, optional
+            Maximum number of rewritings of the graph (by default,
+            the rules are applied until a fixpoint is reached)
+
+        Returns
+        -------
+        report : regraph.networkx.engine.RunReport
+        """
+        report = RunReport(self.rule_ids)
+        start = time.time()
+        matcher = IncrementalMatcher(self.hierarchy, self.graph_id)
+        try:
+            for rule_id in self.rule_ids:
+                matcher.add_rule(rule_id)
+            report.matching_time = time.time() - start
+
+            while max_steps is None or report.steps < max_steps:
+                if self.strategy == "alap":
+                    applied = False
+                    for rule_id in self.rule_ids:
+                        if max_steps is not None and\
+                           report.steps >= max_steps:
+                            break
+                        instances = matcher.instances(rule_id)
+                        if len(instances) > 0:
+                            self._apply(rule_id, instances, report, True)
+                            applied = True
+                elif self.strategy == "priority":
+                    applied = False
+                    for rule_id in self.rule_ids:
+                        instances = matcher.instances(rule_id)
+                        if len(instances) > 0:
+                            self._apply(rule_id, instances, report, True)
+                            applied = True
+                            break
+                else:
+                    choices = [
+                        (rule_id, instance)
+                        for rule_id in self.rule_ids
+                        for instance in matcher.instances(rule_id)
+                    ]
+                    applied = len(choices) > 0
+                    if applied:
+                        rule_id, instance = self._random.choice(choices)
+                        self._apply(rule_id, [instance], report, False)
+                if not applied:
+                    report.fixpoint = True
+                    break
+        finally:
+            matcher.detach()
+        return report
+
+    def _apply(self, rule_id, instances, report, batch):
+        """Rewrite the graph with instances of a rule."""
+        start = time.time()
+        rule = self.hierarchy.node[rule_id].rule
+        if batch:
+            instances = rule.independent_instances(instances)
+        if len(instances) == 1:
+            self.hierarchy.apply_rule(self.graph_id, rule_id, instances[0])
+        else:
+            lhs_typing = dict()
+            rhs_typing = dict()
+            for suc in self.hierarchy.successors(rule_id):
+                lhs_typing[suc] = self.hierarchy.edge[rule_id][suc].lhs_mapping
+                rhs_typing[suc] = self.hierarchy.edge[rule_id][suc].rhs_mapping
+            self.hierarchy.rewrite_many(
+                self.graph_id, rule, instances, lhs_typing, rhs_typing)
+        report.steps += 1
+        report.applications[rule_id] += len(instances)
+        report.rewritings[rule_id] += 1
+        report.time[rule_id] += time.time() - start
@@ -12,6 +12,7 @@ undirected edges or, alternatively, spans).
   additionally constrained to be acyclic and to respect the property of
   commuting paths.
 """
+import contextlib
 import copy
 import itertools
 import json
@@ -19,21 +20,26 @@ import networkx as nx
 import os
 import warnings
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
-from networkx.algorithms import isomorphism
 from networkx.exception import NetworkXNoPath
 
+from regraph.networkx import matching
+from regraph.networkx.indexing import TypingIndex, get_attribute_index
 from regraph.networkx import rewriting_utils
 from regraph.networkx import type_checking
+from regraph.networkx.transactions import HierarchyTransaction
+from regraph.networkx.engine import RuleSystem
 
 from regraph.networkx.category_utils import (compose,
                                              check_homomorphism,
                                              is_total_homomorphism,
                                              relation_to_span,
                                              right_relation_dict)
-from regraph.primitives import (get_relabeled_graph,
-                                relabel_node,
-                                get_edge,
+from regraph.primitives import (relabel_node,
                                 graph_to_json,
                                 graph_from_json,
                                 equal,
@@ -148,6 +154,18 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
         self.rule_typing_cls = rule_typing_cls
         self.relation_cls = relation_cls
 
+        # Cache of reverse indices of (transitive) typings
+        self._typing_indices = dict()
+        # Cache of the transitive typings of the graphs by their
+        # ancestors: graph_id -> {ancestor: typing}
+        self._ancestor_typings = dict()
+        # Incremental matchers attached to the graphs of the hierarchy
+        self._incremental_matchers = []
+        # Undo journal of the transaction in progress (if any)
+        self._journal = None
+        # Typings and relations added during a bulk load, whose
+        # validation is deferred to the end of the load (if any)
+        self._deferred_checks = None
         return
 
     def __str__(self):
@@ -267,15 +285,15 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
                 json_data["typing"].append({
                     "from": s,
                     "to": t,
-                    "mapping": self.edge[s][t].mapping,
+                    "mapping": dict(self.edge[s][t].mapping),
                     "attrs": self.edge[s][t].attrs_to_json()
                 })
             elif isinstance(self.edge[s][t], self.rule_typing_cls):
                 json_data["rule_typing"].append({
                     "from": s,
                     "to": t,
-                    "lhs_mapping": self.edge[s][t].lhs_mapping,
-                    "rhs_mapping": self.edge[s][t].rhs_mapping,
+                    "lhs_mapping": dict(self.edge[s][t].lhs_mapping),
+                    "rhs_mapping": dict(self.edge[s][t].rhs_mapping),
                     "lhs_total": self.edge[s][t].lhs_total,
                     "rhs_total": self.edge[s][t].rhs_total,
                     "attrs": self.edge[s][t].attrs_to_json()
@@ -643,32 +661,34 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
                 type(self.node[target])
             )
 
-        # check no cycles are produced
-        self.add_edge(source, target)
-        if not nx.is_directed_acyclic_graph(self):
-            self.remove_edge(source, target)
-            raise HierarchyError(
-                "Edge '%s->%s' creates a cycle in the hierarchy!" %
-                (source, target)
+        if self._deferred_checks is not None:
+            self._deferred_checks.append(("typing", source, target))
+        else:
+            # check no cycles are produced (the hierarchy is a DAG, so the
+            # edge creates a cycle iff `source` is reachable from `target`)
+            if source == target or nx.has_path(self, target, source):
+                raise HierarchyError(
+                    "Edge '%s->%s' creates a cycle in the hierarchy!" %
+                    (source, target)
+                )
+
+            # check if the homomorphism is valid
+            check_homomorphism(
+                self.node[source].graph,
+                self.node[target].graph,
+                mapping,
+                total=True
             )
-        self.remove_edge(source, target)
-
-        # check if the homomorphism is valid
-        check_homomorphism(
-            self.node[source].graph,
-            self.node[target].graph,
-            mapping,
-            total=True
-        )
 
-        # check if newly created path commutes with existing shortest paths
-        type_checking._check_consistency(self, source, target, mapping)
+            # check if newly created paths commute with existing paths
+            type_checking._check_consistency(self, source, target, mapping)
 
         self.add_edge(source, target)
         if attrs is not None:
             normalize_attrs(attrs)
         self.edge[source][target] = self.graph_typing_cls(mapping, attrs=attrs)
         self.typing[source][target] = self.edge[source][target].mapping
+        self._clear_typing_indices(source)
         return
 
     def add_rule_typing(self, rule_id, graph_id, lhs_mapping,
@@ -730,20 +750,24 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
                 "'{}' is provided!".format(
                     type(self.node[graph_id])))
 
+        deferred = self._deferred_checks is not None
+
         # check if an lhs typing is valid
-        check_homomorphism(
-            self.node[rule_id].rule.lhs,
-            self.node[graph_id].graph,
-            lhs_mapping,
-            total=lhs_total
-        )
+        if not deferred:
+            check_homomorphism(
+                self.node[rule_id].rule.lhs,
+                self.node[graph_id].graph,
+                lhs_mapping,
+                total=lhs_total
+            )
 
         new_rhs_mapping = rhs_mapping
         if new_rhs_mapping is None:
             new_rhs_mapping = dict()
         rule = self.node[rule_id].rule
+        plan = rule.plan()
         for node in rule.rhs.nodes():
-            p_keys = keys_by_value(rule.p_rhs, node)
+            p_keys = plan.rhs_preimages[node]
             if len(p_keys) == 1:
                 l = rule.p_lhs[p_keys[0]]
                 if l in lhs_mapping.keys():
@@ -763,17 +787,20 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
                 elif len(type_set) == 1:
                     new_rhs_mapping[node] = list(type_set)[0]
 
-        # check if an rhs typing is valid
-        check_homomorphism(
-            self.node[rule_id].rule.rhs,
-            self.node[graph_id].graph,
-            new_rhs_mapping,
-            total=rhs_total
-        )
+        if deferred:
+            self._deferred_checks.append(("rule_typing", rule_id, graph_id))
+        else:
+            # check if an rhs typing is valid
+            check_homomorphism(
+                self.node[rule_id].rule.rhs,
+                self.node[graph_id].graph,
+                new_rhs_mapping,
+                total=rhs_total
+            )
 
-        # check if newly created path commutes with existing shortest paths
-        type_checking._check_rule_typing(
-            self, rule_id, graph_id, lhs_mapping, new_rhs_mapping)
+            # check if newly created path commutes with existing paths
+            type_checking._check_rule_typing(
+                self, rule_id, graph_id, lhs_mapping, new_rhs_mapping)
 
         self.add_edge(rule_id, graph_id)
         if attrs is not None:
@@ -884,20 +911,10 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
         relation = new_relation_dict
 
         # check relation is well-defined on left and right side
-        for key, values in relation.items():
-            if key not in self.node[left].graph.nodes():
-                raise HierarchyError(
-                    "Relation is not valid: node '%s' does not "
-                    "exist in a graph '%s'" %
-                    (key, left)
-                )
-            for v in values:
-                if v not in self.node[right].graph.nodes():
-                    raise HierarchyError(
-                        "Relation is not valid: node '%s' does not "
-                        "exist in a graph '%s'" %
-                        (v, right)
-                    )
+        if self._deferred_checks is not None:
+            self._deferred_checks.append(("relation", left, right))
+        else:
+            type_checking._check_relation(self, left, right, relation)
 
         if attrs is not None:
             normalize_attrs(attrs)
@@ -1050,6 +1067,7 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
         for k, v in self.rule_rhs_typing.items():
             if node_id in v.keys():
                 del self.rule_rhs_typing[k][node_id]
+        self._clear_typing_indices()
         return
 
     def remove_edge(self, u, v):
@@ -1067,6 +1085,7 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
         if v in self.rule_rhs_typing.keys():
             if u in self.rule_rhs_typing.keys():
                 del self.rule_rhs_typing[v][u]
+        self._clear_typing_indices(u)
         return
 
     def remove_relation(self, g1, g2):
@@ -1361,6 +1380,7 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
             self.edge[graph_id][typing_graph].mapping.update({
                 node_id: type_id
             })
+        self._clear_typing_indices(graph_id)
         return
 
     # def remove_node_type(self, graph_id, typing_graph, node_id):
@@ -1415,7 +1435,9 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
     # typing_graphs)
 
     def find_matching(self, graph_id, pattern,
-                      pattern_typing=None, nodes=None):
+                      pattern_typing=None, nodes=None, workers=None,
+                      distinct_embeddings=False, timeout=None,
+                      max_steps=None):
         """Find an instance of a pattern in a specified graph.
 
         `graph_id` -- id of a graph in the hierarchy to search for matches;
@@ -1424,15 +1446,93 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
         keys of the dictionary -- graph id that types a pattern, this graph
         should be among parents of the `graph_id` graph; values are mappings
         of nodes from pattern to the typing graph;
+        `workers` -- number of worker processes performing the search
+        in parallel (see `regraph.networkx.matching.find_matchings`);
+        `distinct_embeddings` -- if True, only one instance is found among
+        the instances that differ by an automorphism of the (typed)
+        pattern;
+        `timeout`, `max_steps` -- maximum time (in seconds) and maximum
+        number of steps of the search, when the search exceeds them,
+        it is stopped and the instances found so far are returned.
+
+        Returns a `regraph.networkx.matching.MatchingResult` object (a
+        list of instances), whose attribute `truncated` indicates that
+        the search was stopped and whose attribute `steps` contains the
+        number of steps spent by the search.
+        """
+        budget = matching.MatchingBudget(timeout, max_steps)
+        pattern = matching.compile_pattern(pattern)
+        candidates = self._matching_candidates(
+            graph_id, pattern, pattern_typing, nodes)
+        symmetry = None
+        if distinct_embeddings:
+            symmetry = self._symmetry_breaking(pattern, pattern_typing)
+        return matching.find_matchings(
+            self.node[graph_id].graph, pattern, candidates,
+            is_subdict, workers, symmetry, budget)
+
+    def find_first_matching(self, graph_id, pattern,
+                            pattern_typing=None, nodes=None):
+        """Find the first instance of a pattern in a specified graph.
+
+        Takes the same arguments as `find_matching`, returns
+        None if the pattern has no instances in the graph.
         """
+        return next(self.iter_matching(
+            graph_id, pattern, pattern_typing, nodes, limit=1), None)
+
+    def iter_matching(self, graph_id, pattern,
+                      pattern_typing=None, nodes=None, limit=None,
+                      distinct_embeddings=False, budget=None):
+        """Iterate over instances of a pattern in a specified graph.
+
+        Takes the same arguments as `find_matching` (the pattern can
+        also be given by a `regraph.networkx.matching.CompiledPattern`
+        object), in addition `limit` -- the maximum number of instances
+        to produce, `budget` -- `regraph.networkx.matching.MatchingBudget`
+        object limiting the search.
+        The instances are produced lazily, the search stops
+        as soon as the iterator is not consumed any more.
+        """
+        pattern = matching.compile_pattern(pattern)
+        candidates = self._matching_candidates(
+            graph_id, pattern, pattern_typing, nodes)
+        symmetry = None
+        if distinct_embeddings:
+            symmetry = self._symmetry_breaking(pattern, pattern_typing)
+        return itertools.islice(
+            matching.iter_matchings(
+                self.node[graph_id].graph, pattern, candidates, is_subdict,
+                symmetry, budget),
+            limit)
+
+    def _symmetry_breaking(self, pattern, pattern_typing=None):
+        """Get symmetry breaking constraints of a (typed) compiled pattern."""
+        node_classes = None
+        if pattern_typing:
+            typing_graphs = sorted(pattern_typing.keys(), key=str)
+            typings = []
+            for typing_graph in typing_graphs:
+                typing = pattern_typing[typing_graph]
+                if not isinstance(typing, Mapping):
+                    typing = typing[0]
+                typings.append(typing)
+            node_classes = dict(
+                (n, tuple(typing.get(n) for typing in typings))
+                for n in pattern.nodes)
+        return pattern.symmetry_breaking(node_classes)
+
+    def _matching_candidates(self, graph_id, pattern,
+                             pattern_typing=None, nodes=None):
+        """Find candidate images of the nodes of a compiled pattern."""
         if type(self.node[graph_id]) == RuleNode:
             raise ReGraphError(
                 "Pattern matching in a rule is not implemented!")
         # Check that 'typing_graph' and 'pattern_typing' are correctly
         # specified
 
-        ancestors = self.get_ancestors(graph_id)
         if pattern_typing is not None:
+            ancestors = self.get_ancestors(graph_id)
             for typing_graph, _ in pattern_typing.items():
                 if typing_graph not in ancestors.keys():
                     raise HierarchyError(
@@ -1442,7 +1542,7 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
                     )
             new_pattern_typing = dict()
             for key, value in pattern_typing.items():
-                if type(value) == dict:
+                if isinstance(value, Mapping):
                     new_pattern_typing[key] = (value, False)
                 else:
                     try:
@@ -1456,7 +1556,7 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
             for typing_graph, (mapping, _) in new_pattern_typing.items():
                 try:
                     check_homomorphism(
-                        pattern,
+                        pattern.pattern,
                         self.node[typing_graph].graph,
                         mapping,
                         total=False
@@ -1468,126 +1568,59 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
                     )
             pattern_typing = new_pattern_typing
 
-        if nodes is not None:
-            g = self.node[graph_id].graph.subgraph(nodes)
-        else:
-            g = self.node[graph_id].graph
-        labels_mapping = dict(
-            [(n, i + 1) for i, n in
-             enumerate(g.nodes())]
-        )
-        g = get_relabeled_graph(g, labels_mapping)
-
-        inverse_mapping = dict(
-            [(value, key) for key, value in labels_mapping.items()]
-        )
+        g = self.node[graph_id].graph
+        seeds = None
         if pattern_typing:
             try:
-                g_typing = dict([
-                    (typing_graph, dict([
-                        (labels_mapping[k], v) for k, v in
-                        self.compose_path_typing(
-                            nx.shortest_path(self, graph_id, typing_graph)
-                        ).items() if nodes is None or k in nodes
-                    ])) for typing_graph in pattern_typing.keys()
+                typing_indices = dict([
+                    (typing_graph, self.get_typing_index(
+                        graph_id, typing_graph))
+                    for typing_graph in pattern_typing.keys()
                 ])
             except NetworkXNoPath:
                 raise ReGraphError(
                     "One of the specified pattern typing graphs "
                     "is not in the set of ancestors of '%s'" % graph_id
                 )
-
-        matching_nodes = set()
-
-        # Find all the nodes matching the nodes in a pattern
-        for pattern_node in pattern.nodes():
-            for node in g.nodes():
-                if pattern_typing:
-                    # check types match
-                    match = False
-                    for typing_graph, (typing, _) in pattern_typing.items():
-                        if node in g_typing[typing_graph].keys() and\
-                           pattern_node in typing.keys():
-                            if g_typing[typing_graph][node] == typing[
-                                    pattern_node]:
-                                if is_subdict(pattern.node[pattern_node],
-                                              g.node[node]):
-                                    match = True
-                            else:
-                                # there is no mapping of this node in the
-                                # typing by `typing_graph`
-                                pass
-                        else:
-                            if is_subdict(pattern.node[pattern_node],
-                                          g.node[node]):
-                                match = True
-                    if match:
-                        matching_nodes.add(node)
-                else:
-                    if is_subdict(pattern.node[pattern_node], g.node[node]):
-                        matching_nodes.add(node)
-        reduced_graph = g.subgraph(matching_nodes)
-        instances = []
-        isomorphic_subgraphs = []
-        for sub_nodes in itertools.combinations(reduced_graph.nodes(),
-                                                len(pattern.nodes())):
-            subg = reduced_graph.subgraph(sub_nodes)
-            for edgeset in itertools.combinations(subg.edges(),
-                                                  len(pattern.edges())):
-                if g.is_directed():
-                    edge_induced_graph = nx.DiGraph(list(edgeset))
-                    edge_induced_graph.add_nodes_from(
-                        [n for n in subg.nodes()
-                         if n not in edge_induced_graph.nodes()])
-                    matching_obj = isomorphism.DiGraphMatcher(
-                        pattern, edge_induced_graph)
-                    for isom in matching_obj.isomorphisms_iter():
-                        isomorphic_subgraphs.append((subg, isom))
-                else:
-                    edge_induced_graph = nx.Graph(edgeset)
-                    edge_induced_graph.add_nodes_from(
-                        [n for n in subg.nodes()
-                         if n not in edge_induced_graph.nodes()])
-                    matching_obj = isomorphism.GraphMatcher(
-                        pattern, edge_induced_graph)
-                    for isom in matching_obj.isomorphisms_iter():
-                        isomorphic_subgraphs.append((subg, isom))
-
-        for subgraph, mapping in isomorphic_subgraphs:
-            # Check node matches
-            # exclude subgraphs which nodes information does not
-            # correspond to pattern
-            for (pattern_node, node) in mapping.items():
-                if pattern_typing:
-                    for typing_graph, (typing, _) in pattern_typing.items():
-                        if node in g_typing[typing_graph].keys() and\
-                           pattern_node in typing.keys():
-                            if g_typing[typing_graph][node] != typing[
-                                    pattern_node]:
-                                break
-                        if not is_subdict(pattern.node[pattern_node],
-                                          subgraph.node[node]):
-                            break
-                    else:
+            g_typing = dict([
+                (typing_graph, index.typing)
+                for typing_graph, index in typing_indices.items()
+            ])
+
+            # Seed candidates of typed pattern nodes with the instances
+            # of their types (untyped nodes of the graph match any type)
+            seeds = dict()
+            untyped = dict()
+            for pattern_node in pattern.nodes:
+                for typing_graph, (typing, _) in pattern_typing.items():
+                    if pattern_node not in typing.keys():
                         continue
-                    break
-            else:
-                # check edge attribute matched
-                for edge in pattern.edges():
-                    pattern_attrs = get_edge(pattern, edge[0], edge[1])
-                    target_attrs = get_edge(
-                        subgraph, mapping[edge[0]], mapping[edge[1]])
-                    if not is_subdict(pattern_attrs, target_attrs):
-                        break
-                else:
-                    instances.append(mapping)
-
-        # Bring back the original labeling
-        for instance in instances:
-            for key, value in instance.items():
-                instance[key] = inverse_mapping[value]
-
-        return instances
+                    index = typing_indices[typing_graph]
+                    if typing_graph not in untyped:
+                        untyped[typing_graph] = index.untyped_nodes()
+                    instances = index.instances_of(typing[pattern_node])
+                    if len(untyped[typing_graph]) > 0:
+                        instances = instances.union(untyped[typing_graph])
+                    if pattern_node in seeds:
+                        seeds[pattern_node] = seeds[pattern_node].intersection(
+                            instances)
+                    else:
+                        seeds[pattern_node] = instances
+
+        def _node_match(pattern_node, node):
+            # Check types match
+            if pattern_typing:
+                for typing_graph, (typing, _) in pattern_typing.items():
+                    if node in g_typing[typing_graph].keys() and\
+                       pattern_node in typing.keys():
+                        if g_typing[typing_graph][node] != typing[
+                                pattern_node]:
+                            return False
+            return is_subdict(pattern.node_attrs[pattern_node], g.node[node])
+
+        return matching.find_candidates(
+            g, pattern, _node_match, nodes,
+            index=get_attribute_index(g), seeds=seeds)
 
     def find_rule_matching(self, graph_id, rule_id):
         """Find matching of a rule `rule_id` form the hierarchy."""
@@ -1598,8 +1631,6 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
         if type(self.node[rule_id]) != RuleNode:
             raise HierarchyError("Invalid rule `%s` to match!" % rule_id)
 
-        rule = self.node[rule_id].rule
-
         lhs_typing = {}
         rhs_typing = {}
 
@@ -1611,7 +1642,7 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
 
         instances = self.find_matching(
             graph_id,
-            rule.lhs,
+            self.node[rule_id].compiled_lhs(),
             lhs_typing
         )
         return instances
@@ -1629,9 +1660,83 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
                             suc1.intersection(suc2)
         return common_sucs
 
+    def transaction(self):
+        """Start a transaction on the hierarchy.
+
+        The rewritings performed in the scope of a transaction can be
+        rolled back at a cost proportional to the size of the
+        modifications, which makes it a cheap alternative to
+        `rewrite` with `inplace=False` (copying the whole hierarchy)
+        for speculative rewritings. See
+        `regraph.networkx.transactions.HierarchyTransaction`.
+
+        Returns
+        -------
+        transaction : regraph.networkx.transactions.HierarchyTransaction
+        """
+        return HierarchyTransaction(self)
+
+    @contextlib.contextmanager
+    def bulk_load(self):
+        """Add many graphs, typings and relations with deferred checks.
+
+        In the scope of a bulk load, `add_typing`, `add_rule_typing`
+        and `add_relation` do not validate the typings and the
+        relations. They are validated in one pass at the exit of the
+        block: the homomorphisms and the relations are checked, then
+        the commutativity of the typings is checked by composing the
+        typings in the topological order of the hierarchy, every
+        composed typing is computed once (and kept in the cache of
+        `get_ancestors`). If the validation fails, a `HierarchyError`
+        (or an `InvalidHomomorphism`) is raised and the hierarchy
+        should be discarded.
+
+        >>> with hierarchy.bulk_load():
+        ...     hierarchy.add_graph("g", g)
+        ...     hierarchy.add_graph("t", t)
+        ...     hierarchy.add_typing("g", "t", g_t)
+        """
+        if self._deferred_checks is not None:
+            raise HierarchyError(
+                "A bulk load is already in progress on the hierarchy!")
+        self._deferred_checks = []
+        try:
+            yield self
+            checks = self._deferred_checks
+        finally:
+            self._deferred_checks = None
+        type_checking._check_deferred(self, checks)
+
+    def _record(self, mapping, key):
+        """Record the value of `mapping[key]` in the undo journal."""
+        if self._journal is not None:
+            existed = key in mapping
+            self._journal.append(
+                (mapping, key, existed, mapping[key] if existed else None))
+
+    def _set_graph(self, graph_id, graph):
+        """Replace the graph object of a node of the hierarchy."""
+        self._record(vars(self.node[graph_id]), "graph")
+        self._record(self.graph, graph_id)
+        self.node[graph_id].graph = graph
+        self.graph[graph_id] = graph
+        # the cached typing indices are attached to the replaced graph
+        self._clear_typing_indices(graph_id)
+
     def rewrite(self, graph_id, rule, instance=None,
-                lhs_typing=None, rhs_typing=None, strict=False, inplace=True):
-        """Rewrite and propagate the changes up & down."""
+                lhs_typing=None, rhs_typing=None, strict=False, inplace=True,
+                workers=None):
+        """Rewrite and propagate the changes up & down.
+
+        If `inplace` is False, the result of the rewriting is a new
+        hierarchy (a copy of the hierarchy is made), see also
+        `transaction`. If `workers` is specified, the changes are
+        propagated to the graphs of the hierarchy by a pool of worker
+        processes (see `rewriting_utils._run_propagation`), the graphs
+        subject to propagation are then replaced by new graph objects
+        (propagation in worker processes is not used in the scope of
+        a transaction).
+        """
         # start = time.time()
         if type(self.node[graph_id]) == RuleNode:
             raise ReGraphError("Rewriting of a rule is not implemented!")
@@ -1705,9 +1810,14 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
 
         # start = time.time()
         # 4. Propagate rewriting up the hierarchy
+        if self._journal is not None:
+            # the graphs of a transaction are overlays of the original
+            # graph objects, they are propagated in this process
+            workers = None
         new_upstream_changes =\
             rewriting_utils._propagate_up(
-                self, graph_id, rule, instance, p_g_m, g_m_g_prime, inplace)
+                self, graph_id, rule, instance, p_g_m, g_m_g_prime, inplace,
+                workers)
 
         upstream_changes["graphs"].update(new_upstream_changes["graphs"])
         upstream_changes["homomorphisms"].update(
@@ -1726,7 +1836,7 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
         downstream_changes =\
             rewriting_utils._propagate_down(
                 self, graph_id, graph_construct,
-                rule, instance, new_rhs_typing, inplace)
+                rule, instance, new_rhs_typing, inplace, workers)
         # end = time.time() - start
         # print("\t\t\t\tTime to propagate down: ", end)
 
@@ -1737,16 +1847,100 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
                 self, upstream_changes, downstream_changes)
             # end = time.time() - start
             # print("\t\t\t\tTime to apply changes: ", end)
-
+            self._update_matchers(
+                graph_id, instance, base_changes["graph"],
+                upstream_changes, downstream_changes)
             return (self, r_g_prime)
         else:
             # start = time.time()
             # First, create a new hierarchy
-            new_graph = copy.deepcopy(self)
+            memo = dict()
+            new_graph = copy.deepcopy(self, memo)
+            new_graph._journal = None
+            # The updated typings are layered over the typings of `self`,
+            # they are copied with the same memo to be layered over the
+            # typings of the new hierarchy
+            upstream_changes["homomorphisms"] = copy.deepcopy(
+                upstream_changes["homomorphisms"], memo)
+            downstream_changes["homomorphisms"] = copy.deepcopy(
+                downstream_changes["homomorphisms"], memo)
             rewriting_utils._apply_changes(
                 new_graph, upstream_changes, downstream_changes)
+            new_graph._update_matchers(
+                graph_id, instance, base_changes["graph"],
+                upstream_changes, downstream_changes)
             return (new_graph, r_g_prime)
 
+    def _update_matchers(self, graph_id, instance, graph_construct,
+                         upstream_changes, downstream_changes):
+        """Update the incremental matchers after a rewriting."""
+        if len(self._incremental_matchers) == 0:
+            return
+        changed_graphs = set(upstream_changes["graphs"].keys())
+        if "graphs" in downstream_changes.keys():
+            changed_graphs.update(downstream_changes["graphs"].keys())
+        changed_rules = set(upstream_changes["rules"].keys())
+        for (rule_id, _) in upstream_changes["rule_homomorphisms"].keys():
+            changed_rules.add(rule_id)
+        for matcher in self._incremental_matchers:
+            matcher.update(
+                graph_id, instance, graph_construct,
+                changed_graphs, changed_rules)
+
+    def rewrite_many(self, graph_id, rule, instances,
+                     lhs_typing=None, rhs_typing=None, strict=False,
+                     inplace=True, workers=None):
+        """Rewrite many instances of a rule and propagate the changes.
+
+        The instances have to be parallel independent (see
+        `regraph.rules.Rule.apply_to_all`), they are rewritten at once
+        with the parallel composition of the rule, so the type checking
+        and the propagation of the changes are performed only once.
+        `lhs_typing` and `rhs_typing` are the typings of the rule
+        (shared by all the instances), the other parameters are the
+        same as in `rewrite`.
+
+        Returns
+        -------
+        hierarchy : regraph.networkx.hierarchy.NetworkXHierarchy
+            Rewritten hierarchy (`self` if `inplace` is True)
+        rhs_g_primes : list of dict
+            Matchings of the right-hand side of the rule in the
+            rewritten graph (one per instance)
+        """
+        if type(self.node[graph_id]) == RuleNode:
+            raise ReGraphError("Rewriting of a rule is not implemented!")
+        if len(instances) == 0:
+            if inplace:
+                return (self, [])
+            return (copy.deepcopy(self), [])
+
+        parallel_rule, instance, rhs_mappings =\
+            rule.parallel_composition(instances, self.node[graph_id].graph)
+
+        new_lhs_typing = None
+        if lhs_typing is not None:
+            new_lhs_typing = dict()
+            for typing_graph, typing in lhs_typing.items():
+                new_lhs_typing[typing_graph] = dict(
+                    (i[n], t) for i in instances
+                    for n, t in typing.items())
+        new_rhs_typing = None
+        if rhs_typing is not None:
+            new_rhs_typing = dict()
+            for typing_graph, typing in rhs_typing.items():
+                new_rhs_typing[typing_graph] = dict(
+                    (m[n], t) for m in rhs_mappings
+                    for n, t in typing.items())
+
+        hierarchy, r_g_prime = self.rewrite(
+            graph_id, parallel_rule, instance, new_lhs_typing,
+            new_rhs_typing, strict, inplace, workers)
+        return (hierarchy, [
+            dict((r, r_g_prime[n]) for r, n in mapping.items())
+            for mapping in rhs_mappings
+        ])
+
     def apply_rule(self, graph_id, rule_id, instance,
                    strong_typing=True, inplace=True):
         """Apply rule from the hierarchy."""
@@ -1777,6 +1971,25 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
             rhs_typing,
             inplace=inplace)
 
+    def run_rules(self, graph_id, rule_ids, strategy="alap",
+                  max_steps=None, seed=None):
+        """Apply rules from the hierarchy until a fixpoint.
+
+        The rules are applied to the graph `graph_id` with the
+        specified strategy (`"alap"`, `"priority"` or `"random"`)
+        until none of them is applicable or until `max_steps`
+        rewritings were performed, see
+        `regraph.networkx.engine.RuleSystem`.
+
+        Returns
+        -------
+        report : regraph.networkx.engine.RunReport
+        """
+        if type(self.node[graph_id]) == RuleNode:
+            raise ReGraphError("Rewriting of a rule is not implemented!")
+        system = RuleSystem(self, graph_id, rule_ids, strategy, seed)
+        return system.run(max_steps)
+
     def to_json(self):
         """Return json representation of the hierarchy."""
         json_data = {
@@ -1828,71 +2041,73 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
         """Create hierarchy obj from json repr."""
         hierarchy = cls()
 
-        # add graphs
-        for graph_data in json_data["graphs"]:
-            if ignore is not None and\
-               "graphs" in ignore.keys() and\
-               graph_data["id"] in ignore["graphs"]:
-                pass
-            else:
-                graph, attrs = hierarchy.graph_node_cls.process_json(
-                    graph_data, directed)
-                hierarchy.add_graph(graph_data["id"], graph, attrs=attrs)
-
-        # add rules
-        for rule_data in json_data["rules"]:
-            if ignore is not None and\
-               "rules" in ignore.keys() and\
-               rule_data["id"] in ignore["rules"]:
-                pass
-            else:
-                rule, attrs = hierarchy.rule_node_cls.process_json(
-                    rule_data, directed)
-                hierarchy.add_rule(rule_data["id"], rule, attrs=attrs)
-
-        # add typing
-        for typing_data in json_data["typing"]:
-            if ignore is not None and\
-               "typing" in ignore.keys() and\
-               (typing_data["from"], typing_data["to"]) in ignore["typing"]:
-                pass
-            else:
-                mapping, attrs =\
-                    hierarchy.graph_typing_cls.process_json(typing_data)
-                hierarchy.add_typing(
-                    typing_data["from"],
-                    typing_data["to"],
-                    mapping, attrs)
-
-        # add rule typing
-        for rule_typing_data in json_data["rule_typing"]:
-            if ignore is not None and\
-               "rule_typing" in ignore.keys() and\
-               (rule_typing_data["from"], rule_typing_data["to"]) in ignore[
-                    "rule_typing"]:
-                pass
-            else:
-                lhs_map, rhs_map, lhs_total, rhs_total, attrs =\
-                    hierarchy.rule_typing_cls.process_json(rule_typing_data)
-                hierarchy.add_rule_typing(
-                    rule_typing_data["from"],
-                    rule_typing_data["to"],
-                    lhs_map, rhs_map, lhs_total, rhs_total, attrs)
-
-        # add relations
-        for relation_data in json_data["relations"]:
-            if ignore is not None and\
-               "relations" in ignore.keys() and\
-               ((relation_data["from"], relation_data["to"]) in ignore[
-                    "relations"] or (relation_data["to"],
-                                     relation_data["from"]) in ignore["relations"]):
-                pass
-            else:
-                rel, attrs = hierarchy.relation_cls.process_json(relation_data)
-                hierarchy.add_relation(
-                    relation_data["from"],
-                    relation_data["to"],
-                    rel, attrs)
+        # typings and relations are validated at the end of the load
+        with hierarchy.bulk_load():
+            # add graphs
+            for graph_data in json_data["graphs"]:
+                if ignore is not None and\
+                   "graphs" in ignore.keys() and\
+                   graph_data["id"] in ignore["graphs"]:
+                    pass
+                else:
+                    graph, attrs = hierarchy.graph_node_cls.process_json(
+                        graph_data, directed)
+                    hierarchy.add_graph(graph_data["id"], graph, attrs=attrs)
+
+            # add rules
+            for rule_data in json_data["rules"]:
+                if ignore is not None and\
+                   "rules" in ignore.keys() and\
+                   rule_data["id"] in ignore["rules"]:
+                    pass
+                else:
+                    rule, attrs = hierarchy.rule_node_cls.process_json(
+                        rule_data, directed)
+                    hierarchy.add_rule(rule_data["id"], rule, attrs=attrs)
+
+            # add typing
+            for typing_data in json_data["typing"]:
+                if ignore is not None and\
+                   "typing" in ignore.keys() and\
+                   (typing_data["from"], typing_data["to"]) in ignore["typing"]:
+                    pass
+                else:
+                    mapping, attrs =\
+                        hierarchy.graph_typing_cls.process_json(typing_data)
+                    hierarchy.add_typing(
+                        typing_data["from"],
+                        typing_data["to"],
+                        mapping, attrs)
+
+            # add rule typing
+            for rule_typing_data in json_data["rule_typing"]:
+                if ignore is not None and\
+                   "rule_typing" in ignore.keys() and\
+                   (rule_typing_data["from"], rule_typing_data["to"]) in ignore[
+                        "rule_typing"]:
+                    pass
+                else:
+                    lhs_map, rhs_map, lhs_total, rhs_total, attrs =\
+                        hierarchy.rule_typing_cls.process_json(rule_typing_data)
+                    hierarchy.add_rule_typing(
+                        rule_typing_data["from"],
+                        rule_typing_data["to"],
+                        lhs_map, rhs_map, lhs_total, rhs_total, attrs)
+
+            # add relations
+            for relation_data in json_data["relations"]:
+                if ignore is not None and\
+                   "relations" in ignore.keys() and\
+                   ((relation_data["from"], relation_data["to"]) in ignore[
+                        "relations"] or (relation_data["to"],
+                                         relation_data["from"]) in ignore["relations"]):
+                    pass
+                else:
+                    rel, attrs = hierarchy.relation_cls.process_json(relation_data)
+                    hierarchy.add_relation(
+                        relation_data["from"],
+                        relation_data["to"],
+                        rel, attrs)
 
         if "attrs" in json_data.keys():
             hierarchy.attrs = json_dict_to_attrs(json_data["attrs"])
@@ -1920,7 +2135,18 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
             json.dump(j_data, f)
 
     def get_ancestors(self, graph_id, maybe=None):
-        """Return ancestors of a graph as well as the typing morphisms."""
+        """Return ancestors of a graph as well as the typing morphisms.
+
+        The typings by the ancestors are composed once (the typings
+        of the ancestors of every successor are reused, so every path
+        of the hierarchy is not traversed) and cached until the typings
+        of the hierarchy are modified. The returned dictionaries are
+        shared with the cache and should not be modified. If `maybe`
+        is specified, only the paths through the graphs from `maybe`
+        are considered and the result is not cached.
+        """
+        if maybe is None and graph_id in self._ancestor_typings.keys():
+            return self._ancestor_typings[graph_id]
         ancestors = {}
         for _, typing in self.out_edges(graph_id):
             if maybe is not None and typing not in maybe:
@@ -1930,12 +2156,14 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
             if typing in ancestors.keys():
                 ancestors[typing].update(mapping)
             else:
-                ancestors[typing] = mapping
+                ancestors[typing] = dict(mapping)
             for anc, typ in typing_ancestors.items():
                 if anc in ancestors.keys():
                     ancestors[anc].update(compose(mapping, typ))
                 else:
-                    ancestors[anc] = compose(mapping, typ)
+                    ancestors[anc] = dict(compose(mapping, typ))
+        if maybe is None:
+            self._ancestor_typings[graph_id] = ancestors
         return ancestors
 
     def to_nx_graph(self):
@@ -1984,6 +2212,7 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
             self.edge[source][graph_id].rename_target(node, new_name)
         for (_, target) in self.out_edges(graph_id):
             self.edge[graph_id][target].rename_source(node, new_name)
+        self._clear_typing_indices(graph_id)
 
     def descendents(self, graph_id):
         """Get descentants (TODO: reverse names)."""
@@ -2000,12 +2229,65 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
             path = nx.shortest_path(self, source, target)
             return self.compose_path_typing(path)
 
+    def get_typing_index(self, graph_id, typing_graph):
+        """Get the reverse index of the typing of a graph by an ancestor.
+
+        `graph_id` -- id of a graph in the hierarchy;
+        `typing_graph` -- id of a graph typing `graph_id` (directly
+        or transitively).
+
+        Returns a `regraph.networkx.indexing.TypingIndex` object
+        mapping the nodes of `typing_graph` to the sets of their
+        instances in `graph_id`. The index is computed once and cached
+        until the typings of the hierarchy are modified, it is attached
+        to the graph, so that the nodes added or removed by the
+        primitives are (un)indexed.
+        """
+        key = (graph_id, typing_graph)
+        if key not in self._typing_indices.keys():
+            graph = self.node[graph_id].graph
+            index = TypingIndex(
+                self.compose_path_typing(
+                    nx.shortest_path(self, graph_id, typing_graph)),
+                graph)
+            index.attach(graph)
+            self._typing_indices[key] = index
+        return self._typing_indices[key]
+
+    def _clear_typing_indices(self, *changed):
+        """Drop the cached typing indices and ancestor typings.
+
+        Called every time the typings of the hierarchy are modified.
+        If the graphs whose nodes or outgoing typings were modified
+        are `changed`, only the caches of these graphs and of the graphs
+        (transitively) typed by them are dropped, all the caches are
+        dropped otherwise.
+        """
+        if len(changed) == 0:
+            for index in self._typing_indices.values():
+                index.detach()
+            self._typing_indices = dict()
+            self._ancestor_typings = dict()
+            return
+
+        affected = set()
+        for graph_id in changed:
+            if graph_id not in affected:
+                affected.add(graph_id)
+                affected.update(nx.ancestors(self, graph_id))
+        for key in list(self._typing_indices.keys()):
+            if key[0] in affected:
+                self._typing_indices.pop(key).detach()
+        for graph_id in affected:
+            self._ancestor_typings.pop(graph_id, None)
+
     def get_relation(self, left, right):
         return self.relation[left][right]
 
     def set_node_typing(self, source_graph, target_graph, node_id, type_id):
         """Set typing to of a particular node."""
         self.edge[source_graph][target_graph].mapping[node_id] = type_id
+        self._clear_typing_indices(source_graph)
 
     def get_rule_typing(self, source, target):
         """Get typing dict of `source` by `target` (`source` is rule)."""
@@ -2194,6 +2476,7 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
 
         for node in hierarchy.nodes():
             _merge_node(node)
+        self._clear_typing_indices()
 
     def merge_by_attr(self, hierarchy, attr):
         """Merge with a hierarchy by nodes with matching attr."""
@@ -2372,6 +2655,7 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
 
         for node in hierarchy.nodes():
             _merge_node(node)
+        self._clear_typing_indices()
 
         return new_names
 
@@ -2382,6 +2666,7 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
             new[node] = new_id
             self.add_node(new_id)
             self.node[new_id] = copy.deepcopy(self.node[node])
+        changed = set()
         for (source, target) in self.edges():
             if source in nodes:
                 if target in nodes:
@@ -2392,10 +2677,13 @@ class NetworkXHierarchy(nx.DiGraph, AttributeContainter):
                     self.add_edge(new[source], target)
                     self.edge[new[source]][target] = copy.deepcopy(
                         self.edge[source][target])
+                changed.add(new[source])
             elif target in nodes:
                 self.add_edge(source, new[target])
                 self.edge[source][new[target]] = copy.deepcopy(
                     self.edge[source][target])
+                changed.add(source)
+        self._clear_typing_indices(*changed)
         return new
 
     def delete_all_children(self, graph_id):
@@ -0,0 +1,189 @@
+"""Incremental maintenance of pattern matchings in a hierarchy.
+
+* `IncrementalMatcher` -- keeps the instances of a set of patterns
+  (or rules of the hierarchy) in a graph of the hierarchy up to date
+  with the rewritings of the hierarchy.
+"""
+from regraph.exceptions import HierarchyError, ReGraphError
+from regraph.networkx import matching
+from regraph.networkx.components import RuleNode
+from regraph.utils import is_subdict
+
+
+class IncrementalMatcher(object):
+    """Incremental matcher of patterns in a graph of a hierarchy.
+
+    Patterns (or rules from the hierarchy, in this case their left-hand
+    sides are matched) are registered against a graph of the hierarchy,
+    their instances are found once and then maintained when the graph is
+    rewritten with `NetworkXHierarchy.rewrite`: the instances that do
+    not use the nodes of the matched left-hand side are kept (and mapped
+    to the result of the rewriting), and only the instances using the
+    nodes of the image of the right-hand side are searched for. These
+    instances are confined to the neighbourhood of the image of the
+    right-hand side (of radius given by the diameter of the pattern),
+    so the cost of an update does not depend on the size of the graph
+    for connected patterns.
+
+    Instances are recomputed from scratch when the graph is modified by
+    the propagation of a rewriting of another graph, when a graph typing
+    some of the registered patterns is modified or when the left-hand
+    side of a registered rule is modified. Modifications of the graph
+    that are not performed by `NetworkXHierarchy.rewrite` (e.g. with
+    primitives) are not tracked, `refresh` has to be called explicitly
+    after such modifications.
+
+    Attributes
+    ----------
+    hierarchy : regraph.networkx.hierarchy.NetworkXHierarchy
+    graph_id : hashable
+        Id of the graph whose matchings are maintained
+    """
+
+    def __init__(self, hierarchy, graph_id):
+        """Initialize a matcher attached to a graph of a hierarchy."""
+        if graph_id not in hierarchy.nodes():
+            raise HierarchyError(
+                "Node '%s' is not defined in the hierarchy!" % graph_id)
+        if isinstance(hierarchy.node[graph_id], RuleNode):
+            raise ReGraphError(
+                "Pattern matching in a rule is not implemented!")
+        self.hierarchy = hierarchy
+        self.graph_id = graph_id
+        # key -> (compiled pattern, pattern typing) or rule id
+        self._patterns = dict()
+        self._instances = dict()
+        hierarchy._incremental_matchers.append(self)
+
+    def add_pattern(self, key, pattern, pattern_typing=None):
+        """Register a pattern under the specified key.
+
+        `pattern` and `pattern_typing` are the same as in
+        `NetworkXHierarchy.find_matching`.
+        """
+        if key in self._patterns.keys():
+            raise ReGraphError(
+                "Pattern '%s' is already registered!" % key)
+        self._patterns[key] = (
+            matching.compile_pattern(pattern), pattern_typing)
+        self.refresh(key)
+
+    def add_rule(self, rule_id, key=None):
+        """Register a rule of the hierarchy (by default, under its id)."""
+        if rule_id not in self.hierarchy.nodes() or\
+           not isinstance(self.hierarchy.node[rule_id], RuleNode):
+            raise HierarchyError("Invalid rule `%s` to match!" % rule_id)
+        if key is None:
+            key = rule_id
+        if key in self._patterns.keys():
+            raise ReGraphError(
+                "Pattern '%s' is already registered!" % key)
+        self._patterns[key] = rule_id
+        self.refresh(key)
+
+    def remove(self, key):
+        """Unregister a pattern (or a rule)."""
+        if key not in self._patterns.keys():
+            raise ReGraphError("Pattern '%s' is not registered!" % key)
+        del self._patterns[key]
+        del self._instances[key]
+
+    def detach(self):
+        """Stop tracking the rewritings of the hierarchy."""
+        if self in self.hierarchy._incremental_matchers:
+            self.hierarchy._incremental_matchers.remove(self)
+
+    def keys(self):
+        """Get the keys of the registered patterns."""
+        return list(self._patterns.keys())
+
+    def instances(self, key):
+        """Get the current instances of a registered pattern."""
+        if key not in self._patterns.keys():
+            raise ReGraphError("Pattern '%s' is not registered!" % key)
+        return [dict(instance) for instance in self._instances[key]]
+
+    def refresh(self, key=None):
+        """Recompute instances of a pattern (by default, of all patterns)."""
+        if key is None:
+            keys = self._patterns.keys()
+        else:
+            keys = [key]
+        for k in keys:
+            pattern, pattern_typing = self._get_pattern(k)
+            self._instances[k] = self.hierarchy.find_matching(
+                self.graph_id, pattern, pattern_typing)
+
+    def update(self, graph_id, instance, graph_construct,
+               changed_graphs, changed_rules):
+        """Update the instances after a rewriting of the hierarchy.
+
+        Parameters
+        ----------
+        graph_id : hashable
+            Id of the rewritten graph
+        instance : dict
+            Instance of the left-hand side of the rule in the graph
+        graph_construct : tuple
+            Tuple `(g_m, p_g_m, g_m_g, g_prime, g_m_g_prime, r_g_prime)`
+            produced by the rewriting of the graph
+        changed_graphs : set
+            Ids of all the graphs modified by the rewriting and its
+            propagation
+        changed_rules : set
+            Ids of the rules whose left-hand sides or typings were
+            modified by the propagation
+        """
+        if self.graph_id not in self.hierarchy.nodes():
+            self.detach()
+            return
+
+        if self.graph_id != graph_id and\
+           self.graph_id in changed_graphs:
+            self.refresh()
+            return
+
+        (_, _, _, g_prime, g_m_g_prime, r_g_prime) = graph_construct
+        removed = set(instance.values())
+        changed = set(r_g_prime.values())
+
+        for key in self._patterns.keys():
+            pattern, pattern_typing = self._get_pattern(key)
+            typing_changed = pattern_typing is not None and any(
+                typing_graph in changed_graphs
+                for typing_graph in pattern_typing.keys())
+            rule_changed = not isinstance(self._patterns[key], tuple) and\
+                self._patterns[key] in changed_rules
+            if typing_changed or rule_changed:
+                self.refresh(key)
+            elif self.graph_id == graph_id:
+                # Keep the instances not using the rewritten nodes
+                instances = []
+                for old_instance in self._instances[key]:
+                    if any(n in removed for n in old_instance.values()):
+                        continue
+                    instances.append(dict(
+                        (p, g_m_g_prime[n])
+                        for p, n in old_instance.items()))
+
+                # Search for the instances using the new nodes
+                if pattern.diameter is not None:
+                    nodes = matching.neighbourhood(
+                        g_prime, changed, pattern.diameter)
+                else:
+                    nodes = None
+                candidates = self.hierarchy._matching_candidates(
+                    graph_id, pattern, pattern_typing, nodes)
+                instances += list(matching.iter_matchings_touching(
+                    g_prime, pattern, candidates, changed, is_subdict))
+                self._instances[key] = instances
+
+    def _get_pattern(self, key):
+        value = self._patterns[key]
+        if isinstance(value, tuple):
+            return value
+        rule_node = self.hierarchy.node[value]
+        lhs_typing = dict()
+        for suc in self.hierarchy.successors(value):
+            lhs_typing[suc] = self.hierarchy.edge[value][suc].lhs_mapping
+        return (rule_node.compiled_lhs(), lhs_typing)
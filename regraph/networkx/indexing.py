@@ -0,0 +1,230 @@
+"""Indices speeding up pattern matching in networkx graphs.
+
+* `AttributeIndex` -- inverted index of node attributes of a graph,
+  maps attribute keys and values to the nodes carrying them;
+* `TypingIndex` -- reverse index of a typing of a graph, maps
+  types to the sets of their instances.
+"""
+from regraph.attribute_sets import (AttributeSet,
+                                    FiniteSet,
+                                    IntegerSet,
+                                    RegexSet)
+
+
+def get_attribute_index(graph):
+    """Get the attribute index attached to a graph (None if not indexed)."""
+    return getattr(graph, "attribute_index", None)
+
+
+class AttributeIndex(object):
+    """Inverted index of node attributes.
+
+    The index maps every attribute key to the nodes having this key,
+    finite values of attributes are indexed by their elements, while
+    nodes whose attributes are given by integer sets, regular
+    expressions or other sets are kept in separate buckets
+    (per attribute key), these buckets can only be filtered by
+    the inclusion test itself.
+
+    Attributes
+    ----------
+    keys : dict
+        Dictionary whose keys are attribute keys and whose values are
+        sets of nodes having this attribute key
+    finite : dict
+        Dictionary of dictionaries, `finite[key][value]` is the set of
+        nodes whose `key` attribute is a finite set containing `value`
+    integer : dict
+        Dictionary whose values are sets of nodes whose attributes
+        are given by `IntegerSet`
+    regex : dict
+        Dictionary whose values are sets of nodes whose attributes
+        are given by `RegexSet`
+    other : dict
+        Dictionary whose values are sets of nodes whose attributes
+        are given by any other sets (e.g. `UniversalSet`)
+    """
+
+    def __init__(self, graph=None):
+        """Initialize an index (optionally, of the nodes of a graph)."""
+        self.keys = dict()
+        self.finite = dict()
+        self.integer = dict()
+        self.regex = dict()
+        self.other = dict()
+        # Indexed entries of every node: key -> finite elements or bucket
+        self._entries = dict()
+        if graph is not None:
+            for node in graph.nodes():
+                self.add_node(node, graph.node[node])
+
+    def __contains__(self, node):
+        """Test if the node is indexed."""
+        return node in self._entries
+
+    def add_node(self, node, attrs):
+        """Index a node with its attributes (re-index if already indexed)."""
+        self.remove_node(node)
+        entries = dict()
+        if attrs is not None:
+            for key, value in attrs.items():
+                self.keys.setdefault(key, set()).add(node)
+                if isinstance(value, FiniteSet) or isinstance(value, set):
+                    elements = frozenset(value)
+                    for element in elements:
+                        self.finite.setdefault(key, dict()).setdefault(
+                            element, set()).add(node)
+                    entries[key] = elements
+                else:
+                    bucket = self._bucket(value)
+                    bucket.setdefault(key, set()).add(node)
+                    entries[key] = bucket
+        self._entries[node] = entries
+
+    def remove_node(self, node):
+        """Remove a node from the index."""
+        if node not in self._entries:
+            return
+        for key, entry in self._entries[node].items():
+            _discard(self.keys, key, node)
+            if isinstance(entry, frozenset):
+                for element in entry:
+                    values = self.finite[key]
+                    _discard(values, element, node)
+                    if len(values) == 0:
+                        del self.finite[key]
+            else:
+                _discard(entry, key, node)
+        del self._entries[node]
+
+    def candidates(self, attrs):
+        """Find candidate nodes whose attributes may include `attrs`.
+
+        Returns a set of nodes containing all the indexed nodes whose
+        attributes include `attrs` (in the sense of
+        `regraph.utils.valid_attributes`), or None if the
+        attributes do not constrain the nodes. The result is a
+        superset: nodes whose values are not finite sets
+        still have to be tested for the inclusion.
+        """
+        if attrs is None:
+            return None
+        result = None
+        for key, value in attrs.items():
+            if isinstance(value, FiniteSet) or isinstance(value, set):
+                elements = [e for e in value if e is not None]
+                if len(elements) == 0:
+                    continue
+                nodes = None
+                values = self.finite.get(key, dict())
+                for element in elements:
+                    element_nodes = values.get(element, set())
+                    if nodes is None:
+                        nodes = set(element_nodes)
+                    else:
+                        nodes &= element_nodes
+                    if len(nodes) == 0:
+                        break
+                for bucket in [self.integer, self.regex, self.other]:
+                    nodes |= bucket.get(key, set())
+            elif isinstance(value, AttributeSet) and value.is_empty():
+                continue
+            else:
+                if len(self.keys.get(key, set())) == 0:
+                    return set()
+                nodes = self.keys[key]
+
+            if result is None:
+                result = set(nodes)
+            else:
+                result &= nodes
+            if len(result) == 0:
+                break
+        return result
+
+    def _bucket(self, value):
+        if isinstance(value, IntegerSet):
+            return self.integer
+        elif isinstance(value, RegexSet):
+            return self.regex
+        else:
+            return self.other
+
+
+class TypingIndex(object):
+    """Reverse index of a typing.
+
+    An index attached to a graph (see `attach`) is kept up to date
+    by the node transformation primitives of `regraph.primitives`,
+    as the attribute index of the graph.
+
+    Attributes
+    ----------
+    typing : dict
+        Dictionary containing the typing of the nodes of
+        a graph by the nodes of a typing graph
+    instances : dict
+        Dictionary whose keys are nodes of the typing graph and whose
+        values are sets of nodes of the graph typed by them
+    untyped : set
+        Set of nodes of the graph not typed by the typing
+    """
+
+    def __init__(self, typing, graph=None):
+        """Initialize an index of a typing (of the nodes of a graph)."""
+        self.typing = dict(typing)
+        self.instances = dict()
+        self.untyped = set()
+        self.graph = None
+        for node, type_node in self.typing.items():
+            self.instances.setdefault(type_node, set()).add(node)
+        if graph is not None:
+            for node in graph.nodes():
+                self.add_node(node)
+
+    def attach(self, graph):
+        """Attach the index to a graph to keep it up to date."""
+        if not hasattr(graph, "typing_indices"):
+            graph.typing_indices = []
+        graph.typing_indices.append(self)
+        self.graph = graph
+
+    def detach(self):
+        """Detach the index from its graph."""
+        if self.graph is not None:
+            indices = get_typing_indices(self.graph)
+            if self in indices:
+                indices.remove(self)
+            self.graph = None
+
+    def add_node(self, node):
+        """Index a node of the graph (untyped if not in the typing)."""
+        if node not in self.typing:
+            self.untyped.add(node)
+
+    def remove_node(self, node):
+        """Remove a node of the graph from the index."""
+        self.untyped.discard(node)
+        if node in self.typing:
+            _discard(self.instances, self.typing.pop(node), node)
+
+    def instances_of(self, type_node):
+        """Get the set of instances of a type."""
+        return self.instances.get(type_node, set())
+
+    def untyped_nodes(self):
+        """Get the set of nodes of the graph not typed by the typing."""
+        return self.untyped
+
+
+def get_typing_indices(graph):
+    """Get the list of typing indices attached to a graph."""
+    return getattr(graph, "typing_indices", [])
+
+
+def _discard(index, key, node):
+    """Discard a node from the set `index[key]`, drop the set if empty."""
+    if key in index:
+        index[key].discard(node)
+        if len(index[key]) == 0:
+            del index[key]
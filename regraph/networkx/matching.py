@@ -0,0 +1,744 @@
+"""Backtracking subgraph matching for networkx graphs.
+
+This module implements the search used by `regraph.primitives.find_matching`
+and `NetworkXHierarchy.find_matching`. Instead of enumerating all the
+subsets of nodes and edges of the graph and testing each of them for
+isomorphism with the pattern, the search grows a partial assignment of
+pattern nodes to graph nodes along the adjacency of the pattern
+(in the spirit of the VF2 algorithm). A candidate image of a pattern
+node is only considered if it is adjacent (in the right direction) to the
+images of the already assigned neighbours of this node, attribute and
+typing constraints are checked as soon as a node or an edge is assigned.
+
+The matchings found are injective maps from the nodes of the pattern to
+the nodes of the graph preserving edges (i.e. monomorphisms, the
+matching is not required to be induced), such that the attributes of
+every pattern node (edge) are included in the attributes of its image.
+
+* `CompiledPattern` -- pattern prepared for repeated matching;
+* `MatchingBudget` -- limits on the time and the steps of a search;
+* `MatchingResult` -- list of instances found by a budgeted search;
+* `compile_pattern` -- compile a pattern (if not compiled yet);
+* `find_candidates` -- find candidate images of the nodes of a pattern;
+* `matching_order` -- find an order of pattern nodes for the search;
+* `iter_matchings` -- generate all the matchings of a pattern;
+* `find_matchings` -- find all the matchings of a pattern (optionally,
+  in parallel worker processes);
+* `iter_matchings_touching` -- generate the matchings of a pattern
+  using some of the specified graph nodes;
+* `neighbourhood` -- find the nodes of a graph close to some nodes.
+"""
+import copy
+import itertools
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from networkx.algorithms import isomorphism
+
+from regraph.utils import normalize_attrs, valid_attributes
+
+
+_EXHAUSTED = object()
+
+
+class MatchingBudget(object):
+    """Budget of a matching search.
+
+    A step of the search is a test of a candidate image of a pattern
+    node. The search is stopped as soon as the number of steps
+    exceeds `max_steps` or the time exceeds `timeout` (the time is
+    checked every `check_interval` steps), the instances found so far
+    are kept.
+
+    Attributes
+    ----------
+    timeout : float
+        Maximum time of the search in seconds (None if unlimited)
+    max_steps : int
+        Maximum number of steps of the search (None if unlimited)
+    deadline : float
+        Time (as returned by `time.time`) when the search is stopped
+    steps : int
+        Number of steps spent
+    truncated : bool
+        True if the search was stopped because the budget was exhausted
+    """
+
+    check_interval = 128
+
+    def __init__(self, timeout=None, max_steps=None):
+        """Initialize a budget, the time is counted from now."""
+        self.timeout = timeout
+        self.max_steps = max_steps
+        self.deadline = None
+        if timeout is not None:
+            self.deadline = time.time() + timeout
+        self.steps = 0
+        self.truncated = False
+
+    def spend(self):
+        """Spend a step, return False if the budget is exhausted."""
+        if self.truncated:
+            return False
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            self.truncated = True
+            return False
+        self.steps += 1
+        if self.deadline is not None and\
+           self.steps % self.check_interval == 0 and\
+           time.time() > self.deadline:
+            self.truncated = True
+            return False
+        return True
+
+
+class MatchingResult(list):
+    """List of instances found by a matching search.
+
+    Attributes
+    ----------
+    truncated : bool
+        True if the search was stopped before all the
+        instances were found (see `MatchingBudget`)
+    steps : int
+        Number of steps spent by the search
+    """
+
+    def __init__(self, instances=None, truncated=False, steps=0):
+        if instances is None:
+            instances = []
+        list.__init__(self, instances)
+        self.truncated = truncated
+        self.steps = steps
+
+
+def _adjacency(graph):
+    """Get successors and predecessors dictionaries of a graph."""
+    if graph.is_directed():
+        return graph.succ, graph.pred
+    else:
+        return graph.adj, graph.adj
+
+
+class CompiledPattern(object):
+    """Pattern prepared for repeated matching.
+
+    Everything the search needs to know about the pattern is derived
+    once: the adjacency of the pattern, the degrees of its nodes and
+    the normalized attributes of its nodes and edges. The search
+    plans (orders of the pattern nodes together with the edges
+    connecting every node to the previously assigned ones) are
+    cached per order.
+
+    Attributes
+    ----------
+    pattern : nx.(Di)Graph
+        Compiled pattern
+    directed : bool
+    nodes : list
+        Nodes of the pattern
+    node_attrs : dict
+        Dictionary with normalized attributes of the pattern nodes
+    successors : dict
+        Dictionary of dictionaries, `successors[s][t]` contains the
+        normalized attributes of the edge from `s` to `t`
+    predecessors : dict
+        Dictionary whose values are sets of predecessors of the nodes
+        (coincide with the successors for undirected patterns)
+    out_degree : dict
+    in_degree : dict
+    """
+
+    def __init__(self, pattern):
+        """Compile a pattern."""
+        self.pattern = pattern
+        self.directed = pattern.is_directed()
+        self.nodes = list(pattern.nodes())
+
+        succ, pred = _adjacency(pattern)
+        self.node_attrs = dict()
+        self.successors = dict()
+        self.predecessors = dict()
+        for node in self.nodes:
+            attrs = copy.deepcopy(pattern.node[node])
+            normalize_attrs(attrs)
+            self.node_attrs[node] = attrs
+            self.successors[node] = dict()
+            for target, edge_attrs in succ[node].items():
+                edge_attrs = copy.deepcopy(edge_attrs)
+                normalize_attrs(edge_attrs)
+                self.successors[node][target] = edge_attrs
+            self.predecessors[node] = set(pred[node])
+
+        self.out_degree = dict(
+            (n, len(self.successors[n])) for n in self.nodes)
+        self.in_degree = dict(
+            (n, len(self.predecessors[n])) for n in self.nodes)
+        self._plans = dict()
+        self._diameter = None
+        self._diameter_known = False
+        self._symmetry = dict()
+
+    @property
+    def diameter(self):
+        """Diameter of the pattern (None if the pattern is disconnected).
+
+        Distances are computed ignoring the directions of the edges.
+        """
+        if not self._diameter_known:
+            diameter = 0
+            for source in self.nodes:
+                distances = {source: 0}
+                frontier = [source]
+                while len(frontier) > 0:
+                    next_frontier = []
+                    for node in frontier:
+                        for neighbour in itertools.chain(
+                                self.successors[node],
+                                self.predecessors[node]):
+                            if neighbour not in distances:
+                                distances[neighbour] = distances[node] + 1
+                                next_frontier.append(neighbour)
+                    frontier = next_frontier
+                if len(distances) < len(self.nodes):
+                    diameter = None
+                    break
+                diameter = max(diameter, max(distances.values()))
+            self._diameter = diameter
+            self._diameter_known = True
+        return self._diameter
+
+    def automorphisms(self, node_classes=None):
+        """Find the automorphisms of the pattern.
+
+        Automorphisms preserve the attributes of the nodes and the edges
+        and, if `node_classes` (dictionary whose keys are pattern nodes
+        and whose values are hashable labels, e.g. types) is specified,
+        the labels of the nodes.
+
+        Returns
+        -------
+        automorphisms : list of dict's
+        """
+        def _label(values, value):
+            for i, v in enumerate(values):
+                if v == value:
+                    return i
+            values.append(value)
+            return len(values) - 1
+
+        node_values = []
+        edge_values = []
+        labelled = self.pattern.__class__()
+        for node in self.nodes:
+            node_class = None
+            if node_classes is not None:
+                node_class = node_classes.get(node)
+            labelled.add_node(node, label=_label(
+                node_values, (node_class, self.node_attrs[node])))
+        for s, targets in self.successors.items():
+            for t, attrs in targets.items():
+                labelled.add_edge(s, t, label=_label(edge_values, attrs))
+
+        def _match(attrs1, attrs2):
+            return attrs1["label"] == attrs2["label"]
+
+        if self.directed:
+            matcher = isomorphism.DiGraphMatcher(
+                labelled, labelled, _match, _match)
+        else:
+            matcher = isomorphism.GraphMatcher(
+                labelled, labelled, _match, _match)
+        return [dict(a) for a in matcher.isomorphisms_iter()]
+
+    def symmetry_breaking(self, node_classes=None):
+        """Get the symmetry breaking constraints of the pattern.
+
+        The constraints are computed from the automorphisms of the
+        pattern (see `automorphisms`): while the group of automorphisms
+        is not trivial, a node with the largest orbit is required to
+        have the smallest image among the nodes of its orbit and the
+        group is restricted to the stabilizer of this node. Among the
+        matchings of the pattern that differ by an automorphism exactly
+        one satisfies the constraints.
+
+        Returns
+        -------
+        constraints : list
+            List of pairs `(a, b)` of pattern nodes, the image of `a`
+            has to precede the image of `b` (in a fixed order of the
+            nodes of the graph)
+        """
+        if node_classes is not None:
+            key = tuple(node_classes.get(n) for n in self.nodes)
+        else:
+            key = None
+        if key not in self._symmetry:
+            constraints = []
+            group = self.automorphisms(node_classes)
+            while len(group) > 1:
+                orbits = dict(
+                    (n, set([a[n] for a in group])) for n in self.nodes)
+                node = max(self.nodes, key=lambda n: len(orbits[n]))
+                for other in orbits[node]:
+                    if other != node:
+                        constraints.append((node, other))
+                group = [a for a in group if a[node] == node]
+            self._symmetry[key] = constraints
+        return self._symmetry[key]
+
+    def plan(self, candidates):
+        """Get a search plan given the candidates of the pattern nodes.
+
+        Returns
+        -------
+        order : list
+            Order of the pattern nodes (see `matching_order`)
+        constraints : list
+            List of triples `(out_nodes, in_nodes, loop)` for every
+            position of the order, where `out_nodes` are the previously
+            assigned nodes `t` such that the pattern has an edge from
+            the node to `t`, `in_nodes` the previously assigned nodes `s`
+            with an edge from `s` to the node, and `loop` indicates that
+            the node has a self-loop.
+        """
+        order = matching_order(self, candidates)
+        key = tuple(order)
+        if key not in self._plans:
+            self._plans[key] = self._constraints(order)
+        return order, self._plans[key]
+
+    def _constraints(self, order):
+        constraints = []
+        assigned = set()
+        for node in order:
+            out_nodes = [t for t in self.successors[node] if t in assigned]
+            if self.directed:
+                in_nodes = [
+                    s for s in self.predecessors[node] if s in assigned]
+            else:
+                in_nodes = []
+            constraints.append(
+                (out_nodes, in_nodes, node in self.successors[node]))
+            assigned.add(node)
+        return constraints
+
+
+def compile_pattern(pattern):
+    """Compile a pattern, return it as is if it is already compiled."""
+    if isinstance(pattern, CompiledPattern):
+        return pattern
+    return CompiledPattern(pattern)
+
+
+def find_candidates(graph, pattern, node_match, nodes=None, index=None,
+                    seeds=None):
+    """Find candidate images of the nodes of a pattern.
+
+    Besides `node_match`, graph nodes are filtered by their degrees,
+    which have to be at least the degrees of the pattern nodes.
+
+    Parameters
+    ----------
+    graph : nx.(Di)Graph
+    pattern : nx.(Di)Graph or CompiledPattern
+    node_match : callable
+        Function taking a node of the pattern and a node of the graph,
+        returns True if the latter can be the image of the former
+    nodes : iterable, optional
+        Subset of nodes of the graph to search for candidates
+    index : regraph.networkx.indexing.AttributeIndex, optional
+        Attribute index of the graph, if specified, only the nodes
+        returned by the index are tested with `node_match`
+    seeds : dict, optional
+        Dictionary whose keys are nodes of the pattern and whose values
+        are sets of nodes of the graph containing all the possible
+        images of these nodes (e.g. instances of their types), only the
+        nodes from these sets are tested with `node_match`
+
+    Returns
+    -------
+    candidates : dict
+        Dictionary whose keys are the nodes of the pattern and whose
+        values are lists of candidate nodes of the graph
+    """
+    pattern = compile_pattern(pattern)
+    g_succ, g_pred = _adjacency(graph)
+    if nodes is None:
+        graph_nodes = graph.nodes()
+        node_set = graph.node
+    else:
+        graph_nodes = [n for n in nodes if n in graph.node]
+        node_set = set(graph_nodes)
+
+    candidates = dict()
+    for pattern_node in pattern.nodes:
+        pools = []
+        if seeds is not None and seeds.get(pattern_node) is not None:
+            pools.append(seeds[pattern_node])
+        if index is not None:
+            indexed = index.candidates(pattern.node_attrs[pattern_node])
+            if indexed is not None:
+                pools.append(indexed)
+
+        if len(pools) == 0:
+            pool = graph_nodes
+        else:
+            pools.sort(key=len)
+            pool = [
+                node for node in pools[0]
+                if node in node_set and all(node in p for p in pools[1:])
+            ]
+
+        out_degree = pattern.out_degree[pattern_node]
+        in_degree = pattern.in_degree[pattern_node]
+        candidates[pattern_node] = [
+            node for node in pool
+            if len(g_succ[node]) >= out_degree and
+            len(g_pred[node]) >= in_degree and
+            node_match(pattern_node, node)
+        ]
+    return candidates
+
+
+def matching_order(pattern, candidates):
+    """Find an order of the pattern nodes for the backtracking search.
+
+    The next node to assign is the one with the largest number of
+    edges to the already ordered nodes, ties are broken by the
+    smallest number of candidates (i.e. the most selective node
+    in the graph being searched) and then by the largest degree.
+    """
+    pattern = compile_pattern(pattern)
+    succ = pattern.successors
+    pred = pattern.predecessors
+    order = []
+    ordered = set()
+    remaining = list(pattern.nodes)
+    while len(remaining) > 0:
+        def _rank(node):
+            links = len([n for n in succ[node] if n in ordered])
+            if pattern.directed:
+                links += len([n for n in pred[node] if n in ordered])
+            return (
+                -links, len(candidates[node]),
+                -(len(succ[node]) + len(pred[node]))
+            )
+        best = min(remaining, key=_rank)
+        remaining.remove(best)
+        order.append(best)
+        ordered.add(best)
+    return order
+
+
+def iter_matchings(graph, pattern, candidates, edge_match=valid_attributes,
+                   symmetry=None, budget=None):
+    """Generate matchings of a pattern in a graph.
+
+    Parameters
+    ----------
+    graph : nx.(Di)Graph
+    pattern : nx.(Di)Graph or CompiledPattern
+    candidates : dict
+        Dictionary of candidate images of the pattern nodes
+        (see `find_candidates`)
+    edge_match : callable, optional
+        Function taking the attributes of a pattern edge and
+        the attributes of a graph edge, returns True if the
+        latter edge can be the image of the former
+    symmetry : list, optional
+        Symmetry breaking constraints (see
+        `CompiledPattern.symmetry_breaking`), pairs `(a, b)` of pattern
+        nodes such that the image of `a` has to precede the image of `b`
+        in the order of the nodes of the graph
+    budget : MatchingBudget, optional
+        Budget of the search, the generator stops as soon as the budget
+        is exhausted (the flag `truncated` of the budget is then set)
+
+    Yields
+    ------
+    instance : dict
+        Dictionary whose keys are nodes of the pattern and whose values
+        are the corresponding nodes of the graph
+    """
+    pattern = compile_pattern(pattern)
+    if len(pattern.nodes) == 0:
+        yield dict()
+        return
+
+    for node in pattern.nodes:
+        if len(candidates[node]) == 0:
+            return
+
+    order, constraints = pattern.plan(candidates)
+    g_succ, g_pred = _adjacency(graph)
+    p_succ = pattern.successors
+    candidate_sets = dict(
+        (node, set(nodes)) for node, nodes in candidates.items())
+
+    # Images of `preceding[i]` nodes have to precede the image
+    # of the i-th node of the order, images of `following[i]` nodes
+    # have to follow it
+    preceding = [[] for _ in order]
+    following = [[] for _ in order]
+    if symmetry:
+        rank = dict((node, i) for i, node in enumerate(g_succ))
+        position = dict((node, i) for i, node in enumerate(order))
+        for a, b in symmetry:
+            if position[a] < position[b]:
+                preceding[position[b]].append(a)
+            else:
+                following[position[a]].append(b)
+
+    mapping = dict()
+    used = set()
+
+    def _extensions(depth):
+        pattern_node = order[depth]
+        out_nodes, in_nodes, loop = constraints[depth]
+
+        # Pick the smallest set of graph nodes adjacent to
+        # the images of the already assigned neighbours
+        anchors = [g_pred[mapping[t]] for t in out_nodes] +\
+            [g_succ[mapping[s]] for s in in_nodes]
+        if len(anchors) > 0:
+            pool = min(anchors, key=len)
+        else:
+            pool = candidates[pattern_node]
+
+        for node in pool:
+            if budget is not None and not budget.spend():
+                return
+            if node in used or node not in candidate_sets[pattern_node]:
+                continue
+            if len(preceding[depth]) > 0 or len(following[depth]) > 0:
+                node_rank = rank[node]
+                if any(rank[mapping[a]] > node_rank
+                       for a in preceding[depth]) or\
+                   any(rank[mapping[b]] < node_rank
+                       for b in following[depth]):
+                    continue
+            if loop and (node not in g_succ[node] or not edge_match(
+                    p_succ[pattern_node][pattern_node], g_succ[node][node])):
+                continue
+            for t in out_nodes:
+                image = mapping[t]
+                if image not in g_succ[node] or not edge_match(
+                        p_succ[pattern_node][t], g_succ[node][image]):
+                    break
+            else:
+                for s in in_nodes:
+                    image = mapping[s]
+                    if node not in g_succ[image] or not edge_match(
+                            p_succ[s][pattern_node], g_succ[image][node]):
+                        break
+                else:
+                    yield node
+
+    last = len(order) - 1
+    stack = [_extensions(0)]
+    assigned = []
+    while len(stack) > 0:
+        if budget is not None and budget.truncated:
+            return
+        depth = len(stack) - 1
+        node = next(stack[-1], _EXHAUSTED)
+        if node is _EXHAUSTED:
+            stack.pop()
+            if len(assigned) > 0:
+                pattern_node, image = assigned.pop()
+                del mapping[pattern_node]
+                used.remove(image)
+            continue
+        if depth == last:
+            instance = dict(mapping)
+            instance[order[depth]] = node
+            yield instance
+        else:
+            mapping[order[depth]] = node
+            used.add(node)
+            assigned.append((order[depth], node))
+            stack.append(_extensions(depth + 1))
+
+
+class _CompactGraph(object):
+    """Adjacency of a graph restricted to a subset of its nodes.
+
+    Contains only what the search needs (edges with their attributes),
+    used to send a graph to worker processes.
+    """
+
+    def __init__(self, graph, nodes):
+        self.directed = graph.is_directed()
+        g_succ, g_pred = _adjacency(graph)
+        self.succ = dict()
+        for node in nodes:
+            self.succ[node] = dict(
+                (t, attrs) for t, attrs in g_succ[node].items()
+                if t in nodes)
+        if self.directed:
+            self.pred = dict()
+            for node in nodes:
+                self.pred[node] = set([s for s in g_pred[node] if s in nodes])
+        else:
+            self.adj = self.succ
+
+    def is_directed(self):
+        return self.directed
+
+
+def _match_chunk(task):
+    (graph, pattern, edge_match, symmetry, budget), candidates = task
+    if budget is not None:
+        budget = copy.copy(budget)
+    instances = list(iter_matchings(
+        graph, pattern, candidates, edge_match, symmetry, budget))
+    if budget is not None:
+        return instances, budget.steps, budget.truncated
+    return instances, 0, False
+
+
+def find_matchings(graph, pattern, candidates, edge_match=valid_attributes,
+                   workers=None, symmetry=None, budget=None):
+    """Find all the matchings of a pattern in a graph.
+
+    Parameters
+    ----------
+    graph : nx.(Di)Graph
+    pattern : nx.(Di)Graph or CompiledPattern
+    candidates : dict
+        Dictionary of candidate images of the pattern nodes
+        (see `find_candidates`)
+    edge_match : callable, optional
+        See `iter_matchings`, if the search is performed in worker
+        processes, the function should be picklable (i.e. defined at
+        the top level of a module)
+    workers : int, optional
+        Number of worker processes, if specified (and greater than 1),
+        the candidates of the first node of the search plan are split
+        into chunks searched in parallel by a
+        `concurrent.futures.ProcessPoolExecutor`. The graph restricted
+        to the candidate nodes is sent with every chunk. The
+        instances are merged in the order of the chunks, so the
+        result does not depend on the scheduling of the workers.
+    symmetry : list, optional
+        Symmetry breaking constraints (see `iter_matchings`)
+    budget : MatchingBudget, optional
+        Budget of the search (see `iter_matchings`), the steps spent
+        by the workers are added to the budget. If the search is
+        performed in parallel, the maximum number of steps is
+        divided evenly among the chunks.
+
+    Returns
+    -------
+    instances : MatchingResult
+    """
+    pattern = compile_pattern(pattern)
+    if budget is None:
+        budget = MatchingBudget()
+    if workers is None or workers <= 1 or len(pattern.nodes) == 0:
+        return _budgeted_result(iter_matchings(
+            graph, pattern, candidates, edge_match, symmetry, budget), budget)
+
+    order, _ = pattern.plan(candidates)
+    first = order[0]
+    first_candidates = candidates[first]
+    if len(first_candidates) < 2:
+        return _budgeted_result(iter_matchings(
+            graph, pattern, candidates, edge_match, symmetry, budget), budget)
+
+    n_chunks = min(len(first_candidates), workers * 4)
+    chunk_size = (len(first_candidates) + n_chunks - 1) // n_chunks
+    chunks = []
+    for i in range(0, len(first_candidates), chunk_size):
+        chunk_candidates = dict(candidates)
+        chunk_candidates[first] = first_candidates[i:i + chunk_size]
+        chunks.append(chunk_candidates)
+
+    nodes = set()
+    for values in candidates.values():
+        nodes.update(values)
+    compact_graph = _CompactGraph(graph, nodes)
+
+    chunk_budget = copy.copy(budget)
+    chunk_budget.steps = 0
+    if budget.max_steps is not None:
+        chunk_budget.max_steps = max(
+            (budget.max_steps - budget.steps) // len(chunks), 1)
+
+    shared_data = (
+        compact_graph, pattern, edge_match, symmetry, chunk_budget)
+    instances = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_instances, steps, truncated in executor.map(
+                _match_chunk, [(shared_data, chunk) for chunk in chunks]):
+            instances += chunk_instances
+            budget.steps += steps
+            budget.truncated = budget.truncated or truncated
+    return MatchingResult(instances, budget.truncated, budget.steps)
+
+
+def _budgeted_result(instances, budget):
+    return MatchingResult(list(instances), budget.truncated, budget.steps)
+
+
+def iter_matchings_touching(graph, pattern, candidates, nodes,
+                            edge_match=valid_attributes):
+    """Generate matchings of a pattern using some of the specified nodes.
+
+    Every matching whose image contains at least one node from `nodes`
+    is produced exactly once: the i-th search pins the i-th pattern
+    node to `nodes` and forbids `nodes` as images of the previous
+    pattern nodes.
+
+    Parameters
+    ----------
+    graph : nx.(Di)Graph
+    pattern : nx.(Di)Graph or CompiledPattern
+    candidates : dict
+        Dictionary of candidate images of the pattern nodes
+        (see `find_candidates`)
+    nodes : set
+        Set of nodes of the graph
+    edge_match : callable, optional
+        See `iter_matchings`
+    """
+    pattern = compile_pattern(pattern)
+    candidate_sets = dict(
+        (node, set(values)) for node, values in candidates.items())
+    for i, pinned in enumerate(pattern.nodes):
+        local_candidates = dict()
+        for j, pattern_node in enumerate(pattern.nodes):
+            if j < i:
+                local_candidates[pattern_node] = [
+                    n for n in candidates[pattern_node] if n not in nodes]
+            elif j == i:
+                local_candidates[pattern_node] = [
+                    n for n in nodes if n in candidate_sets[pattern_node]]
+            else:
+                local_candidates[pattern_node] = candidates[pattern_node]
+        for instance in iter_matchings(
+                graph, pattern, local_candidates, edge_match):
+            yield instance
+
+
+def neighbourhood(graph, nodes, radius):
+    """Find the nodes of a graph at distance at most `radius` from `nodes`.
+
+    Distances are computed ignoring the directions of the edges.
+    """
+    g_succ, g_pred = _adjacency(graph)
+    visited = set([n for n in nodes if n in graph.node])
+    frontier = list(visited)
+    for _ in range(radius):
+        next_frontier = []
+        for node in frontier:
+            for neighbour in itertools.chain(g_succ[node], g_pred[node]):
+                if neighbour not in visited:
+                    visited.add(neighbour)
+                    next_frontier.append(neighbour)
+        if len(next_frontier) == 0:
+            break
+        frontier = next_frontier
+    return visited
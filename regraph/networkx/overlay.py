@@ -0,0 +1,271 @@
+"""Copy-on-write overlays of networkx graphs.
+
+* `OverlayDiGraph`, `OverlayGraph` -- graphs presenting the networkx
+  `DiGraph` (`Graph`) API over a base graph and a delta of added,
+  removed and modified nodes, edges and attributes;
+* `overlay_graph` -- create an overlay of a graph.
+"""
+import copy
+import networkx as nx
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+from regraph.networkx.indexing import get_attribute_index
+
+
+class _OverlayDict(MutableMapping):
+    """Dictionary overlaying a base dictionary.
+
+    The base dictionary is never modified: values of the base are
+    copied (with `copy_value`) the first time they are accessed and
+    all the modifications are kept in the overlay.
+    """
+
+    def __init__(self, base, copy_value):
+        self.base = base
+        self.local = dict()
+        self.removed = set()
+        self._copy_value = copy_value
+
+    def __getitem__(self, key):
+        if key in self.local:
+            return self.local[key]
+        if key in self.removed:
+            raise KeyError(key)
+        value = self._copy_value(self.base[key])
+        self.local[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.local[key] = value
+        self.removed.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.local.pop(key, None)
+        if key in self.base:
+            self.removed.add(key)
+
+    def __contains__(self, key):
+        if key in self.local:
+            return True
+        return key not in self.removed and key in self.base
+
+    def __iter__(self):
+        for key in self.base:
+            if key not in self.removed:
+                yield key
+        for key in self.local:
+            if key not in self.base:
+                yield key
+
+    def __len__(self):
+        added = len([k for k in self.local if k not in self.base])
+        return len(self.base) - len(self.removed) + added
+
+    def peek(self, key):
+        """Get a value without copying it from the base."""
+        if key in self.local:
+            return self.local[key]
+        if key in self.removed:
+            raise KeyError(key)
+        return self.base[key]
+
+    def clear_delta(self):
+        """Drop the modifications kept in the overlay."""
+        self.local = dict()
+        self.removed = set()
+
+
+class _OverlayMixin(object):
+    """Copy-on-write machinery shared by the overlay graph classes.
+
+    The classes using this mixin define `_adjacencies`, returning the
+    overlay dictionaries of adjacency of the graph (the successors
+    first, then the predecessors for directed graphs).
+    """
+
+    def _init_overlay(self, base):
+        self.base = base
+        # id of an edge attribute dictionary of the base ->
+        # (the dictionary, its copy in the overlay)
+        self._edge_copies = dict()
+        self.graph = dict(base.graph)
+        self.node = _OverlayDict(base.node, dict)
+
+    def _copy_neighbours(self, neighbours):
+        """Copy a dictionary of neighbours of the base.
+
+        The attribute dictionaries of edges are shared by the
+        successors and the predecessors (or by both ends of an
+        undirected edge), so they are copied only once.
+        """
+        result = dict()
+        for neighbour, attrs in neighbours.items():
+            if id(attrs) not in self._edge_copies:
+                self._edge_copies[id(attrs)] = (attrs, dict(attrs))
+            result[neighbour] = self._edge_copies[id(attrs)][1]
+        return result
+
+    def __reduce_ex__(self, protocol):
+        """Copy or pickle an overlay as an independent graph."""
+        return (_identity, (self.materialize(),))
+
+    def materialize(self):
+        """Get a networkx graph independent from the base."""
+        if self.is_directed():
+            graph = nx.DiGraph()
+        else:
+            graph = nx.Graph()
+        graph.graph = copy.deepcopy(self.graph)
+        for node in self.node:
+            graph.add_node(node)
+            graph.node[node] = copy.deepcopy(self.node.peek(node))
+        adj = self._adjacencies()[0]
+        for u in adj:
+            for v, attrs in adj.peek(u).items():
+                if not graph.has_edge(u, v):
+                    graph.add_edge(u, v, copy.deepcopy(attrs))
+        return graph
+
+    def commit(self):
+        """Write the modifications of the overlay to the base graph.
+
+        After the commit the base contains the graph presented by
+        the overlay and the overlay is empty. The attribute index
+        of the base (if any) is updated for the modified nodes.
+        """
+        # Copied edge attribute dictionaries are written back to the
+        # dictionaries of the base, this preserves the sharing of the
+        # dictionaries by the adjacencies that were not copied
+        origins = dict()
+        for attrs, attrs_copy in self._edge_copies.values():
+            origins[id(attrs_copy)] = attrs
+
+        def resolve(attrs):
+            if id(attrs) in origins:
+                original = origins[id(attrs)]
+                original.clear()
+                original.update(attrs)
+                return original
+            return attrs
+
+        for mapping in self._adjacencies():
+            for key in mapping.removed:
+                del mapping.base[key]
+            for key, neighbours in mapping.local.items():
+                mapping.base[key] = dict(
+                    (n, resolve(attrs)) for n, attrs in neighbours.items())
+
+        for key in self.node.removed:
+            del self.base.node[key]
+        for key, attrs in self.node.local.items():
+            self.base.node[key] = attrs
+
+        index = get_attribute_index(self.base)
+        if index is not None:
+            for key in self.node.removed:
+                index.remove_node(key)
+            for key in self.node.local.keys():
+                index.add_node(key, self.base.node[key])
+
+        self.base.graph.clear()
+        self.base.graph.update(self.graph)
+
+        self._reset()
+
+    def rollback(self):
+        """Drop the modifications of the overlay."""
+        self.graph = dict(self.base.graph)
+        self._reset()
+
+    def _reset(self):
+        self._edge_copies = dict()
+        self.node.clear_delta()
+        for mapping in self._adjacencies():
+            mapping.clear_delta()
+
+
+class OverlayDiGraph(_OverlayMixin, nx.DiGraph):
+    """Copy-on-write overlay of a directed graph.
+
+    The overlay presents the API of `networkx.DiGraph` over a base
+    graph, which is never modified by the operations on the overlay:
+    nodes, adjacencies and attributes of the base are copied the
+    first time they are accessed, the cost of creating an overlay
+    and of rewriting it is proportional to the size of the
+    modified part of the graph. The base must not be modified
+    while the overlay is in use.
+
+    The result is either turned into an independent graph with
+    `materialize`, or written to the base with `commit`. Copying
+    or pickling an overlay materializes it.
+
+    Attributes
+    ----------
+    base : networkx.DiGraph
+        Base graph of the overlay
+    """
+
+    def __init__(self, base=None):
+        """Initialize an overlay of a graph (by default, of an empty one)."""
+        nx.DiGraph.__init__(self)
+        if base is None:
+            base = nx.DiGraph()
+        self._init_overlay(base)
+        self.succ = _OverlayDict(base.succ, self._copy_neighbours)
+        self.pred = _OverlayDict(base.pred, self._copy_neighbours)
+        self.adj = self.succ
+        self.edge = self.succ
+
+    def _adjacencies(self):
+        return [self.succ, self.pred]
+
+
+class OverlayGraph(_OverlayMixin, nx.Graph):
+    """Copy-on-write overlay of an undirected graph.
+
+    See `OverlayDiGraph`.
+
+    Attributes
+    ----------
+    base : networkx.Graph
+        Base graph of the overlay
+    """
+
+    def __init__(self, base=None):
+        """Initialize an overlay of a graph (by default, of an empty one)."""
+        nx.Graph.__init__(self)
+        if base is None:
+            base = nx.Graph()
+        self._init_overlay(base)
+        self.adj = _OverlayDict(base.adj, self._copy_neighbours)
+        self.edge = self.adj
+
+    def _adjacencies(self):
+        return [self.adj]
+
+
+def _identity(graph):
+    return graph
+
+
+def overlay_graph(graph):
+    """Create a copy-on-write overlay of a graph.
+
+    Parameters
+    ----------
+    graph : networkx.(Di)Graph
+
+    Returns
+    -------
+    overlay : regraph.networkx.overlay.OverlayDiGraph or OverlayGraph
+    """
+    if graph.is_directed():
+        return OverlayDiGraph(graph)
+    else:
+        return OverlayGraph(graph)
@@ -4,6 +4,8 @@ import copy
 import networkx as nx
 import warnings
 
+from concurrent.futures import ProcessPoolExecutor
+
 from regraph.networkx.category_utils import (compose,
                                              compose_chain,
                                              compose_relation_dicts,
@@ -17,7 +19,7 @@ from regraph.networkx.category_utils import (compose,
 from regraph.networkx import primitives
 from regraph.exceptions import TotalityWarning
 from regraph.rules import Rule
-from regraph.utils import keys_by_value
+from regraph.utils import DeltaMapping, IndexedMapping
 
 
 def _rewrite_base(hierarchy, graph_id, rule, instance,
@@ -34,15 +36,19 @@ def _rewrite_base(hierarchy, graph_id, rule, instance,
         relation_updates.append((graph_id, related_g))
 
     updated_homomorphisms = dict()
+    plan = rule.plan()
 
     for typing_graph in hierarchy.successors(graph_id):
 
-        new_hom = copy.deepcopy(hierarchy.edge[graph_id][typing_graph].mapping)
+        # Layer of changes over the current typing, only the typing
+        # of the rewritten nodes is modified
+        new_hom = DeltaMapping.layer(
+            hierarchy.edge[graph_id][typing_graph].mapping)
         removed_nodes = set()
         new_nodes = dict()
 
         for node in rule.lhs.nodes():
-            p_keys = keys_by_value(rule.p_lhs, node)
+            p_keys = plan.lhs_preimages[node]
             # nodes that were removed
             if len(p_keys) == 0:
                 removed_nodes.add(instance[node])
@@ -62,7 +68,7 @@ def _rewrite_base(hierarchy, graph_id, rule, instance,
                         removed_nodes.add(r_g_prime[rule.p_rhs[k]])
 
         for node in rule.rhs.nodes():
-            p_keys = keys_by_value(rule.p_rhs, node)
+            p_keys = plan.rhs_preimages[node]
 
             # nodes that were added
             if len(p_keys) == 0:
@@ -78,8 +84,8 @@ def _rewrite_base(hierarchy, graph_id, rule, instance,
                 # assign new type of node
                 if typing_graph in rhs_typing.keys():
                     if node in rhs_typing[typing_graph].keys():
-                        new_type = list(rhs_typing[typing_graph][node])
-                        new_nodes[r_g_prime[node]] = new_type
+                        new_nodes[r_g_prime[node]] = list(rhs_typing[
+                            typing_graph][node])[0]
 
         # update homomorphisms
         for n in removed_nodes:
@@ -113,13 +119,15 @@ def _propagate_rule_to(graph, origin_typing, rule, instance, p_origin,
     p_removed_edge_attrs = rule.removed_edge_attrs()
     lhs_cloned_nodes = rule.cloned_nodes()
 
+    # the instances of the origin nodes are found with the inverse
+    # of the typings (see `regraph.utils.IndexedMapping`)
+    origin_typing = IndexedMapping.of(origin_typing)
     graph_prime_graph = id_of(graph.nodes())
-    graph_prime_origin = copy.deepcopy(origin_typing)
+    graph_prime_origin = IndexedMapping(dict(origin_typing))
 
     for lhs_node in rule.lhs.nodes():
         origin_node = instance[lhs_node]
-        g_nodes = keys_by_value(
-            origin_typing, origin_node)
+        g_nodes = origin_typing.preimage(origin_node)
         for node in g_nodes:
             if lhs_node in lhs_removed_nodes:
                 primitives.remove_node(
@@ -130,7 +138,7 @@ def _propagate_rule_to(graph, origin_typing, rule, instance, p_origin,
                 graph_prime_origin[node] = origin_node
 
     for lhs_node, p_nodes in lhs_cloned_nodes.items():
-        nodes_to_clone = keys_by_value(origin_typing, instance[lhs_node])
+        nodes_to_clone = origin_typing.preimage(instance[lhs_node])
         for node in nodes_to_clone:
             for i, p_node in enumerate(p_nodes):
                 if i == 0:
@@ -144,35 +152,74 @@ def _propagate_rule_to(graph, origin_typing, rule, instance, p_origin,
                     graph_prime_graph[new_name] = node
 
     for lhs_node, attrs in lhs_removed_node_attrs.items():
-        nodes_to_remove_attrs = keys_by_value(
-            origin_typing, instance[lhs_node])
+        nodes_to_remove_attrs = origin_typing.preimage(instance[lhs_node])
         for node in nodes_to_remove_attrs:
             primitives.remove_node_attrs(
                 graph_prime,
                 node, attrs)
 
     for p_u, p_v in p_removed_edges:
-        us = keys_by_value(graph_prime_origin, p_origin[p_u])
-        vs = keys_by_value(graph_prime_origin, p_origin[p_v])
+        us = graph_prime_origin.preimage(p_origin[p_u])
+        vs = graph_prime_origin.preimage(p_origin[p_v])
         for u in us:
             for v in vs:
-                if (u, v) in graph_prime.edges():
+                if primitives.exists_edge(graph_prime, u, v):
                     primitives.remove_edge(
                         graph_prime, u, v)
 
     for (p_u, p_v), attrs in p_removed_edge_attrs.items():
-        us = keys_by_value(origin_typing, p_origin[p_u])
-        vs = keys_by_value(origin_typing, p_origin[p_v])
+        us = graph_prime_origin.preimage(p_origin[p_u])
+        vs = graph_prime_origin.preimage(p_origin[p_v])
         for u in us:
             for v in vs:
-                primitives.removed_edge_attrs(
-                    graph_prime, u, v, attrs)
+                if primitives.exists_edge(graph_prime, u, v):
+                    primitives.remove_edge_attrs(
+                        graph_prime, u, v, attrs)
 
     return (graph_prime, graph_prime_graph, graph_prime_origin)
 
 
+def _propagation_task(shared_data, task):
+    rule, instance, p_origin = shared_data
+    kind, graph, typing, inplace = task
+    if kind == "restrictive":
+        return _propagate_rule_to(
+            graph, typing, rule, instance, p_origin, inplace)
+    else:
+        return pushout_from_relation(graph, rule.rhs, typing, inplace)
+
+
+def _worker_task(task):
+    return _propagation_task(*task)
+
+
+def _run_propagation(tasks, rule, instance, p_origin, workers=None):
+    """Run the propagation of a rule to a list of graphs.
+
+    Every task is a tuple (kind, graph, typing, inplace), where kind is
+    'restrictive' (`_propagate_rule_to` the graph typed by `typing`) or
+    'relaxing' (`pushout_from_relation` of the graph and the rhs of the
+    rule related by `typing`). The tasks are independent: they only
+    depend on the graphs and the typings before the rewriting. If
+    `workers` is specified (and greater than 1), the tasks are run by a
+    `concurrent.futures.ProcessPoolExecutor` (the rule and its instance
+    are sent with every task, the graphs are then always propagated
+    to the copies sent to the workers). The results
+    are returned in the order of the tasks.
+    """
+    shared_data = (rule, instance, p_origin)
+    if workers is None or workers <= 1 or len(tasks) < 2:
+        return [_propagation_task(shared_data, task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(
+            _worker_task,
+            [(shared_data, (kind, graph, typing, True))
+             for kind, graph, typing, _ in tasks]))
+
+
 def _propagate_up(hierarchy, graph_id, rule, instance,
-                  p_origin_m, origin_m_origin_prime, inplace=False):
+                  p_origin_m, origin_m_origin_prime, inplace=False,
+                  workers=None):
     updated_graphs = dict()
     updated_homomorphisms = dict()
     updated_relations = set()
@@ -180,153 +227,161 @@ def _propagate_up(hierarchy, graph_id, rule, instance,
     updated_rule_h = dict()
 
     if rule.is_restrictive():
-        for graph in nx.bfs_tree(hierarchy, graph_id, reverse=True):
-            if graph != graph_id:
-                if isinstance(hierarchy.node[graph], hierarchy.graph_node_cls):
-
-                    origin_typing = hierarchy.get_typing(graph, graph_id)
-                    (graph_prime, graph_prime_graph, graph_prime_origin) =\
-                        _propagate_rule_to(
-                            hierarchy.node[graph].graph,
-                            origin_typing, rule, instance,
-                            p_origin_m, inplace)
-                    updated_graphs[graph] =\
-                        (graph_prime, graph_prime_graph, None, graph_prime_origin)
-
-                    graph_successors = hierarchy.successors(graph)
-                    if graph_id in graph_successors:
-                        updated_homomorphisms[(graph, graph_id)] =\
-                            compose(
-                                graph_prime_origin,
-                                origin_m_origin_prime)
-
-                    if len(rule.removed_nodes()) > 0 or\
-                       len(rule.cloned_nodes()) > 0:
-                        for suc in graph_successors:
-                            if suc != graph_id:
-                                if suc in updated_graphs.keys():
-                                    graph_prime_suc_prime =\
-                                        get_unique_map_to_pullback(
-                                            updated_graphs[suc][0].nodes(),
-                                            updated_graphs[suc][1],
-                                            updated_graphs[suc][3],
-                                            compose(
-                                                graph_prime_graph,
-                                                hierarchy.edge[graph][suc].mapping),
-                                            graph_prime_origin)
-                                else:
-                                    graph_prime_suc_prime = compose(
-                                        graph_prime_graph, hierarchy.edge[graph][suc].mapping)
+        graphs = [
+            graph for graph in nx.bfs_tree(hierarchy, graph_id, reverse=True)
+            if graph != graph_id
+        ]
+        # 1. Propagate the rule to every graph (and every rule)
+        # typed by `graph_id` (the results do not depend on each other)
+        tasks = []
+        for graph in graphs:
+            if isinstance(hierarchy.node[graph], hierarchy.graph_node_cls):
+                tasks.append((
+                    "restrictive", hierarchy.node[graph].graph,
+                    hierarchy.get_typing(graph, graph_id), inplace))
+            else:
+                rule_to_rewrite = hierarchy.node[graph].rule
+                (lhs_origin_typing,
+                 p_origin_typing,
+                 rhs_origin_typing) =\
+                    hierarchy.get_rule_typing(graph, graph_id)
+                tasks += [
+                    ("restrictive", rule_to_rewrite.lhs,
+                     lhs_origin_typing, False),
+                    ("restrictive", rule_to_rewrite.p,
+                     p_origin_typing, False),
+                    ("restrictive", rule_to_rewrite.rhs,
+                     rhs_origin_typing, False)
+                ]
+        results = iter(_run_propagation(
+            tasks, rule, instance, p_origin_m, workers))
+
+        # 2. Update the homomorphisms in the order of the traversal
+        for graph in graphs:
+            if isinstance(hierarchy.node[graph], hierarchy.graph_node_cls):
+                (graph_prime, graph_prime_graph, graph_prime_origin) =\
+                    next(results)
+                updated_graphs[graph] =\
+                    (graph_prime, graph_prime_graph, None, graph_prime_origin)
+
+                graph_successors = hierarchy.successors(graph)
+                if graph_id in graph_successors:
+                    updated_homomorphisms[(graph, graph_id)] =\
+                        compose(
+                            graph_prime_origin,
+                            origin_m_origin_prime)
+
+                if len(rule.removed_nodes()) > 0 or\
+                   len(rule.cloned_nodes()) > 0:
+                    for suc in graph_successors:
+                        if suc != graph_id:
+                            if suc in updated_graphs.keys():
+                                graph_prime_suc_prime =\
+                                    get_unique_map_to_pullback(
+                                        updated_graphs[suc][0].nodes(),
+                                        updated_graphs[suc][1],
+                                        updated_graphs[suc][3],
+                                        compose(
+                                            graph_prime_graph,
+                                            hierarchy.edge[graph][suc].mapping),
+                                        graph_prime_origin)
+                            else:
+                                graph_prime_suc_prime = compose(
+                                    graph_prime_graph, hierarchy.edge[graph][suc].mapping)
 
-                                updated_homomorphisms[(graph, suc)] = graph_prime_suc_prime
+                            updated_homomorphisms[(graph, suc)] = graph_prime_suc_prime
 
-                        for pred in hierarchy.predecessors(graph):
-                            if pred in updated_graphs.keys():
-                                pred_m_graph_m = get_unique_map_to_pullback(
-                                    graph_prime.nodes(),
-                                    graph_prime_graph,
-                                    graph_prime_origin,
-                                    updated_graphs[pred][1],
-                                    updated_graphs[pred][3]
-                                )
-                                updated_homomorphisms[
-                                    (pred, graph)] = pred_m_graph_m
-
-                        # propagate changes to adjacent relations
-                        for related_g in hierarchy.adjacent_relations(graph):
-                            updated_relations.add((graph, related_g))
-                else:
-                    rule_to_rewrite = hierarchy.node[graph].rule
-
-                    (lhs_origin_typing,
-                     p_origin_typing,
-                     rhs_origin_typing) =\
-                        hierarchy.get_rule_typing(graph, graph_id)
-
-                    (lhs_prime, lhs_prime_lhs, lhs_prime_origin) =\
-                        _propagate_rule_to(
-                            rule_to_rewrite.lhs,
-                            lhs_origin_typing, rule, instance,
-                            p_origin_m, inplace=False)
-
-                    (pr_prime, pr_prime_pr, pr_prime_origin) =\
-                        _propagate_rule_to(
-                            rule_to_rewrite.p,
-                            p_origin_typing, rule, instance,
-                            p_origin_m, inplace=False)
-
-                    (rhs_prime, rhs_prime_rhs, rhs_prime_origin) =\
-                        _propagate_rule_to(
-                            rule_to_rewrite.rhs,
-                            rhs_origin_typing, rule, instance,
-                            p_origin_m, inplace=False)
-
-                    # find p_m -> lhs_m
-                    new_p_lhs = get_unique_map_to_pullback(
-                        lhs_prime.nodes(),
-                        lhs_prime_lhs,
-                        lhs_prime_origin,
-                        compose(pr_prime_pr, rule_to_rewrite.p_lhs),
-                        pr_prime_origin
-                    )
-
-                    # find p_m -> rhs_m
-                    new_p_rhs = get_unique_map_to_pullback(
-                        rhs_prime.nodes(),
-                        rhs_prime_rhs,
-                        rhs_prime_origin,
-                        compose(pr_prime_pr, rule_to_rewrite.p_rhs),
-                        pr_prime_origin
-                    )
-
-                    new_rule =\
-                        Rule(pr_prime, lhs_prime, rhs_prime,
-                             new_p_lhs, new_p_rhs)
-
-                    updated_rules[graph] = new_rule
-
-                    for suc in hierarchy.successors(graph):
-                        if suc == graph_id:
-                            lhs_prime_suc_prime =\
-                                compose(lhs_prime_origin,
-                                        origin_m_origin_prime)
-                            rhs_prime_suc_prime =\
-                                compose(rhs_prime_origin,
-                                        origin_m_origin_prime)
-
-                        if suc in updated_graphs.keys():
-                            lhs_prime_suc_prime = get_unique_map_to_pullback(
-                                updated_graphs[suc][0].nodes(),
-                                updated_graphs[suc][1],
-                                updated_graphs[suc][3],
-                                compose(
-                                    lhs_prime_lhs,
-                                    hierarchy.edge[graph][suc].lhs_mapping),
-                                lhs_prime_origin
-                            )
-                            rhs_prime_suc_prime = get_unique_map_to_pullback(
-                                updated_graphs[suc][0].nodes(),
-                                updated_graphs[suc][1],
-                                updated_graphs[suc][3],
-                                compose(
-                                    rhs_prime_rhs,
-                                    hierarchy.edge[graph][suc].rhs_mapping
-                                ),
-                                rhs_prime_origin
+                    for pred in hierarchy.predecessors(graph):
+                        if pred in updated_graphs.keys():
+                            pred_m_graph_m = get_unique_map_to_pullback(
+                                graph_prime.nodes(),
+                                graph_prime_graph,
+                                graph_prime_origin,
+                                updated_graphs[pred][1],
+                                updated_graphs[pred][3]
                             )
+                            updated_homomorphisms[
+                                (pred, graph)] = pred_m_graph_m
 
-                        else:
-                            lhs_prime_suc_prime =\
-                                compose(
-                                    lhs_prime_lhs,
-                                    hierarchy.edge[graph][suc].lhs_mapping)
-                            rhs_prime_suc_prime =\
-                                compose(
-                                    rhs_prime_rhs,
-                                    hierarchy.edge[graph][suc].rhs_mapping)
+                    # propagate changes to adjacent relations
+                    for related_g in hierarchy.adjacent_relations(graph):
+                        updated_relations.add((graph, related_g))
+            else:
+                rule_to_rewrite = hierarchy.node[graph].rule
+
+                (lhs_prime, lhs_prime_lhs, lhs_prime_origin) =\
+                    next(results)
+                (pr_prime, pr_prime_pr, pr_prime_origin) =\
+                    next(results)
+                (rhs_prime, rhs_prime_rhs, rhs_prime_origin) =\
+                    next(results)
+
+                # find p_m -> lhs_m
+                new_p_lhs = get_unique_map_to_pullback(
+                    lhs_prime.nodes(),
+                    lhs_prime_lhs,
+                    lhs_prime_origin,
+                    compose(pr_prime_pr, rule_to_rewrite.p_lhs),
+                    pr_prime_origin
+                )
+
+                # find p_m -> rhs_m
+                new_p_rhs = get_unique_map_to_pullback(
+                    rhs_prime.nodes(),
+                    rhs_prime_rhs,
+                    rhs_prime_origin,
+                    compose(pr_prime_pr, rule_to_rewrite.p_rhs),
+                    pr_prime_origin
+                )
+
+                new_rule =\
+                    Rule(pr_prime, lhs_prime, rhs_prime,
+                         new_p_lhs, new_p_rhs)
+
+                updated_rules[graph] = new_rule
+
+                for suc in hierarchy.successors(graph):
+                    if suc == graph_id:
+                        lhs_prime_suc_prime =\
+                            compose(lhs_prime_origin,
+                                    origin_m_origin_prime)
+                        rhs_prime_suc_prime =\
+                            compose(rhs_prime_origin,
+                                    origin_m_origin_prime)
+
+                    if suc in updated_graphs.keys():
+                        lhs_prime_suc_prime = get_unique_map_to_pullback(
+                            updated_graphs[suc][0].nodes(),
+                            updated_graphs[suc][1],
+                            updated_graphs[suc][3],
+                            compose(
+                                lhs_prime_lhs,
+                                hierarchy.edge[graph][suc].lhs_mapping),
+                            lhs_prime_origin
+                        )
+                        rhs_prime_suc_prime = get_unique_map_to_pullback(
+                            updated_graphs[suc][0].nodes(),
+                            updated_graphs[suc][1],
+                            updated_graphs[suc][3],
+                            compose(
+                                rhs_prime_rhs,
+                                hierarchy.edge[graph][suc].rhs_mapping
+                            ),
+                            rhs_prime_origin
+                        )
+
+                    else:
+                        lhs_prime_suc_prime =\
+                            compose(
+                                lhs_prime_lhs,
+                                hierarchy.edge[graph][suc].lhs_mapping)
+                        rhs_prime_suc_prime =\
+                            compose(
+                                rhs_prime_rhs,
+                                hierarchy.edge[graph][suc].rhs_mapping)
 
-                        updated_rule_h[(graph, suc)] =\
-                            (lhs_prime_suc_prime, rhs_prime_suc_prime)
+                    updated_rule_h[(graph, suc)] =\
+                        (lhs_prime_suc_prime, rhs_prime_suc_prime)
 
     else:
         for pred in hierarchy.predecessors(graph_id):
@@ -355,7 +410,8 @@ def _propagate_up(hierarchy, graph_id, rule, instance,
 
 
 def _propagate_down(hierarchy, origin_id, origin_construct,
-                    rule, instance, rhs_typing_rels, inplace=False):
+                    rule, instance, rhs_typing_rels, inplace=False,
+                    workers=None):
     """Propagate changes down the hierarchy."""
     updated_graphs = dict()
     updated_homomorphisms = dict()
@@ -368,61 +424,71 @@ def _propagate_down(hierarchy, origin_id, origin_construct,
      rhs_origin_prime) = origin_construct
 
     if rule.is_relaxing():
-        for graph in nx.bfs_tree(hierarchy, origin_id):
-            if graph != origin_id:
-                relation_g_rhs = set()
-                for key, values in rhs_typing_rels[graph].items():
-                    for v in values:
-                        relation_g_rhs.add((v, key))
-
-                (g_prime, g_g_prime, rhs_g_prime) =\
-                    pushout_from_relation(
-                        hierarchy.node[graph].graph, rule.rhs,
-                        relation_g_rhs, inplace)
-                updated_graphs[graph] = (g_prime, g_g_prime, rhs_g_prime)
-
-                graph_predecessors = hierarchy.predecessors(graph)
-                if origin_id in graph_predecessors:
-                    updated_homomorphisms[(origin_id, graph)] =\
-                        get_unique_map_from_pushout(
-                            origin_prime.nodes(),
-                            origin_m_origin_prime,
-                            rhs_origin_prime,
-                            compose_chain(
-                                [origin_m_origin,
-                                 hierarchy.edge[origin_id][graph].mapping,
-                                 g_g_prime]),
-                            rhs_g_prime)
-
-                if len(rule.added_nodes()) > 0 or\
-                   len(rule.merged_nodes()) > 0:
-                    for pred in hierarchy.predecessors(graph):
-                        if pred in updated_graphs.keys():
-                            if pred != origin_id:
-                                updated_homomorphisms[(pred, graph)] =\
-                                    get_unique_map_from_pushout(
-                                        updated_graphs[pred][0].nodes(),
-                                        updated_graphs[pred][1],
-                                        updated_graphs[pred][2],
-                                        compose(
-                                            hierarchy.edge[pred][graph].mapping,
-                                            g_g_prime),
-                                        rhs_g_prime)
-                    for suc in hierarchy.successors(graph):
-                        if suc in updated_graphs.keys():
-                            updated_homomorphisms[(graph, suc)] =\
+        graphs = [
+            graph for graph in nx.bfs_tree(hierarchy, origin_id)
+            if graph != origin_id
+        ]
+        # 1. Compute the pushouts of every graph typing `origin_id`
+        # (the results do not depend on each other)
+        tasks = []
+        for graph in graphs:
+            relation_g_rhs = set()
+            for key, values in rhs_typing_rels[graph].items():
+                for v in values:
+                    relation_g_rhs.add((v, key))
+            tasks.append((
+                "relaxing", hierarchy.node[graph].graph,
+                relation_g_rhs, inplace))
+        results = iter(_run_propagation(
+            tasks, rule, instance, None, workers))
+
+        # 2. Update the homomorphisms in the order of the traversal
+        for graph in graphs:
+            (g_prime, g_g_prime, rhs_g_prime) = next(results)
+            updated_graphs[graph] = (g_prime, g_g_prime, rhs_g_prime)
+
+            graph_predecessors = hierarchy.predecessors(graph)
+            if origin_id in graph_predecessors:
+                updated_homomorphisms[(origin_id, graph)] =\
+                    get_unique_map_from_pushout(
+                        origin_prime.nodes(),
+                        origin_m_origin_prime,
+                        rhs_origin_prime,
+                        compose_chain(
+                            [origin_m_origin,
+                             hierarchy.edge[origin_id][graph].mapping,
+                             g_g_prime]),
+                        rhs_g_prime)
+
+            if len(rule.added_nodes()) > 0 or\
+               len(rule.merged_nodes()) > 0:
+                for pred in hierarchy.predecessors(graph):
+                    if pred in updated_graphs.keys():
+                        if pred != origin_id:
+                            updated_homomorphisms[(pred, graph)] =\
                                 get_unique_map_from_pushout(
-                                    g_prime.nodes(),
-                                    g_g_prime,
-                                    rhs_g_prime,
+                                    updated_graphs[pred][0].nodes(),
+                                    updated_graphs[pred][1],
+                                    updated_graphs[pred][2],
                                     compose(
-                                        hierarchy.edge[graph][suc].mapping,
-                                        updated_graphs[suc][1]),
-                                    updated_graphs[suc][2])
-                if len(rule.merged_nodes()) > 0:
-                    # propagate changes to adjacent relations
-                    for related_g in hierarchy.adjacent_relations(graph):
-                        updated_relations.append((graph, related_g))
+                                        hierarchy.edge[pred][graph].mapping,
+                                        g_g_prime),
+                                    rhs_g_prime)
+                for suc in hierarchy.successors(graph):
+                    if suc in updated_graphs.keys():
+                        updated_homomorphisms[(graph, suc)] =\
+                            get_unique_map_from_pushout(
+                                g_prime.nodes(),
+                                g_g_prime,
+                                rhs_g_prime,
+                                compose(
+                                    hierarchy.edge[graph][suc].mapping,
+                                    updated_graphs[suc][1]),
+                                updated_graphs[suc][2])
+            if len(rule.merged_nodes()) > 0:
+                # propagate changes to adjacent relations
+                for related_g in hierarchy.adjacent_relations(graph):
+                    updated_relations.append((graph, related_g))
 
     else:
         for suc in hierarchy.successors(origin_id):
@@ -537,17 +603,18 @@ def _apply_changes(hierarchy, upstream_changes, downstream_changes):
     # update graphs
     for graph, (graph_m, _, graph_prime, _) in upstream_changes["graphs"].items():
         if graph_prime is not None:
-            hierarchy.node[graph].graph = graph_prime
+            hierarchy._set_graph(graph, graph_prime)
         else:
-            hierarchy.node[graph].graph = graph_m
-        hierarchy.graph[graph] = hierarchy.node[graph].graph
+            hierarchy._set_graph(graph, graph_m)
 
     if "graphs" in downstream_changes.keys():
         for graph, (graph_prime, _, _) in downstream_changes["graphs"].items():
-            hierarchy.node[graph].graph = graph_prime
-            hierarchy.graph[graph] = hierarchy.node[graph].graph
+            hierarchy._set_graph(graph, graph_prime)
 
     for (g1, g2), rel in rels.items():
+        for (left, right) in [(g1, g2), (g2, g1)]:
+            hierarchy._record(hierarchy.relation_edge[left], right)
+            hierarchy._record(hierarchy.relation[left], right)
         old_attrs = copy.deepcopy(hierarchy.relation_edge[g1][g2].attrs)
         hierarchy.remove_relation(g1, g2)
         hierarchy.add_relation(g1, g2, rel, old_attrs)
@@ -559,21 +626,41 @@ def _apply_changes(hierarchy, upstream_changes, downstream_changes):
         updated_homomorphisms.update(downstream_changes["homomorphisms"])
 
     for (s, t), mapping in updated_homomorphisms.items():
+        hierarchy._record(hierarchy.edge[s], t)
+        hierarchy._record(hierarchy.typing[s], t)
+        # the inverse of a layered typing is carried over from
+        # the typing it replaces
+        mapping = IndexedMapping.of(mapping)
+        mapping.adopt_inverse(hierarchy.edge[s][t].mapping)
         hierarchy.edge[s][t] = hierarchy.graph_typing_cls(
             mapping, hierarchy.edge[s][t].attrs
         )
         hierarchy.typing[s][t] = hierarchy.edge[s][t].mapping
     # update rules & rule homomorphisms
     for rule, new_rule in upstream_changes["rules"].items():
+        hierarchy._record(hierarchy.node, rule)
+        hierarchy._record(hierarchy.rule, rule)
         hierarchy.node[rule] = hierarchy.rule_node_cls(
             new_rule, hierarchy.node[rule].attrs
         )
         hierarchy.rule[rule] = hierarchy.node[rule].rule
     for (s, t), (lhs_h, rhs_h) in upstream_changes["rule_homomorphisms"].items():
+        hierarchy._record(hierarchy.edge[s], t)
+        hierarchy._record(hierarchy.rule_lhs_typing[s], t)
+        hierarchy._record(hierarchy.rule_rhs_typing[s], t)
         hierarchy.edge[s][t] = hierarchy.rule_typing_cls(
             lhs_h, rhs_h,
             hierarchy.edge[s][t].attrs
         )
         hierarchy.rule_lhs_typing[s][t] = hierarchy.edge[s][t].lhs_mapping
         hierarchy.rule_rhs_typing[s][t] = hierarchy.edge[s][t].rhs_mapping
+
+    changed_graphs = set(upstream_changes["graphs"].keys())
+    if "graphs" in downstream_changes.keys():
+        changed_graphs.update(downstream_changes["graphs"].keys())
+    changed_graphs.update(s for s, _ in updated_homomorphisms.keys())
+    changed_graphs.update(upstream_changes["rules"].keys())
+    changed_graphs.update(
+        s for s, _ in upstream_changes["rule_homomorphisms"].keys())
+    hierarchy._clear_typing_indices(*changed_graphs)
     return
@@ -0,0 +1,117 @@
+"""Transactions on hierarchies of networkx graphs.
+
+* `HierarchyTransaction` -- journal of the modifications of a
+  hierarchy, allows to commit or to roll back a sequence of
+  rewritings at a cost proportional to the size of the changes.
+"""
+from regraph.exceptions import ReGraphError
+from regraph.networkx.overlay import overlay_graph
+
+
+class HierarchyTransaction(object):
+    """Transaction on a hierarchy.
+
+    When a transaction is started, the graphs of the hierarchy are
+    replaced by copy-on-write overlays (see `regraph.networkx.overlay`),
+    so the primitive transformations applied to the graphs (either by
+    `NetworkXHierarchy.rewrite` or directly with `regraph.primitives`)
+    are kept in the overlays. The modifications of the typings, of the
+    rules and of the relations of the hierarchy applied by the
+    rewriting are recorded in an undo journal. Committing a transaction
+    writes the overlays to the original graph objects, rolling it back
+    restores the hierarchy from the journal.
+
+    Structural modifications of the hierarchy (adding or removing
+    graphs, rules, typings and relations) and modifications of the
+    typings performed outside of the rewriting are not recorded.
+
+    Transactions are used as context managers: the transaction is
+    committed at the exit of the block, or rolled back if an exception
+    was raised.
+
+    >>> with hierarchy.transaction() as tx:
+    ...     hierarchy.rewrite("g", rule, instance)
+    ...     if not valid(hierarchy):
+    ...         tx.rollback()
+
+    Attributes
+    ----------
+    hierarchy : regraph.networkx.hierarchy.NetworkXHierarchy
+    """
+
+    def __init__(self, hierarchy):
+        """Start a transaction on a hierarchy."""
+        if hierarchy._journal is not None:
+            raise ReGraphError(
+                "A transaction is already in progress on the hierarchy!")
+        self.hierarchy = hierarchy
+        # Undo journal: (dictionary, key, key existed, old value)
+        self.journal = []
+        # Overlays created by the transaction: graph id -> overlay
+        self._overlays = dict()
+        hierarchy._journal = self.journal
+
+        for node_id in hierarchy.nodes():
+            node = hierarchy.node[node_id]
+            if isinstance(node, hierarchy.graph_node_cls):
+                graph = overlay_graph(node.graph)
+                self._overlays[node_id] = graph
+                hierarchy._set_graph(node_id, graph)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.active:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        return False
+
+    @property
+    def active(self):
+        """Test if the transaction is in progress."""
+        return self.hierarchy._journal is self.journal
+
+    def commit(self):
+        """Commit the transaction.
+
+        The modifications of the graphs are written to the graph
+        objects of the hierarchy from the beginning of the transaction,
+        if they are still used by the hierarchy.
+        """
+        self._check_active()
+        hierarchy = self.hierarchy
+        hierarchy._journal = None
+        for node_id, graph in self._overlays.items():
+            if node_id in hierarchy.nodes() and\
+               isinstance(hierarchy.node[node_id], hierarchy.graph_node_cls) and\
+               hierarchy.node[node_id].graph is graph:
+                graph.commit()
+                hierarchy._set_graph(node_id, graph.base)
+        self.journal = []
+        self._overlays = dict()
+
+    def rollback(self):
+        """Roll back the transaction."""
+        self._check_active()
+        hierarchy = self.hierarchy
+        hierarchy._journal = None
+        for mapping, key, existed, value in reversed(self.journal):
+            if existed:
+                mapping[key] = value
+            elif key in mapping:
+                del mapping[key]
+        self.journal = []
+        self._overlays = dict()
+        hierarchy._clear_typing_indices()
+        for matcher in list(hierarchy._incremental_matchers):
+            if matcher.graph_id in hierarchy.nodes():
+                matcher.refresh()
+            else:
+                matcher.detach()
+
+    def _check_active(self):
+        if not self.active:
+            raise ReGraphError("Transaction is not in progress!")
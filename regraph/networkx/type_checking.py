@@ -46,89 +46,179 @@ def _check_rule_typing(hierarchy, rule_id, graph_id, lhs_mapping, rhs_mapping):
     return
 
 
+def _commute(h1, h2):
+    """Test if two homomorphisms coincide (stops at the first mismatch)."""
+    if len(h1) != len(h2):
+        return False
+    for key, value in h1.items():
+        if key not in h2 or h2[key] != value:
+            return False
+    return True
+
+
+def _rule_ancestors(hierarchy, rule_id):
+    """Return (lhs, rhs) typings of a rule by its (transitive) ancestors."""
+    ancestors = dict()
+    for graph in hierarchy.successors(rule_id):
+        lhs_mapping = hierarchy.edge[rule_id][graph].lhs_mapping
+        rhs_mapping = hierarchy.edge[rule_id][graph].rhs_mapping
+        if graph not in ancestors.keys():
+            ancestors[graph] = (lhs_mapping, rhs_mapping)
+        for anc, typing in hierarchy.get_ancestors(graph).items():
+            if anc not in ancestors.keys():
+                ancestors[anc] = (
+                    compose(lhs_mapping, typing),
+                    compose(rhs_mapping, typing))
+    return ancestors
+
+
 def _check_consistency(hierarchy, source, target, mapping=None):
-    all_paths = nx.all_pairs_shortest_path(hierarchy)
+    """Check that a new typing `source`->`target` commutes with the paths.
 
-    paths_to_source = {}
-    paths_from_target = {}
-    for s in hierarchy.nodes():
-        if source in all_paths[s].keys():
-            paths_to_source[s] = all_paths[s][source]
-        if s == target:
-            for key in all_paths[target].keys():
-                paths_from_target[key] = all_paths[target][key]
-
-    for s in paths_to_source.keys():
-        if hierarchy._path_from_rule(paths_to_source[s]):
-            for t in paths_from_target.keys():
-                # find homomorphism from s to t via new path
-                if s == source:
+    Only the paths going through the new edge are considered: for every
+    graph (or rule) `s` typed by `source` and every ancestor `t` of
+    `target`, the typing of `s` by `t` through the new edge is compared
+    with the existing typing of `s` by `t` (if any). The typings by the
+    ancestors are taken from the cache of the hierarchy
+    (see `get_ancestors`).
+    """
+    target_ancestors = dict(hierarchy.get_ancestors(target))
+    target_ancestors[target] = None
+
+    def _through_edge(s_source):
+        # typings of s by the ancestors of target through the new edge
+        s_target = compose(s_source, mapping)
+        for t, t_typing in target_ancestors.items():
+            if t_typing is None:
+                yield t, s_target
+            else:
+                yield t, compose(s_target, t_typing)
+
+    for s in nx.ancestors(hierarchy, source) | {source}:
+        if isinstance(hierarchy.node[s], hierarchy.rule_node_cls):
+            if s == source:
+                raise HierarchyError(
+                    "Found a rule typing some node in the hierarchy!"
+                )
+            existing = _rule_ancestors(hierarchy, s)
+            lhs_source, rhs_source = existing[source]
+            new_lhs = dict(_through_edge(lhs_source))
+            new_rhs = dict(_through_edge(rhs_source))
+            for t in target_ancestors.keys():
+                if t in existing.keys():
+                    lhs_h, rhs_h = existing[t]
+                    if not _commute(lhs_h, new_lhs[t]):
+                        raise HierarchyError(
+                            "Invalid lhs typing: homomorphism does "
+                            "not commute with an existing " +
+                            "path from '%s' to '%s'!" % (s, t)
+                        )
+                    if not _commute(rhs_h, new_rhs[t]):
+                        raise HierarchyError(
+                            "Invalid rhs typing: homomorphism does "
+                            "not commute with an existing " +
+                            "path from '%s' to '%s'!" % (s, t)
+                        )
+        else:
+            if s != source:
+                existing = hierarchy.get_ancestors(s)
+                s_source = existing[source]
+            else:
+                existing = hierarchy.get_ancestors(source)
+                s_source = dict([(key, key) for key in mapping.keys()])
+            for t, new_homomorphism in _through_edge(s_source):
+                if t in existing.keys() and\
+                   not _commute(existing[t], new_homomorphism):
                     raise HierarchyError(
-                        "Found a rule typing some node in the hierarchy!"
+                        "Homomorphism does not commute with an " +
+                        "existing path from '%s' to '%s'!" % (s, t)
                     )
-                new_lhs_h, new_rhs_h = hierarchy.compose_path_typing(
-                    paths_to_source[s])
-                new_lhs_h = compose(new_lhs_h, mapping)
-                new_rhs_h = compose(new_rhs_h, mapping)
-
-                if t != target:
-                    new_lhs_h = compose(
-                        new_lhs_h,
-                        hierarchy.compose_path_typing(paths_from_target[t])
-                    )
-                    new_rhs_h = compose(
-                        new_rhs_h,
-                        hierarchy.compose_path_typing(paths_from_target[t]),
-                    )
-                try:
-                    # find homomorphisms from s to t via other paths
-                    s_t_paths = nx.all_shortest_paths(hierarchy, s, t)
-                    for path in s_t_paths:
-                        lhs_h, rhs_h = hierarchy.compose_path_typing(path)
-                        if lhs_h != new_lhs_h:
-                            raise HierarchyError(
-                                "Invalid lhs typing: homomorphism does "
-                                "not commute with an existing " +
-                                "path from '%s' to '%s'!" % (s, t)
-                            )
-                        if rhs_h != new_rhs_h:
-                            raise HierarchyError(
-                                "Invalid rhs typing: homomorphism does "
-                                "not commute with an existing " +
-                                "path from '%s' to '%s'!" % (s, t)
-                            )
-                except(nx.NetworkXNoPath):
-                    pass
+
+
+def _check_relation(hierarchy, left, right, relation):
+    """Check that a relation is well-defined on `left` and `right`."""
+    for key, values in relation.items():
+        if key not in hierarchy.node[left].graph.nodes():
+            raise HierarchyError(
+                "Relation is not valid: node '%s' does not "
+                "exist in a graph '%s'" %
+                (key, left)
+            )
+        for v in values:
+            if v not in hierarchy.node[right].graph.nodes():
+                raise HierarchyError(
+                    "Relation is not valid: node '%s' does not "
+                    "exist in a graph '%s'" %
+                    (v, right)
+                )
+
+
+def _check_deferred(hierarchy, checks):
+    """Validate the typings and the relations added by a bulk load.
+
+    `checks` is a list of triples (kind, source, target), where kind is
+    'typing', 'rule_typing' or 'relation'. The commutativity of all the
+    paths of the hierarchy is checked by composing the typings once
+    in the topological order of the hierarchy, the composed typings
+    are stored in the cache of `hierarchy.get_ancestors`.
+    """
+    if not nx.is_directed_acyclic_graph(hierarchy):
+        raise HierarchyError("Hierarchy contains a cycle!")
+
+    for kind, s, t in checks:
+        if kind == "typing":
+            check_homomorphism(
+                hierarchy.node[s].graph,
+                hierarchy.node[t].graph,
+                hierarchy.edge[s][t].mapping,
+                total=True)
+        elif kind == "rule_typing":
+            typing = hierarchy.edge[s][t]
+            rule = hierarchy.node[s].rule
+            check_homomorphism(
+                rule.lhs, hierarchy.node[t].graph,
+                typing.lhs_mapping, total=typing.lhs_total)
+            check_homomorphism(
+                rule.rhs, hierarchy.node[t].graph,
+                typing.rhs_mapping, total=typing.rhs_total)
         else:
-            for t in paths_from_target.keys():
-                # find homomorphism from s to t via new path
-                if s != source:
-                    new_homomorphism = hierarchy.compose_path_typing(
-                        paths_to_source[s])
-                else:
-                    new_homomorphism = dict([(key, key)
-                                             for key, _ in mapping.items()])
-                new_homomorphism = compose(
-                    new_homomorphism, mapping)
-                if t != target:
-                    new_homomorphism = compose(
-                        new_homomorphism,
-                        hierarchy.compose_path_typing(paths_from_target[t])
+            _check_relation(hierarchy, s, t, hierarchy.relation[s][t])
+
+    if not any(kind != "relation" for kind, _, _ in checks):
+        return
+
+    hierarchy._clear_typing_indices()
+    closures = dict()
+
+    def _add_typing(ancestors, s, t, homomorphisms):
+        if t in ancestors.keys():
+            for h1, h2 in zip(ancestors[t], homomorphisms):
+                if not _commute(h1, h2):
+                    raise HierarchyError(
+                        "Homomorphism does not commute with an " +
+                        "existing path from '%s' to '%s'!" % (s, t)
                     )
+        else:
+            ancestors[t] = homomorphisms
 
-                # find homomorphisms from s to t via other paths
-                s_t_paths = nx.all_shortest_paths(hierarchy, s, t)
-                try:
-                    # check only the first path
-                    for path in s_t_paths:
-                        path_homomorphism = hierarchy.compose_path_typing(path)
-                        if path_homomorphism != new_homomorphism:
-                            raise HierarchyError(
-                                "Homomorphism does not commute with an " +
-                                "existing path from '%s' to '%s'!" % (s, t)
-                            )
-                except(nx.NetworkXNoPath):
-                        pass
+    for node in reversed(list(nx.topological_sort(hierarchy))):
+        ancestors = dict()
+        for suc in hierarchy.successors(node):
+            edge = hierarchy.edge[node][suc]
+            if isinstance(hierarchy.node[node], hierarchy.rule_node_cls):
+                homomorphisms = (edge.lhs_mapping, edge.rhs_mapping)
+            else:
+                homomorphisms = (dict(edge.mapping),)
+            _add_typing(ancestors, node, suc, homomorphisms)
+            for anc, typing in closures[suc].items():
+                _add_typing(
+                    ancestors, node, anc,
+                    tuple(compose(h, typing) for h in homomorphisms))
+        if isinstance(hierarchy.node[node], hierarchy.rule_node_cls):
+            continue
+        closures[node] = dict(
+            (anc, typing) for anc, (typing,) in ancestors.items())
+    hierarchy._ancestor_typings.update(closures)
 
 
 def _autocomplete_typing(hierarchy, graph_id, instance,
@@ -290,8 +380,9 @@ def _check_lhs_rhs_consistency(hierarchy, graph_id, rule, instance,
 def _check_totality(hierarchy, graph_id, rule, instance,
                     lhs_typing, rhs_typing):
     """"Check that everything is typed at the end of the rewriting."""
+    plan = rule.plan()
     for node in rule.rhs.nodes():
-        p_nodes = keys_by_value(rule.p_rhs, node)
+        p_nodes = plan.rhs_preimages[node]
         for typing_graph in hierarchy.successors(graph_id):
             typing = hierarchy.edge[graph_id][typing_graph].mapping
             # Totality can be broken in two cases
@@ -25,6 +25,10 @@ from regraph.exceptions import (ReGraphError,
                                 GraphAttrsWarning)
 from regraph.attribute_sets import FiniteSet
 from regraph.neo4j import Neo4jGraph
+from regraph.networkx import matching
+from regraph.networkx.indexing import (AttributeIndex,
+                                      get_attribute_index,
+                                      get_typing_indices)
 
 
 def add_node(graph, node_id, attrs=None):
@@ -50,9 +54,10 @@ def add_node(graph, node_id, attrs=None):
         else:
             new_attrs = deepcopy(attrs)
             normalize_attrs(new_attrs)
-        if node_id not in graph.nodes():
+        if node_id not in graph.node:
             graph.add_node(node_id)
             graph.node[node_id] = new_attrs
+            _update_indices(graph, node_id)
         else:
             raise GraphError("Node '%s' already exists!" % node_id)
     elif isinstance(graph, Neo4jGraph):
@@ -120,6 +125,7 @@ def add_node_attrs(graph, node, attrs):
                     node_attrs[key] = node_attrs[key].union(attrs[key])
                 else:
                     node_attrs[key] = attrs[key]
+        _update_indices(graph, node)
     elif isinstance(graph, Neo4jGraph):
         graph.add_node_attrs(node, attrs)
 
@@ -156,14 +162,19 @@ def add_edge(graph, s, t, attrs=None, **attr):
             )
 
     new_attrs = deepcopy(attrs)
-    if s not in graph.nodes():
+    if isinstance(graph, nx.Graph):
+        # networkx graphs provide constant time membership tests
+        nodes = graph.node
+    else:
+        nodes = graph.nodes()
+    if s not in nodes:
         raise GraphError("Node '%s' does not exist!" % s)
-    if t not in graph.nodes():
+    if t not in nodes:
         raise GraphError("Node '%s' does not exist!" % t)
     normalize_attrs(new_attrs)
 
     if isinstance(graph, nx.DiGraph):
-        if (s, t) in graph.edges():
+        if graph.has_edge(s, t):
             raise GraphError(
                 "Edge '%s'->'%s' already exists!" %
                 (s, t)
@@ -171,7 +182,7 @@ def add_edge(graph, s, t, attrs=None, **attr):
         # print(s, t, type(s), type(t), new_attrs, type(new_attrs))
         graph.add_edge(s, t, attr_dict=new_attrs)
     elif isinstance(graph, nx.Graph):
-        if (s, t) in graph.edges() or (t, s) in graph.edges():
+        if graph.has_edge(s, t):
             raise GraphError(
                 "Edge '%s'->'%s' already exists!" %
                 (s, t)
@@ -200,12 +211,12 @@ def remove_edge(graph, s, t):
     """
     if isinstance(graph, nx.DiGraph) or\
        isinstance(graph, Neo4jGraph):
-        if (s, t) not in graph.edges():
+        if not exists_edge(graph, s, t):
             raise GraphError(
                 "Edge '%s->%s' does not exist!" % (str(s), str(t)))
         graph.remove_edge(s, t)
     elif isinstance(graph, nx.Graph):
-        if (s, t) not in graph.edges() and (t, s) not in graph.edges():
+        if not exists_edge(graph, s, t):
             raise GraphError(
                 "Edge '%s->%s' does not exist!" % (str(s), str(t)))
         graph.remove_edge(s, t)
@@ -293,12 +304,13 @@ def remove_node(graph, node_id):
         If a node with the specified id does not exist.
 
     """
-    if node_id in graph.nodes():
+    if exists_node(graph, node_id):
         if isinstance(graph, nx.DiGraph) or\
            isinstance(graph, nx.Graph):
             neighbors = set(graph.__getitem__(node_id).keys())
             neighbors -= {node_id}
             graph.remove_node(node_id)
+            _update_indices(graph, node_id)
         elif isinstance(graph, Neo4jGraph):
             graph.remove_node(node_id)
     else:
@@ -323,7 +335,7 @@ def update_node_attrs(graph, node_id, attrs):
 
     """
     new_attrs = deepcopy(attrs)
-    if node_id not in graph.nodes():
+    if not exists_node(graph, node_id):
         raise GraphError("Node '%s' does not exist!" % str(node_id))
     elif new_attrs is None:
         warnings.warn(
@@ -335,6 +347,7 @@ def update_node_attrs(graph, node_id, attrs):
         if isinstance(graph, nx.DiGraph) or\
            isinstance(graph, nx.Graph):
             graph.node[node_id] = new_attrs
+            _update_indices(graph, node_id)
         elif isinstance(graph, Neo4jGraph):
             graph.set_node_attrs(node_id, new_attrs, update=True)
 
@@ -355,7 +368,7 @@ def remove_node_attrs(graph, node_id, attrs):
     GraphError
         If a node with the specified id does not exist.
     """
-    if node_id not in graph.nodes():
+    if not exists_node(graph, node_id):
         raise GraphError("Node '%s' does not exist!" % str(node_id))
     elif attrs is None:
         warnings.warn(
@@ -375,6 +388,7 @@ def remove_node_attrs(graph, node_id, attrs):
                     del old_attrs[key]
                 else:
                     old_attrs[key] = new_set
+        _update_indices(graph, node_id)
     elif isinstance(graph, Neo4jGraph):
         graph.remove_node_attrs(node_id, attrs)
 
@@ -506,6 +520,21 @@ def get_edge(graph, s, t):
         return graph.get_edge_attrs(s, t)
 
 
+def exists_node(graph, node_id):
+    """Check if a node exists.
+
+    Parameters
+    ----------
+    graph : networkx.(Di)Graph
+    node_id : hashable, node id.
+    """
+    if isinstance(graph, nx.Graph):
+        # networkx graphs provide constant time membership tests
+        return node_id in graph.node
+    else:
+        return node_id in graph.nodes()
+
+
 def exists_edge(graph, s, t):
     """Check if an edge exists.
 
@@ -613,7 +642,7 @@ def clone_node(graph, node_id, name=None):
     [(1, 2), (1, "2_clone"), (3, 2), (3, "2_clone")]
 
     """
-    if node_id not in graph.nodes():
+    if not exists_node(graph, node_id):
         raise GraphError("Node '%s' does not exist!" % str(node_id))
 
     if isinstance(graph, nx.DiGraph) or\
@@ -622,27 +651,28 @@ def clone_node(graph, node_id, name=None):
         if name is None:
             i = 1
             new_node = str(node_id) + str(i)
-            while new_node in graph.nodes():
+            while exists_node(graph, new_node):
                 i += 1
                 new_node = str(node_id) + str(i)
         else:
-            if name in graph.nodes():
+            if exists_node(graph, name):
                 raise GraphError("Node '%s' already exists!" % str(name))
             else:
                 new_node = name
 
         graph.add_node(new_node, deepcopy(get_node(graph, node_id)))
+        _update_indices(graph, new_node)
 
         # Connect all the edges
         if graph.is_directed():
             add_edges_from(
                 graph,
                 set([(n, new_node) for n, _ in graph.in_edges(node_id)
-                     if (n, new_node) not in graph.edges()]))
+                     if not exists_edge(graph, n, new_node)]))
             add_edges_from(
                 graph,
                 set([(new_node, n) for _, n in graph.out_edges(node_id)
-                     if (new_node, n) not in graph.edges()]))
+                     if not exists_edge(graph, new_node, n)]))
 
             # Copy the attributes of the edges
             for s, t in graph.in_edges(node_id):
@@ -657,8 +687,7 @@ def clone_node(graph, node_id, name=None):
             add_edges_from(
                 graph,
                 set([(n, new_node) for n in graph.neighbors(node_id)
-                    if (n, new_node) not in graph.edges() and\
-                    (new_node, n) not in graph.edges()])
+                    if not exists_edge(graph, n, new_node)])
             )
 
             # Copy the attributes of the edges
@@ -689,6 +718,7 @@ def relabel_node(graph, node_id, new_id):
        isinstance(graph, nx.Graph):
         clone_node(graph, node_id, new_id)
         graph.remove_node(node_id)
+        _update_indices(graph, node_id)
     elif isinstance(graph, Neo4jGraph):
         graph.relabel_node(node_id, new_id)
 
@@ -995,6 +1025,7 @@ def merge_nodes(graph, nodes, node_id=None, method="union", edge_method="union")
                                 neighbors_dict.update({n: attrs})
 
                 graph.remove_node(node)
+                _update_indices(graph, node)
                 all_neighbors -= {node}
 
             if node_id in graph.nodes():
@@ -1286,7 +1317,8 @@ def export_graph(graph, filename):
     return
 
 
-def find_matching(graph, pattern, nodes=None):
+def find_matching(graph, pattern, nodes=None, workers=None,
+                  distinct_embeddings=False, timeout=None, max_steps=None):
     """Find matching of a pattern in a graph.
 
     This function takes as an input a graph and a pattern graph, optionally,
@@ -1305,16 +1337,31 @@ def find_matching(graph, pattern, nodes=None):
     * the attribute dictionary of a pattern node is a subdictionary of
       its image in the graph;
 
-    Uses `networkx.isomorphism.(Di)GraphMatcher` class, which implements
-    subgraph matching algorithm.
+    Uses the backtracking search of `regraph.networkx.matching`, which
+    extends partial matchings along the edges of the pattern.
 
     Parameters
     ----------
     graph : nx.(Di)Graph
-    pattern : nx.(Di)Graph
-        Pattern graph to search for
+    pattern : nx.(Di)Graph or regraph.networkx.matching.CompiledPattern
+        Pattern graph to search for, the pattern can be compiled
+        beforehand if it is matched repeatedly
     nodes : iterable, optional
         Subset of nodes to search for matching
+    workers : int, optional
+        Number of worker processes performing the search in parallel
+        (see `regraph.networkx.matching.find_matchings`), ignored
+        for Neo4j graphs
+    distinct_embeddings : bool, optional
+        If True, only one instance is found among the instances that
+        differ by an automorphism of the pattern (i.e. every embedding
+        of the pattern is reported once), ignored for Neo4j graphs
+    timeout : float, optional
+        Maximum time of the search in seconds, ignored for Neo4j graphs
+    max_steps : int, optional
+        Maximum number of steps of the search (see
+        `regraph.networkx.matching.MatchingBudget`), ignored
+        for Neo4j graphs
 
     Returns
     -------
@@ -1322,6 +1369,12 @@ def find_matching(graph, pattern, nodes=None):
         List of instances of matching found in the graph, every instance
         is represented with a dictionary where keys are nodes of the
         pattern, and values are corresponding nodes of the graph.
+        For networkx graphs the list is a
+        `regraph.networkx.matching.MatchingResult` object, whose
+        attribute `truncated` indicates that the search was stopped
+        by `timeout` or `max_steps` (then only the instances found
+        so far are returned) and whose attribute `steps` contains
+        the number of steps spent by the search.
 
     Examples
     --------
@@ -1343,81 +1396,131 @@ def find_matching(graph, pattern, nodes=None):
     >>> instances
     [{"x": 3, "y": 2}]
 
+    """
+    if isinstance(graph, nx.DiGraph) or isinstance(graph, nx.Graph):
+        budget = matching.MatchingBudget(timeout, max_steps)
+        pattern = matching.compile_pattern(pattern)
+        candidates = _matching_candidates(graph, pattern, nodes)
+        symmetry = None
+        if distinct_embeddings:
+            symmetry = pattern.symmetry_breaking()
+        return matching.find_matchings(
+            graph, pattern, candidates, valid_attributes, workers,
+            symmetry, budget)
+    return list(iter_matching(graph, pattern, nodes=nodes))
+
+
+def iter_matching(graph, pattern, nodes=None, limit=None,
+                  distinct_embeddings=False, budget=None):
+    """Iterate over matchings of a pattern in a graph.
+
+    Lazy version of `find_matching`: instances are produced one by one
+    as the search finds them, so the search can be stopped as soon as
+    the caller has enough instances.
+
+    Parameters
+    ----------
+    graph : nx.(Di)Graph
+    pattern : nx.(Di)Graph or regraph.networkx.matching.CompiledPattern
+        Pattern graph to search for
+    nodes : iterable, optional
+        Subset of nodes to search for matching
+    limit : int, optional
+        Maximum number of instances to produce
+    distinct_embeddings : bool, optional
+        If True, instances that differ by an automorphism of the
+        pattern are produced once (see `find_matching`)
+    budget : regraph.networkx.matching.MatchingBudget, optional
+        Budget of the search, the iteration stops when it is exhausted
+
+    Returns
+    -------
+    instances : iterator of dict's
+        Iterator over instances of matching found in the graph (see
+        `find_matching`)
     """
     if isinstance(graph, nx.DiGraph) or\
        isinstance(graph, nx.Graph):
-        if nodes is not None:
-            g = graph.subgraph(nodes)
-        else:
-            g = graph
-
-        labels_mapping = dict([(n, i + 1) for i, n in enumerate(g.nodes())])
-        g = get_relabeled_graph(g, labels_mapping)
-        matching_nodes = set()
-
-        # find all the nodes matching the nodes in pattern
-        for pattern_node in pattern.nodes():
-            for node in g.nodes():
-                if valid_attributes(
-                    get_node(pattern, pattern_node),
-                    get_node(g, node)):
-                    matching_nodes.add(node)
-        reduced_graph = g.subgraph(matching_nodes)
-        instances = []
-        isomorphic_subgraphs = []
-        for sub_nodes in itertools.combinations(reduced_graph.nodes(),
-                                                len(pattern.nodes())):
-            subg = reduced_graph.subgraph(sub_nodes)
-            for edgeset in itertools.combinations(subg.edges(),
-                                                  len(pattern.edges())):
-                if g.is_directed():
-                    edge_induced_graph = nx.DiGraph(list(edgeset))
-                    edge_induced_graph.add_nodes_from(
-                        [n for n in subg.nodes() if n not in edge_induced_graph.nodes()])
-                    matching_obj = isomorphism.DiGraphMatcher(
-                        pattern, edge_induced_graph)
-                    for isom in matching_obj.isomorphisms_iter():
-                        isomorphic_subgraphs.append((subg, isom))
-                else:
-                    edge_induced_graph = nx.Graph(edgeset)
-                    edge_induced_graph.add_nodes_from(
-                        [n for n in subg.nodes() if n not in edge_induced_graph.nodes()])
-                    matching_obj = isomorphism.GraphMatcher(
-                        pattern, edge_induced_graph)
-                    for isom in matching_obj.isomorphisms_iter():
-                        isomorphic_subgraphs.append((subg, isom))
-
-        for subgraph, mapping in isomorphic_subgraphs:
-            # check node matches
-            # exclude subgraphs which nodes information does not
-            # correspond to pattern
-            for (pattern_node, node) in mapping.items():
-                if not valid_attributes(
-                    get_node(pattern, pattern_node),
-                    get_node(subgraph, node)):
-                    break
-            else:
-                # check edge attribute matched
-                for edge in pattern.edges():
-                    pattern_attrs = get_edge(pattern, edge[0], edge[1])
-                    target_attrs = get_edge(
-                        subgraph, mapping[edge[0]], mapping[edge[1]])
-                    if not valid_attributes(pattern_attrs, target_attrs):
-                        break
-                else:
-                    instances.append(mapping)
-
-        # bring back original labeling
-        inverse_mapping = dict(
-            [(value, key) for key, value in labels_mapping.items()]
-        )
-        for instance in instances:
-            for key, value in instance.items():
-                instance[key] = inverse_mapping[value]
+        pattern = matching.compile_pattern(pattern)
+        candidates = _matching_candidates(graph, pattern, nodes)
+        symmetry = None
+        if distinct_embeddings:
+            symmetry = pattern.symmetry_breaking()
+        instances = matching.iter_matchings(
+            graph, pattern, candidates, valid_attributes, symmetry, budget)
 
     elif isinstance(graph, Neo4jGraph):
-        instances = graph.find_matching(pattern, nodes)
-    return instances
+        if isinstance(pattern, matching.CompiledPattern):
+            pattern = pattern.pattern
+        instances = iter(graph.find_matching(pattern, nodes))
+    return itertools.islice(instances, limit)
+
+
+def _matching_candidates(graph, pattern, nodes=None):
+    """Find candidate images of the nodes of a compiled pattern."""
+    def _node_match(pattern_node, node):
+        return valid_attributes(
+            pattern.node_attrs[pattern_node], get_node(graph, node))
+
+    return matching.find_candidates(
+        graph, pattern, _node_match, nodes,
+        index=get_attribute_index(graph))
+
+
+def find_first_matching(graph, pattern, nodes=None):
+    """Find the first matching of a pattern in a graph.
+
+    Returns
+    -------
+    instance : dict or None
+        Instance of matching (see `find_matching`), None if
+        the pattern has no matching in the graph
+    """
+    return next(iter_matching(graph, pattern, nodes, limit=1), None)
+
+
+def build_attribute_index(graph):
+    """Build an inverted index of node attributes of a graph.
+
+    The index is attached to the graph and is used by `find_matching`
+    to find candidate images of pattern nodes without testing every
+    node of the graph. It is kept up to date by the node
+    transformation primitives of this module (modifications of the
+    graph bypassing them require to rebuild the index).
+
+    Parameters
+    ----------
+    graph : networkx.(Di)Graph
+
+    Returns
+    -------
+    index : regraph.networkx.indexing.AttributeIndex
+    """
+    if isinstance(graph, Neo4jGraph):
+        raise ReGraphError("Not available for Neo4j graphs!")
+    graph.attribute_index = AttributeIndex(graph)
+    return graph.attribute_index
+
+
+def drop_attribute_index(graph):
+    """Remove the attribute index attached to a graph (if any)."""
+    if get_attribute_index(graph) is not None:
+        del graph.attribute_index
+
+
+def _update_indices(graph, node):
+    """Update the attribute and typing indices of a graph for a node."""
+    index = get_attribute_index(graph)
+    if index is not None:
+        if node in graph.node:
+            index.add_node(node, graph.node[node])
+        else:
+            index.remove_node(node)
+    for typing_index in get_typing_indices(graph):
+        if node in graph.node:
+            typing_index.add_node(node)
+        else:
+            typing_index.remove_node(node)
 
 
 def print_graph(graph):
@@ -1563,11 +1666,11 @@ def unique_node_id(graph, prefix):
     str
         New unique node id starting with a prefix.
     """
-    if prefix not in graph.nodes():
+    if not exists_node(graph, prefix):
         return prefix
     idx = 1
     new_id = "{}_{}".format(prefix, idx)
-    while new_id in graph.nodes():
+    while exists_node(graph, new_id):
         idx += 1
         new_id = "{}_{}".format(prefix, idx)
     return new_id
@@ -19,11 +19,13 @@ from regraph.utils import (keys_by_value,
 from regraph.networkx.category_utils import (identity,
                                              check_homomorphism,
                                              pullback_complement,
-                                             pushout)
+                                             pushout,
+                                             _find,
+                                             _union)
 from regraph import primitives
 from regraph.networkx.plotting import plot_rule
 from regraph.exceptions import (ReGraphWarning, ParsingError,
-                                RuleError)
+                                RuleError, RewritingError)
 import regraph.neo4j.cypher_utils as cypher
 
 
@@ -110,8 +112,27 @@ class Rule(object):
         self.lhs = copy.deepcopy(lhs)
         self.rhs = copy.deepcopy(rhs)
 
+        self._plan = None
         return
 
+    def plan(self):
+        """Get the plan of the rule (see `RulePlan`).
+
+        The plan is cached and recomputed only if the rule is modified
+        by the `inject_*` methods, if its graphs or homomorphisms are
+        replaced, or if `drop_plan` is called after an in-place
+        modification of the graphs (or homomorphisms) of the rule.
+        """
+        plan = getattr(self, "_plan", None)
+        if plan is None or not plan.is_plan_of(self):
+            plan = RulePlan(self)
+            self._plan = plan
+        return plan
+
+    def drop_plan(self):
+        """Drop the cached plan of the rule."""
+        self._plan = None
+
     @classmethod
     def from_transform(cls, pattern, commands=None):
         """Initialize a rule from the transformation.
@@ -271,6 +292,7 @@ class Rule(object):
             If the node to clone is already being removed by the rule
             or if node with the specified clone id already exists in p.
         """
+        self.drop_plan()
         p_nodes = keys_by_value(self.p_lhs, n)
         if len(p_nodes) == 0:
             raise RuleError(
@@ -325,6 +347,7 @@ class Rule(object):
             Id of the node in `lhs` that should be removed
             by the rule.
         """
+        self.drop_plan()
         # remove corresponding nodes from p and rhs
         p_keys = keys_by_value(self.p_lhs, lhs_node_id)
         for k in p_keys:
@@ -355,6 +378,7 @@ class Rule(object):
             `lhs` nor `p`, or if a corresponding edge in
             `p` does not exist.
         """
+        self.drop_plan()
         # Find nodes in p mapping to n1 & n2
         p_keys_1 = keys_by_value(self.p_lhs, n1)
         p_keys_2 = keys_by_value(self.p_lhs, n2)
@@ -414,6 +438,7 @@ class Rule(object):
             by the rule.
 
         """
+        self.drop_plan()
         if n not in self.lhs.nodes() and n not in self.p.nodes():
             raise RuleError(
                 "Node '%s' exists in neither the left "
@@ -457,6 +482,7 @@ class Rule(object):
         RuleError
 
         """
+        self.drop_plan()
         if n1 not in self.lhs.nodes() and n1 not in self.p.nodes():
             raise RuleError(
                 "Node '%s' exists in neither the left "
@@ -528,6 +554,7 @@ class Rule(object):
         RuleError
             If node with this id already exists in the `rhs`.
         """
+        self.drop_plan()
         if node_id not in self.rhs.nodes():
             primitives.add_node(self.rhs, node_id, attrs)
         else:
@@ -555,6 +582,7 @@ class Rule(object):
         RuleError
             If some node from the list already exists in the `rhs`.
         """
+        self.drop_plan()
         for n in node_list:
             try:
                 node_id, node_attrs = n
@@ -582,6 +610,7 @@ class Rule(object):
             If some of the nodes (`n1` or `n2`) do not exist
             or if there is already an edge between them in `rhs`.
         """
+        self.drop_plan()
         if n1 not in self.rhs.nodes():
             raise RuleError(
                 "Node with the id '%s' does not exist in the "
@@ -618,6 +647,7 @@ class Rule(object):
             If some of the nodes (`n1` or `n2`) do not exist
             or if there is already an edge between them in `rhs`.
         """
+        self.drop_plan()
         for e in edge_list:
             if len(e) == 2:
                 self.inject_add_edge(e[0], e[1])
@@ -651,6 +681,7 @@ class Rule(object):
             If a node with some id specified in `node_lust` does not
             exist in the preserved part of the rule.
         """
+        self.drop_plan()
         # Update graphs
         new_name = None
 
@@ -709,6 +740,7 @@ class Rule(object):
             If node `n` does not exist in the rhs of the rule
 
         """
+        self.drop_plan()
         if n not in self.lhs.nodes() + self.p.nodes() + self.rhs.nodes():
             raise RuleError(
                 "Node '%s' exists in neither lhs, nor p, nor rhs of the rule" %
@@ -752,6 +784,7 @@ class Rule(object):
             `lhs`, nor `p` nor `rhs`, or if an edge is incident to smth thats
             is going to be removed by the rule.
         """
+        self.drop_plan()
         if n1 not in self.lhs.nodes() + self.rhs.nodes() + self.p.nodes():
             raise RuleError(
                 "Node '%s' exists in neither lhs, nor p, nor rhs "
@@ -827,6 +860,7 @@ class Rule(object):
             If node `n` does not exist in the left-hand side or
             is being removed by the rule.
         """
+        self.drop_plan()
         if n not in self.lhs.nodes():
             raise RuleError(
                 "Node '%s' does not exist in the left hand "
@@ -844,6 +878,7 @@ class Rule(object):
 
     def inject_update_edge_attrs(self, n1, n2, attrs):
         """Inject an update of edge attrs by the rule."""
+        self.drop_plan()
         if n1 not in self.lhs.nodes():
             raise RuleError(
                 "Node '%s' does not exist in the left hand side of the rule" %
@@ -940,7 +975,7 @@ class Rule(object):
         rule = cls(p, lhs, rhs, p_lhs, p_rhs)
         return rule
 
-    def apply_to(self, graph, instance, inplace=False):
+    def apply_to(self, graph, instance, inplace=False, overlay=False):
         """Perform graph rewriting with the rule.
 
         Parameters
@@ -957,6 +992,13 @@ class Rule(object):
             to the graph object, otherwise the result of
             the rewriting is a new graph object.
             Default value is `False`.
+        overlay : bool, optional
+            If `True` (and `inplace` is `False`), the result
+            of the rewriting is a copy-on-write overlay of
+            the input graph (`regraph.networkx.overlay`),
+            whose cost is proportional to the size of the
+            rewritten part of the graph, instead of a deep
+            copy. Default value is `False`.
 
         Returns
         -------
@@ -972,12 +1014,300 @@ class Rule(object):
         """
         g_m, p_g_m, g_m_g = pullback_complement(
             self.p, self.lhs, graph, self.p_lhs, instance,
-            inplace
+            inplace, overlay
         )
+        # `g_m` is either the input graph or a new graph,
+        # the pushout can be computed in-place in both cases
         g_prime, g_m_g_prime, rhs_g_prime = pushout(
-            self.p, g_m, self.rhs, p_g_m, self.p_rhs, inplace)
+            self.p, g_m, self.rhs, p_g_m, self.p_rhs, inplace=True)
         return (g_prime, rhs_g_prime)
 
+    def apply_to_all(self, graph, instances, inplace=False):
+        """Perform graph rewriting of many instances at once.
+
+        The instances have to be parallel independent: the nodes
+        and the edges removed, cloned or whose attributes are
+        removed by the rewriting of an instance cannot be used
+        by the other instances, and the edges added by the
+        rewriting of an instance cannot be removed by the other
+        instances. The rule is applied to all the
+        instances with a single rewriting of the graph by the
+        parallel composition of the rule (see
+        `parallel_composition`).
+
+        Parameters
+        ----------
+        graph : nx.(Di)Graph
+            Graph to rewrite with the rule.
+        instances : list of dict
+            Instances of the `lhs` pattern in the graph.
+        inplace : bool, optional
+            If `True`, the rewriting will be performed
+            in-place, otherwise the result of the rewriting
+            is a new graph object. Default value is `False`.
+
+        Returns
+        -------
+        g_prime : nx.(Di)Graph
+            Result of the rewriting.
+        rhs_g_primes : list of dict
+            Matchings of the `rhs` in `g_prime` (one
+            per instance).
+
+        Raises
+        ------
+        RewritingError
+            If the instances are not parallel independent.
+        """
+        rule, instance, rhs_mappings = self.parallel_composition(
+            instances, graph)
+        g_prime, rhs_g_prime = rule.apply_to(graph, instance, inplace)
+        return (g_prime, [
+            dict((r, rhs_g_prime[n]) for r, n in mapping.items())
+            for mapping in rhs_mappings
+        ])
+
+    def parallel_composition(self, instances, graph=None):
+        """Compose the applications of the rule to many instances.
+
+        Builds a single rule whose left-hand side is the union of the
+        images of the instances, rewriting with this rule is equivalent
+        to the (sequential) rewritings of the instances.
+
+        Parameters
+        ----------
+        instances : list of dict
+            Parallel independent instances of the `lhs` pattern
+            (see `apply_to_all`).
+        graph : nx.(Di)Graph, optional
+            Graph of the instances, if specified, the nodes added
+            by the composed rule are named so that they do not
+            clash with the nodes of the graph.
+
+        Returns
+        -------
+        rule : regraph.rules.Rule
+            Composed rule, nodes of its `lhs` are the nodes of
+            the graph used by the instances.
+        instance : dict
+            Instance of the `lhs` of the composed rule (identity).
+        rhs_mappings : list of dict
+            Maps from the `rhs` of the rule to the `rhs` of the
+            composed rule (one per instance).
+
+        Raises
+        ------
+        RewritingError
+            If the instances are not parallel independent.
+        """
+        self._check_parallel_independence(instances)
+
+        if self.lhs.is_directed():
+            lhs, p, rhs = nx.DiGraph(), nx.DiGraph(), nx.DiGraph()
+        else:
+            lhs, p, rhs = nx.Graph(), nx.Graph(), nx.Graph()
+
+        users = dict()
+        for instance in instances:
+            for node in instance.values():
+                users[node] = users.get(node, 0) + 1
+
+        # Left-hand side: the union of the images of the instances
+        for instance in instances:
+            for n, node in instance.items():
+                _add_or_merge_node(lhs, node, self.lhs.node[n])
+            for s, t in self.lhs.edges():
+                _add_or_merge_edge(
+                    lhs, instance[s], instance[t], self.lhs.edge[s][t])
+
+        # Preserved part: the nodes used by a single instance are
+        # preserved as in the rule, the nodes used by many instances
+        # are preserved (not cloned) by all of them
+        p_lhs = dict()
+        p_names = []
+        shared = dict()
+        for instance in instances:
+            names = dict()
+            for q in self.p.nodes():
+                node = instance[self.p_lhs[q]]
+                if users[node] > 1:
+                    if node not in shared:
+                        shared[node] = len(p_lhs)
+                        p_lhs[shared[node]] = node
+                    names[q] = shared[node]
+                else:
+                    names[q] = len(p_lhs)
+                    p_lhs[names[q]] = node
+                _add_or_merge_node(p, names[q], self.p.node[q])
+            for s, t in self.p.edges():
+                _add_or_merge_edge(
+                    p, names[s], names[t], self.p.edge[s][t])
+            p_names.append(names)
+
+        # Right-hand side: the copies of the right-hand side glued
+        # along the images of the shared nodes of the preserved part
+        classes = dict()
+        for i, names in enumerate(p_names):
+            for q, p_node in names.items():
+                classes.setdefault(p_node, set()).add((i, self.p_rhs[q]))
+        parent = dict(
+            ((i, r), (i, r))
+            for i in range(len(instances)) for r in self.rhs.nodes())
+        for members in classes.values():
+            members = list(members)
+            for member in members[1:]:
+                _union(parent, members[0], member)
+
+        used_names = set(lhs.nodes())
+        if graph is not None:
+            used_names.update(graph.nodes())
+        counters = dict()
+        class_names = dict()
+        rhs_mappings = []
+        for i in range(len(instances)):
+            mapping = dict()
+            for r in self.rhs.nodes():
+                root = _find(parent, (i, r))
+                if root not in class_names:
+                    class_names[root] = _fresh_name(used_names, r, counters)
+                mapping[r] = class_names[root]
+                _add_or_merge_node(rhs, mapping[r], self.rhs.node[r])
+            for s, t in self.rhs.edges():
+                _add_or_merge_edge(
+                    rhs, mapping[s], mapping[t], self.rhs.edge[s][t])
+            rhs_mappings.append(mapping)
+
+        p_rhs = dict()
+        for i, names in enumerate(p_names):
+            for q, p_node in names.items():
+                p_rhs[p_node] = rhs_mappings[i][self.p_rhs[q]]
+
+        rule = Rule(p, lhs, rhs, p_lhs, p_rhs)
+        return (rule, dict((n, n) for n in lhs.nodes()), rhs_mappings)
+
+    def independent_instances(self, instances):
+        """Select parallel independent instances of the rule.
+
+        The instances are considered in the order of the list, an
+        instance is selected if it is injective and parallel
+        independent (see `apply_to_all`) with all the instances
+        selected before it.
+
+        Parameters
+        ----------
+        instances : list of dict
+            Instances of the `lhs` pattern in a graph.
+
+        Returns
+        -------
+        selected : list of dict
+            Selected instances, they can be rewritten at once
+            with `apply_to_all`.
+        """
+        removed_nodes, removed_edges, added_edges =\
+            self._modified_elements()
+        used_nodes = set()
+        used_edges = set()
+        modified_nodes = set()
+        modified_edges = set()
+        new_edges = set()
+        selected = []
+        for instance in instances:
+            nodes = set(instance.values())
+            if len(nodes) != len(instance):
+                continue
+            edges = set(
+                _edge_key(self.lhs, instance[s], instance[t])
+                for s, t in self.lhs.edges())
+            own_nodes = set(instance[n] for n in removed_nodes)
+            own_edges = set(
+                _edge_key(self.lhs, instance[s], instance[t])
+                for s, t in removed_edges)
+            own_new_edges = set(
+                _edge_key(self.lhs, instance[s], instance[t])
+                for s, t in added_edges)
+            if len(nodes.intersection(modified_nodes)) > 0 or\
+               len(own_nodes.intersection(used_nodes)) > 0 or\
+               len(edges.intersection(modified_edges)) > 0 or\
+               len(own_edges.intersection(used_edges)) > 0 or\
+               len(own_edges.intersection(new_edges)) > 0 or\
+               len(own_new_edges.intersection(modified_edges)) > 0:
+                continue
+            selected.append(instance)
+            used_nodes.update(nodes)
+            used_edges.update(edges)
+            modified_nodes.update(own_nodes)
+            modified_edges.update(own_edges)
+            new_edges.update(own_new_edges)
+        return selected
+
+    def _modified_elements(self):
+        """Get the nodes and the edges of the lhs modified by the rule.
+
+        These are the elements removed, cloned or whose
+        attributes are removed by the rule, and the pairs of
+        nodes of the lhs between which the rule adds an edge.
+        """
+        plan = self.plan()
+        removed_nodes = set(plan.removed_nodes)
+        removed_nodes.update(plan.cloned_nodes.keys())
+        removed_nodes.update(plan.removed_node_attrs.keys())
+        removed_edges = set(plan.removed_edge_attrs.keys())
+        for s, t in self.lhs.edges():
+            for s_p in plan.lhs_preimages[s]:
+                for t_p in plan.lhs_preimages[t]:
+                    if not self.p.has_edge(s_p, t_p):
+                        removed_edges.add((s, t))
+        added_edges = set()
+        for s, t in plan.added_edges:
+            for s_p in plan.rhs_preimages[s]:
+                for t_p in plan.rhs_preimages[t]:
+                    added_edges.add((self.p_lhs[s_p], self.p_lhs[t_p]))
+        return (removed_nodes, removed_edges, added_edges)
+
+    def _check_parallel_independence(self, instances):
+        """Check that the instances of the rule are parallel independent."""
+        removed_nodes, removed_edges, added_edges =\
+            self._modified_elements()
+
+        node_users = dict()
+        edge_users = dict()
+        edge_adders = dict()
+        for i, instance in enumerate(instances):
+            if len(set(instance.values())) != len(instance):
+                raise RewritingError(
+                    "Instance '%s' is not injective!" % instance)
+            for node in instance.values():
+                node_users.setdefault(node, set()).add(i)
+            for s, t in self.lhs.edges():
+                edge_users.setdefault(
+                    _edge_key(self.lhs, instance[s], instance[t]),
+                    set()).add(i)
+            for s, t in added_edges:
+                edge_adders.setdefault(
+                    _edge_key(self.lhs, instance[s], instance[t]),
+                    set()).add(i)
+
+        for i, instance in enumerate(instances):
+            for n in removed_nodes:
+                if len(node_users[instance[n]]) > 1:
+                    raise RewritingError(
+                        "Instances are not parallel independent: "
+                        "node '%s' is modified by one instance and used "
+                        "by another!" % instance[n])
+            for s, t in removed_edges:
+                key = _edge_key(self.lhs, instance[s], instance[t])
+                if len(edge_users[key]) > 1:
+                    raise RewritingError(
+                        "Instances are not parallel independent: "
+                        "edge '%s->%s' is modified by one instance and "
+                        "used by another!" % (instance[s], instance[t]))
+                if len(edge_adders.get(key, set()) - set([i])) > 0:
+                    raise RewritingError(
+                        "Instances are not parallel independent: "
+                        "edge '%s->%s' is modified by one instance and "
+                        "added by another!" % (instance[s], instance[t]))
+
     def added_nodes(self):
         """Get nodes added by the rule.
 
@@ -986,12 +1316,7 @@ class Rule(object):
         nodes : set
             Set of nodes from `rhs` added by the rule.
         """
-        nodes = set()
-        for r_node in self.rhs.nodes():
-            p_nodes = keys_by_value(self.p_rhs, r_node)
-            if len(p_nodes) == 0:
-                nodes.add(r_node)
-        return nodes
+        return set(self.plan().added_nodes)
 
     def added_edges(self):
         """Get edges added by the rule.
@@ -1001,21 +1326,7 @@ class Rule(object):
         edges : set
             Set of edges from `rhs` added by the rule.
         """
-        edges = set()
-        for s, t in self.rhs.edges():
-            s_p_nodes = keys_by_value(self.p_rhs, s)
-            t_p_nodes = keys_by_value(self.p_rhs, t)
-            if len(s_p_nodes) == 0 or len(t_p_nodes) == 0:
-                edges.add((s, t))
-            else:
-                found_edge = False
-                for s_p_node in s_p_nodes:
-                    for t_p_node in t_p_nodes:
-                        if (s_p_node, t_p_node) in self.p.edges():
-                            found_edge = True
-                if not found_edge:
-                    edges.add((s, t))
-        return edges
+        return set(self.plan().added_edges)
 
     def added_node_attrs(self):
         """Get node attributes added by the rule.
@@ -1026,19 +1337,7 @@ class Rule(object):
             Dictionary where keys are nodes from `rhs`
             and values are attribute dictionaries to add.
         """
-        attrs = dict()
-        for node in self.rhs.nodes():
-            p_nodes = keys_by_value(self.p_rhs, node)
-            if len(p_nodes) == 0:
-                if len(self.rhs.node[node]) > 0:
-                    attrs[node] = self.rhs.node[node]
-            new_attrs = {}
-            for p_node in p_nodes:
-                new_attrs = attrs_union(new_attrs, dict_sub(
-                    self.rhs.node[node], self.p.node[p_node]))
-            if len(new_attrs) > 0:
-                attrs[node] = new_attrs
-        return attrs
+        return _copy_attrs_dict(self.plan().added_node_attrs)
 
     def added_edge_attrs(self):
         """Get edge attributes added by the rule.
@@ -1049,27 +1348,7 @@ class Rule(object):
             Dictionary where keys are edges from `rhs`
             and values are attribute dictionaries to add.
         """
-        attrs = dict()
-        for s, t in self.rhs.edges():
-            s_p_nodes = keys_by_value(self.p_rhs, s)
-            t_p_nodes = keys_by_value(self.p_rhs, t)
-            if len(s_p_nodes) == 0 or len(t_p_nodes) == 0:
-                if len(self.rhs.edge[s][t]) > 0:
-                    attrs[(s, t)] = self.rhs.edge[s][t]
-            new_attrs = {}
-            for s_p_node in s_p_nodes:
-                for t_p_node in t_p_nodes:
-                    if (s_p_node, t_p_node) in self.p.edges():
-                        new_attrs = attrs_union(
-                            new_attrs,
-                            dict_sub(
-                                self.rhs.edge[s][t],
-                                self.p.edge[s_p_node][t_p_node]
-                            )
-                        )
-            if len(new_attrs) > 0:
-                attrs[(s, t)] = new_attrs
-        return attrs
+        return _copy_attrs_dict(self.plan().added_edge_attrs)
 
     def merged_nodes(self):
         """Get nodes merged by the rule.
@@ -1080,12 +1359,9 @@ class Rule(object):
             Dictionary where keys are nodes from `rhs` and
             values are sets of nodes from `p` that are merged.
         """
-        nodes = dict()
-        for node in self.rhs.nodes():
-            p_nodes = keys_by_value(self.p_rhs, node)
-            if len(p_nodes) > 1:
-                nodes[node] = set(p_nodes)
-        return nodes
+        return dict(
+            (node, set(p_nodes))
+            for node, p_nodes in self.plan().merged_nodes.items())
 
     def removed_nodes(self):
         """Get nodes removed by the rule.
@@ -1095,12 +1371,7 @@ class Rule(object):
         nodes : set
             Set of nodes from `lhs` removed by the rule.
         """
-        nodes = set()
-        for node in self.lhs.nodes():
-            p_nodes = keys_by_value(self.p_lhs, node)
-            if len(p_nodes) == 0:
-                nodes.add(node)
-        return nodes
+        return set(self.plan().removed_nodes)
 
     def removed_edges(self):
         """Get edges removed by the rule.
@@ -1110,16 +1381,7 @@ class Rule(object):
         edges : set
             Set of edges from `lhs` removed by the rule.
         """
-        edges = set()
-        for s, t in self.lhs.edges():
-            s_p_nodes = keys_by_value(self.p_lhs, s)
-            t_p_nodes = keys_by_value(self.p_lhs, t)
-            if len(s_p_nodes) != 0 and len(t_p_nodes) != 0:
-                for s_p_node in s_p_nodes:
-                    for t_p_node in t_p_nodes:
-                        if (s_p_node, t_p_node) not in self.p.edges():
-                            edges.add((s_p_node, t_p_node))
-        return edges
+        return set(self.plan().removed_edges)
 
     def removed_node_attrs(self):
         """Get node attributes removed by the rule.
@@ -1130,17 +1392,7 @@ class Rule(object):
             Dictionary where keys are nodes from `lhs`
             and values are attribute dictionaries to remove.
         """
-        attrs = dict()
-        for node in self.lhs.nodes():
-            p_nodes = keys_by_value(self.p_lhs, node)
-            new_attrs = {}
-            for p_node in p_nodes:
-                new_attrs = attrs_union(new_attrs, dict_sub(
-                    self.lhs.node[node], self.p.node[p_node]))
-            if len(new_attrs) > 0:
-                normalize_attrs(new_attrs)
-                attrs[node] = new_attrs
-        return attrs
+        return _copy_attrs_dict(self.plan().removed_node_attrs)
 
     def removed_edge_attrs(self):
         """Get edge attributes removed by the rule.
@@ -1151,25 +1403,7 @@ class Rule(object):
             Dictionary where keys are edges from `lhs`
             and values are attribute dictionaries to remove.
         """
-        attrs = dict()
-        for s, t in self.lhs.edges():
-            s_p_nodes = keys_by_value(self.p_lhs, s)
-            t_p_nodes = keys_by_value(self.p_lhs, t)
-            new_attrs = {}
-            for s_p_node in s_p_nodes:
-                for t_p_node in t_p_nodes:
-                    if (s_p_node, t_p_node) in self.p.edges():
-                        new_attrs = attrs_union(
-                            new_attrs,
-                            dict_sub(
-                                self.lhs.edge[s][t],
-                                self.p.edge[s_p_node][t_p_node]
-                            )
-                        )
-            if len(new_attrs) > 0:
-                normalize_attrs(new_attrs)
-                attrs[(s, t)] = new_attrs
-        return attrs
+        return _copy_attrs_dict(self.plan().removed_edge_attrs)
 
     def cloned_nodes(self):
         """Get nodes cloned by the rule.
@@ -1180,12 +1414,9 @@ class Rule(object):
             Dictionary where keys are nodes from `lhs` and
             values are sets of corresponding nodes from `p`.
         """
-        nodes = dict()
-        for node in self.lhs.nodes():
-            p_nodes = keys_by_value(self.p_lhs, node)
-            if len(p_nodes) > 1:
-                nodes[node] = set(p_nodes)
-        return nodes
+        return dict(
+            (node, set(p_nodes))
+            for node, p_nodes in self.plan().cloned_nodes.items())
 
     def is_restrictive(self):
         """Check if the rule is  restrictive.
@@ -1199,11 +1430,7 @@ class Rule(object):
         otherwise
 
         """
-        return len(self.removed_nodes()) > 0 or\
-            len(self.cloned_nodes()) > 0 or\
-            len(self.removed_node_attrs()) > 0 or\
-            len(self.removed_edges()) > 0 or\
-            len(self.removed_edge_attrs()) > 0
+        return self.plan().is_restrictive
 
     def is_relaxing(self):
         """Check if the rule is relaxing.
@@ -1216,11 +1443,7 @@ class Rule(object):
         `True` if the rule is relaxing, `False` otherwise
 
         """
-        return len(self.added_nodes()) > 0 or\
-            len(self.merged_nodes()) > 0 or\
-            len(self.added_node_attrs()) > 0 or\
-            len(self.added_edges()) > 0 or\
-            len(self.added_edge_attrs()) > 0
+        return self.plan().is_relaxing
 
     def to_commands(self):
         """Convert the rule to a list of commands.
@@ -1268,6 +1491,7 @@ class Rule(object):
         return commands
 
     def _add_node_lhs(self, node_id, attrs=None):
+        self.drop_plan()
         if node_id not in self.lhs.nodes():
             primitives.add_node(self.lhs, node_id, attrs)
             new_p_node_id = node_id
@@ -1286,6 +1510,7 @@ class Rule(object):
                 "of the rule" % node_id)
 
     def _add_edge_lhs(self, source, target, attrs=None):
+        self.drop_plan()
         if (source, target) not in self.lhs.edges():
             if source in self.lhs.nodes() and target in self.rhs.nodes():
                 primitives.add_edge(self.lhs, source, target, attrs)
@@ -1314,6 +1539,7 @@ class Rule(object):
         if there exist nodes from `p` that map to this node
         they are removed as well.
         """
+        self.drop_plan()
         p_keys = keys_by_value(self.p_rhs, node_id)
         for p_node in p_keys:
             primitives.remove_node(self.p, p_node)
@@ -1323,14 +1549,17 @@ class Rule(object):
 
     def _add_edge_rhs(self, n1, n2, attrs=None):
         """Add an edge in the rhs."""
+        self.drop_plan()
         primitives.add_edge(self.rhs, n1, n2, attrs)
 
     def _remove_edge_p(self, node1, node2):
         """Remove edge from the p of the graph."""
+        self.drop_plan()
         primitives.remove_edge(self.p, node1, node2)
 
     def _remove_edge_rhs(self, node1, node2):
         """Remove edge from the rhs of the graph."""
+        self.drop_plan()
         primitives.remove_edge(self.rhs, node1, node2)
         for pn1 in keys_by_value(self.p_rhs, node1):
             for pn2 in keys_by_value(self.p_rhs, node2):
@@ -1339,6 +1568,7 @@ class Rule(object):
 
     def _clone_rhs_node(self, node, new_name=None):
         """Clone an rhs node."""
+        self.drop_plan()
         if node not in self.rhs.nodes():
             raise RuleError(
                 "Node '%s' is not a node of right hand side" %
@@ -1357,6 +1587,7 @@ class Rule(object):
 
     def _merge_nodes_rhs(self, n1, n2, new_name):
         """Merge nodes in rhs."""
+        self.drop_plan()
         if n1 not in self.rhs.nodes():
             raise RuleError("Node '%s' is not a node of the rhs" % n1)
         if n2 not in self.rhs.nodes():
@@ -1368,6 +1599,7 @@ class Rule(object):
 
     def _add_node_attrs_rhs(self, n, attrs):
         """Add attrs to a node in the rhs."""
+        self.drop_plan()
         if n not in self.rhs.nodes():
             raise RuleError(
                 "Node %s does not exist in the right "
@@ -1376,6 +1608,7 @@ class Rule(object):
 
     def _remove_node_attrs_rhs(self, n, attrs):
         """Remove attrs of a node in the rhs."""
+        self.drop_plan()
         if n not in self.rhs.nodes():
             raise RuleError(
                 "Node '%s' does not exist in the right hand "
@@ -1388,6 +1621,7 @@ class Rule(object):
 
     def _remove_node_attrs_p(self, n, attrs):
         """Remove attrs of a node in the p."""
+        self.drop_plan()
         if n not in self.p.nodes():
             raise RuleError(
                 "Node '%s' does not exist in the preserved "
@@ -1410,6 +1644,7 @@ class Rule(object):
             )
 
     def _add_node_attrs_lhs(self, n, attrs):
+        self.drop_plan()
         if n not in self.lhs.nodes():
             raise RuleError(
                 "Node '%s' does not exist in the lhs "
@@ -1484,6 +1719,97 @@ class Rule(object):
             (unreadable, but more secure: guaranteed to avoid any var name
             collisions)
         """
+        query, rhs_vars_inverse, _ = self._to_cypher(
+            instance, node_label, edge_label, generate_var_ids)
+        return query, rhs_vars_inverse
+
+    def to_cypher_batch(self, instances, node_label="node",
+                        edge_label="edge"):
+        """Convert a rule on many instances to a parameterized Cypher query.
+
+        The query applies the rule to every row of the parameter
+        `$instances` (`UNWIND $instances AS instance`) and returns
+        a record per instance, the position of the instance in
+        `instances` is returned in `instance_index`. The ids of the nodes of the instances
+        are passed as parameters, so the query only depends on the
+        rule (it is generated once and cached in the plan of the
+        rule). The instances have to be parallel independent (see
+        `apply_to_all`).
+
+        Parameters
+        ----------
+        instances : list of dict
+            Instances of the lhs of the rule
+        node_label : optional
+        edge_label : optional
+
+        Returns
+        -------
+        query : str
+            Generated query
+        parameters : dict
+            Parameters of the query
+        rhs_vars_inverse : dict
+            Dictionary whose keys are the returned variables and whose
+            values are the corresponding nodes of the rhs
+
+        Raises
+        ------
+        RewritingError
+            If the instances are not parallel independent
+        """
+        self._check_parallel_independence(instances)
+        plan = self.plan()
+        key = (node_label, edge_label)
+        if key not in plan.cypher_batch_queries.keys():
+            plan.cypher_batch_queries[key] = self._to_cypher(
+                None, node_label, edge_label)
+        query, rhs_vars_inverse, (lhs_vars, p_vars) =\
+            plan.cypher_batch_queries[key]
+        rows = []
+        for i, instance in enumerate(instances):
+            row = self._cypher_batch_row(instance, plan, lhs_vars, p_vars)
+            row["index"] = i
+            rows.append(row)
+        return query, {"instances": rows}, rhs_vars_inverse
+
+    def _clone_ignore_sets(self, instance, plan):
+        """Get the neighbours ignored by the clones of the instance nodes.
+
+        Returns two dictionaries whose keys are the clones (nodes of `p`)
+        and whose values are the sets of ids of the successors
+        (predecessors) that are not reconnected to the clone.
+        """
+        sucs_to_ignore = dict()
+        preds_to_ignore = dict()
+        for lhs_node, p_nodes in plan.cloned_nodes.items():
+            for p_node in p_nodes:
+                if p_node != lhs_node:
+                    preds_to_ignore[p_node] = set()
+                    sucs_to_ignore[p_node] = set()
+                    for u, v in plan.removed_edges:
+                        if u == p_node:
+                            try:
+                                sucs_to_ignore[p_node].add(instance[v])
+                            except(KeyError):
+                                sucs_to_ignore[p_node].add(v)
+                        if v == p_node:
+                            try:
+                                preds_to_ignore[p_node].add(instance[u])
+                            except(KeyError):
+                                preds_to_ignore[p_node].add(u)
+        return sucs_to_ignore, preds_to_ignore
+
+    def _to_cypher(self, instance, node_label="node",
+                   edge_label="edge", generate_var_ids=False):
+        """Generate a Cypher query applying the rule.
+
+        If `instance` is None, the query is generated for a batch of
+        instances (see `to_cypher_batch`). Returns the query, the
+        inverse of the variables of the rhs and the variables of
+        the lhs and of `p`.
+        """
+        batch = instance is None
         # If names of nodes of the rule graphs (L, P, R) are used as
         # var names, we need to perform escaping on these names
         # for neo4j not to complain (some symbols are forbidden in
@@ -1502,13 +1828,27 @@ class Rule(object):
             p_vars = {n: "p_" + str(n) for n in self.p.nodes()}
             rhs_vars = {n: "rhs_" + str(n) for n in self.rhs.nodes()}
 
-        # Variables of the nodes of instance
-        match_instance_vars = {lhs_vars[k]: v for k, v in instance.items()}
+        plan = self.plan()
+
+        if batch:
+            matched_nodes = set(self.lhs.nodes())
+        else:
+            matched_nodes = set(instance.keys())
+            # Variables of the nodes of instance
+            match_instance_vars = {
+                lhs_vars[k]: v for k, v in instance.items()}
         query = ""
 
+        if batch:
+            query += "// Match nodes and edges of the instances \n"
+            query += "UNWIND $instances AS instance\n"
+            query += cypher.match_pattern_batch(
+                self.lhs, lhs_vars, "instance",
+                node_label=node_label, edge_label=edge_label)
+            query += "\n"
         # If instance is not empty, generate Cypher that matches the nodes
         # of the instance
-        if len(instance) > 0:
+        elif len(instance) > 0:
             query += "// Match nodes and edges of the instance \n"
             query += cypher.match_pattern_instance(
                 self.lhs, lhs_vars, match_instance_vars,
@@ -1518,32 +1858,22 @@ class Rule(object):
             query += "// Empty instance \n\n"
 
         # Add instance nodes to the set of vars to carry
-        carry_variables = set(match_instance_vars.keys())
+        carry_variables = set(lhs_vars[n] for n in matched_nodes)
         for u, v in self.lhs.edges():
             carry_variables.add(str(lhs_vars[u]) + "_" + str(lhs_vars[v]))
+        if batch:
+            # The ids of neighbours ignored by the clones are in the rows
+            carry_variables.add("instance")
+            sucs_to_ignore = dict()
+            preds_to_ignore = dict()
+        else:
+            sucs_to_ignore, preds_to_ignore = self._clone_ignore_sets(
+                instance, plan)
 
         # Generate cloning subquery
-        for lhs_node, p_nodes in self.cloned_nodes().items():
+        for lhs_node, p_nodes in plan.cloned_nodes.items():
             query += "// Cloning node '{}' of the lhs \n".format(lhs_node)
-            clones = set()
-            preds_to_ignore = dict()
-            sucs_to_ignore = dict()
-            for p_node in p_nodes:
-                if p_node != lhs_node:
-                    clones.add(p_node)
-                    preds_to_ignore[p_node] = set()
-                    sucs_to_ignore[p_node] = set()
-                    for u, v in self.removed_edges():
-                        if u == p_node:
-                            try:
-                                sucs_to_ignore[p_node].add(instance[v])
-                            except(KeyError):
-                                sucs_to_ignore[p_node].add(v)
-                        if v == p_node:
-                            try:
-                                preds_to_ignore[p_node].add(instance[u])
-                            except(KeyError):
-                                preds_to_ignore[p_node].add(u)
+            clones = set(n for n in p_nodes if n != lhs_node)
             for n in clones:
                 query +=\
                     "// Create clone corresponding to '{}' ".format(n) +\
@@ -1553,6 +1883,12 @@ class Rule(object):
                 else:
                     clone_id_var = "p_" + str(n) + "_id"
 
+                if batch:
+                    sucs_expr = "instance.{}_sucIgnore".format(p_vars[n])
+                    preds_expr = "instance.{}_predIgnore".format(p_vars[n])
+                else:
+                    sucs_expr = None
+                    preds_expr = None
                 q, carry_variables = cypher.cloning_query(
                     original_var=lhs_vars[lhs_node],
                     clone_var=p_vars[n],
@@ -1560,38 +1896,40 @@ class Rule(object):
                     clone_id_var=clone_id_var,
                     node_label=node_label,
                     edge_labels=["edge", "typing", "related"],
-                    sucs_to_ignore=sucs_to_ignore[n],
-                    preds_to_ignore=preds_to_ignore[n],
+                    sucs_to_ignore=sucs_to_ignore.get(n),
+                    preds_to_ignore=preds_to_ignore.get(n),
                     carry_vars=carry_variables,
-                    ignore_naming=True)
+                    ignore_naming=True,
+                    sucs_to_ignore_expr=sucs_expr,
+                    preds_to_ignore_expr=preds_expr)
                 query += q
                 query += cypher.with_vars(carry_variables)
                 query += "\n\n"
 
         # Generate nodes removal subquery
-        for node in self.removed_nodes():
+        for node in plan.removed_nodes:
             query += "// Removing node '{}' of the lhs \n".format(node)
             query += cypher.remove_nodes([lhs_vars[node]])
             carry_variables.remove(lhs_vars[node])
             query += "\n"
 
         # Generate edges removal subquery
-        for u, v in self.removed_edges():
-            if u in instance.keys() and v in instance.keys():
+        for u, v in plan.removed_edges:
+            if u in matched_nodes and v in matched_nodes:
                 query += "// Removing edge '{}->{}' of the lhs \n".format(u, v)
                 edge_var = "{}_{}".format(str(lhs_vars[u]), str(lhs_vars[v]))
                 query += cypher.remove_edge(edge_var)
                 query += "\n"
                 carry_variables.remove(edge_var)
 
-        if len(self.removed_nodes()) > 0 or len(self.removed_edges()) > 0:
+        if len(plan.removed_nodes) > 0 or len(plan.removed_edges) > 0:
             query += cypher.with_vars(carry_variables)
 
         # Rename untouched vars as they are in P
         vars_to_rename = {}
         for n in self.lhs.nodes():
-            if n not in self.removed_nodes():
-                new_var_name = p_vars[keys_by_value(self.p_lhs, n)[0]]
+            if n not in plan.removed_nodes:
+                new_var_name = p_vars[plan.lhs_preimages[n][0]]
                 vars_to_rename[lhs_vars[n]] = new_var_name
                 carry_variables.remove(lhs_vars[n])
         if len(vars_to_rename) > 0:
@@ -1614,13 +1952,13 @@ class Rule(object):
             carry_variables.add(v)
 
         # Generate node attrs removal subquery
-        for node, attrs in self.removed_node_attrs().items():
+        for node, attrs in plan.removed_node_attrs.items():
             query += "// Removing properties from node '{}' of P \n".format(node)
             query += cypher.remove_attributes(p_vars[node], attrs)
             query += "\n\n"
 
         # Generate edge attrs removal subquery
-        for e, attrs in self.removed_edge_attrs().items():
+        for e, attrs in plan.removed_edge_attrs.items():
             u = e[0]
             v = e[1]
             query += "// Removing properties from edge {}->{} of P \n".format(
@@ -1633,11 +1971,17 @@ class Rule(object):
             query += "\n\n"
 
         # Generate merging subquery
-        for rhs_key, p_nodes in self.merged_nodes().items():
+        for rhs_key, p_nodes in plan.merged_nodes.items():
             query +=\
                 "// Merging nodes '{}' of the preserved part ".format(p_nodes) +\
                 "into '{}' \n".format(rhs_key)
-            merged_id = "_".join(instance[self.p_lhs[p_n]]for p_n in p_nodes)
+            # Ids of the merged nodes are generated by the database
+            # (`ignore_naming`), the merged id is only informative
+            if batch:
+                merged_id = rhs_key
+            else:
+                merged_id = "_".join(
+                    instance[self.p_lhs[p_n]] for p_n in p_nodes)
             q, carry_variables = cypher.merging_query1(
                 original_vars=[p_vars[n] for n in p_nodes],
                 merged_var=rhs_vars[rhs_key],
@@ -1652,7 +1996,7 @@ class Rule(object):
             query += "\n\n"
 
         # Generate nodes addition subquery
-        for rhs_node in self.added_nodes():
+        for rhs_node in plan.added_nodes:
             query += "// Adding node '{}' from the rhs \n".format(rhs_node)
             if generate_var_ids:
                 new_node_id_var = cypher.generate_var_name()
@@ -1669,9 +2013,9 @@ class Rule(object):
         # Rename untouched vars as they are in rhs
         vars_to_rename = {}
         for n in self.rhs.nodes():
-            if n not in self.added_nodes() and\
-               n not in self.merged_nodes().keys():
-                prev_var_name = p_vars[keys_by_value(self.p_rhs, n)[0]]
+            if n not in plan.added_nodes and\
+               n not in plan.merged_nodes.keys():
+                prev_var_name = p_vars[plan.rhs_preimages[n][0]]
                 vars_to_rename[prev_var_name] = rhs_vars[n]
                 if prev_var_name in carry_variables:
                     carry_variables.remove(prev_var_name)
@@ -1697,7 +2041,7 @@ class Rule(object):
             carry_variables.add(v)
 
         # Generate node attrs addition subquery
-        for rhs_node, attrs in self.added_node_attrs().items():
+        for rhs_node, attrs in plan.added_node_attrs.items():
             query += "// Adding properties to the node " +\
                 "'{}' from the rhs \n".format(rhs_node)
             query += cypher.add_attributes(rhs_vars[rhs_node], attrs)
@@ -1708,7 +2052,7 @@ class Rule(object):
         #     "WITH [] as added_edges, " +
         #     ", ".join(carry_variables) + "\n"
         # )
-        for u, v in self.added_edges():
+        for u, v in plan.added_edges:
             query += "// Adding edge '{}->{}' from the rhs \n".format(u, v)
             new_edge_var = rhs_vars[u] + "_" + rhs_vars[v]
             query += cypher.add_edge(
@@ -1716,12 +2060,12 @@ class Rule(object):
                 source_var=rhs_vars[u],
                 target_var=rhs_vars[v],
                 edge_label=edge_label)
-            if (u, v) in self.added_edge_attrs().keys():
+            if (u, v) in plan.added_edge_attrs.keys():
                 carry_variables.add(new_edge_var)
             query += "\n\n"
 
         # Generate edge attrs addition subquery
-        for e, attrs in self.added_edge_attrs().items():
+        for e, attrs in plan.added_edge_attrs.items():
             u = e[0]
             v = e[1]
             query += "// Adding properties to an edge " +\
@@ -1729,7 +2073,7 @@ class Rule(object):
             query += cypher.with_vars(carry_variables) + '\n'
 
             edge_var = rhs_vars[u] + "_" + rhs_vars[v]
-            if (u, v) not in self.added_edges():
+            if (u, v) not in plan.added_edges:
                 query += "MATCH ({})-[{}:edge]->({})\n".format(
                     rhs_vars[u], edge_var, rhs_vars[v])
                 carry_variables.add(edge_var)
@@ -1739,13 +2083,227 @@ class Rule(object):
             query += "\n\n"
 
         query += "// Return statement \n"
-        query += cypher.return_vars(carry_variables)
+        if batch:
+            carry_variables.remove("instance")
+            query += cypher.return_vars(
+                list(carry_variables) +
+                ["instance.index as instance_index"])
+        else:
+            query += cypher.return_vars(carry_variables)
 
         # Dictionary defining a mapping from the generated
         # unique variable names to the names of nodes of the rhs
         rhs_vars_inverse = {v: k for k, v in rhs_vars.items()}
 
-        return query, rhs_vars_inverse
+        return query, rhs_vars_inverse, (lhs_vars, p_vars)
+
+    def _cypher_batch_row(self, instance, plan, lhs_vars, p_vars):
+        """Build the row of `$instances` of a batch query for an instance."""
+        row = dict(
+            (lhs_vars[n], "{}".format(instance[n]))
+            for n in self.lhs.nodes())
+        sucs_to_ignore, preds_to_ignore = self._clone_ignore_sets(
+            instance, plan)
+        for n in sucs_to_ignore.keys():
+            row["{}_sucIgnore".format(p_vars[n])] = [
+                "{}".format(i) for i in sucs_to_ignore[n]]
+            row["{}_predIgnore".format(p_vars[n])] = [
+                "{}".format(i) for i in preds_to_ignore[n]]
+        return row
 
     def plot(self, filename=None, title=None):
         plot_rule(self, filename, title)
+
+
+class RulePlan(object):
+    """Precomputed delta of a rule.
+
+    The plan contains the inverse maps of the homomorphisms `p_lhs`
+    and `p_rhs` and the sets of the nodes, edges and attributes
+    added, removed, cloned and merged by the rule. It is computed
+    once per rule (see `Rule.plan`) and must not be modified.
+
+    Attributes
+    ----------
+    lhs_preimages : dict
+        Dictionary whose keys are nodes of `lhs` and whose values
+        are tuples of their preimages in `p`
+    rhs_preimages : dict
+        Dictionary whose keys are nodes of `rhs` and whose values
+        are tuples of their preimages in `p`
+    added_nodes, added_edges, removed_nodes, removed_edges : frozenset
+    added_node_attrs, added_edge_attrs : dict
+    removed_node_attrs, removed_edge_attrs : dict
+    merged_nodes, cloned_nodes : dict
+        Dictionaries whose values are frozensets of nodes of `p`
+    is_restrictive, is_relaxing : bool
+    cypher_batch_queries : dict
+        Cache of the batched Cypher queries of the rule (see
+        `Rule.to_cypher_batch`), keys are pairs of node and edge labels
+
+    See the corresponding methods of `Rule`.
+    """
+
+    def __init__(self, rule):
+        """Compute the plan of a rule."""
+        self._components = (
+            rule.p, rule.lhs, rule.rhs, rule.p_lhs, rule.p_rhs)
+        p, lhs, rhs = rule.p, rule.lhs, rule.rhs
+
+        self.lhs_preimages = _inverse(lhs.nodes(), rule.p_lhs)
+        self.rhs_preimages = _inverse(rhs.nodes(), rule.p_rhs)
+
+        # Deletions and clones
+        self.removed_nodes = frozenset(
+            n for n, p_nodes in self.lhs_preimages.items()
+            if len(p_nodes) == 0)
+        self.cloned_nodes = dict(
+            (n, frozenset(p_nodes))
+            for n, p_nodes in self.lhs_preimages.items()
+            if len(p_nodes) > 1)
+
+        removed_edges = set()
+        removed_edge_attrs = dict()
+        for s, t in lhs.edges():
+            new_attrs = {}
+            for s_p_node in self.lhs_preimages[s]:
+                for t_p_node in self.lhs_preimages[t]:
+                    if not p.has_edge(s_p_node, t_p_node):
+                        removed_edges.add((s_p_node, t_p_node))
+                    else:
+                        new_attrs = attrs_union(
+                            new_attrs,
+                            dict_sub(lhs.edge[s][t],
+                                     p.edge[s_p_node][t_p_node]))
+            if len(new_attrs) > 0:
+                normalize_attrs(new_attrs)
+                removed_edge_attrs[(s, t)] = new_attrs
+        self.removed_edges = frozenset(removed_edges)
+        self.removed_edge_attrs = removed_edge_attrs
+
+        self.removed_node_attrs = dict()
+        for node, p_nodes in self.lhs_preimages.items():
+            new_attrs = {}
+            for p_node in p_nodes:
+                new_attrs = attrs_union(new_attrs, dict_sub(
+                    lhs.node[node], p.node[p_node]))
+            if len(new_attrs) > 0:
+                normalize_attrs(new_attrs)
+                self.removed_node_attrs[node] = new_attrs
+
+        # Additions and merges
+        self.added_nodes = frozenset(
+            n for n, p_nodes in self.rhs_preimages.items()
+            if len(p_nodes) == 0)
+        self.merged_nodes = dict(
+            (n, frozenset(p_nodes))
+            for n, p_nodes in self.rhs_preimages.items()
+            if len(p_nodes) > 1)
+
+        added_edges = set()
+        added_edge_attrs = dict()
+        for s, t in rhs.edges():
+            s_p_nodes = self.rhs_preimages[s]
+            t_p_nodes = self.rhs_preimages[t]
+            if len(s_p_nodes) == 0 or len(t_p_nodes) == 0:
+                added_edges.add((s, t))
+                if len(rhs.edge[s][t]) > 0:
+                    added_edge_attrs[(s, t)] = rhs.edge[s][t]
+                continue
+            found_edge = False
+            new_attrs = {}
+            for s_p_node in s_p_nodes:
+                for t_p_node in t_p_nodes:
+                    if p.has_edge(s_p_node, t_p_node):
+                        found_edge = True
+                        new_attrs = attrs_union(
+                            new_attrs,
+                            dict_sub(rhs.edge[s][t],
+                                     p.edge[s_p_node][t_p_node]))
+            if not found_edge:
+                added_edges.add((s, t))
+            if len(new_attrs) > 0:
+                added_edge_attrs[(s, t)] = new_attrs
+        self.added_edges = frozenset(added_edges)
+        self.added_edge_attrs = added_edge_attrs
+
+        self.added_node_attrs = dict()
+        for node, p_nodes in self.rhs_preimages.items():
+            if len(p_nodes) == 0:
+                if len(rhs.node[node]) > 0:
+                    self.added_node_attrs[node] = rhs.node[node]
+            new_attrs = {}
+            for p_node in p_nodes:
+                new_attrs = attrs_union(new_attrs, dict_sub(
+                    rhs.node[node], p.node[p_node]))
+            if len(new_attrs) > 0:
+                self.added_node_attrs[node] = new_attrs
+
+        self.is_restrictive = (
+            len(self.removed_nodes) > 0 or
+            len(self.cloned_nodes) > 0 or
+            len(self.removed_node_attrs) > 0 or
+            len(self.removed_edges) > 0 or
+            len(self.removed_edge_attrs) > 0)
+        self.is_relaxing = (
+            len(self.added_nodes) > 0 or
+            len(self.merged_nodes) > 0 or
+            len(self.added_node_attrs) > 0 or
+            len(self.added_edges) > 0 or
+            len(self.added_edge_attrs) > 0)
+
+        self.cypher_batch_queries = dict()
+
+    def is_plan_of(self, rule):
+        """Test if the plan was computed for the components of the rule."""
+        return all(
+            a is b for a, b in zip(self._components, (
+                rule.p, rule.lhs, rule.rhs, rule.p_lhs, rule.p_rhs)))
+
+
+def _inverse(nodes, mapping):
+    """Map the nodes to the tuples of their preimages by a mapping."""
+    preimages = dict((node, []) for node in nodes)
+    for key, value in mapping.items():
+        preimages.setdefault(value, []).append(key)
+    return dict((node, tuple(keys)) for node, keys in preimages.items())
+
+
+def _copy_attrs_dict(attrs):
+    return dict((key, dict(value)) for key, value in attrs.items())
+
+
+def _add_or_merge_node(graph, node, attrs):
+    if node in graph.node:
+        primitives.add_node_attrs(graph, node, attrs)
+    else:
+        primitives.add_node(graph, node, attrs)
+
+
+def _add_or_merge_edge(graph, s, t, attrs):
+    if graph.has_edge(s, t):
+        primitives.add_edge_attrs(graph, s, t, attrs)
+    else:
+        primitives.add_edge(graph, s, t, attrs)
+
+
+def _edge_key(graph, s, t):
+    if graph.is_directed():
+        return (s, t)
+    return frozenset([s, t])
+
+
+def _fresh_name(used_names, prefix, counters):
+    """Generate a name starting by a prefix (as `unique_node_id`).
+
+    `counters` -- dictionary of the last indices used for
+    the prefixes.
+    """
+    name = prefix
+    idx = counters.get(prefix, 0)
+    while name in used_names:
+        idx += 1
+        name = "{}_{}".format(prefix, idx)
+    counters[prefix] = idx
+    used_names.add(name)
+    return name
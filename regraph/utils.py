@@ -1,6 +1,11 @@
 """A collection of utils for ReGraph library."""
 import copy
 
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping
+
 from regraph.command_parser import parser
 from regraph.exceptions import ReGraphError, ParsingError
 from regraph.attribute_sets import AttributeSet, FiniteSet
@@ -94,7 +99,13 @@ def attrs_union(attrs1, attrs2):
 
 
 def keys_by_value(dictionary, val):
-    """Get keys of a dictionary by a value."""
+    """Get keys of a dictionary by a value.
+
+    If `dictionary` is an `IndexedMapping`, the keys are found
+    with its inverse multimap (without scanning the dictionary).
+    """
+    if isinstance(dictionary, IndexedMapping):
+        return dictionary.preimage(val)
     res = []
     for key, value in dictionary.items():
         if value == val:
@@ -872,8 +883,8 @@ def format_typing(typing):
         typing = dict()
     new_typing = dict()
     for key, value in typing.items():
-        if type(value) == dict:
-            new_typing[key] = copy.deepcopy(value)
+        if isinstance(value, Mapping):
+            new_typing[key] = copy.deepcopy(dict(value))
         else:
             try:
                 if len(value) == 2:
@@ -900,6 +911,214 @@ def id_of(elements):
     return {e: e for e in elements}
 
 
+class IdentityMapping(Mapping):
+    """Identity mapping on a collection of elements.
+
+    The mapping is a view: it is defined on the elements of
+    the collection at the moment of the access (e.g. on the
+    nodes of a graph given by `graph.node`).
+    """
+
+    def __init__(self, elements):
+        self.elements = elements
+
+    def __getitem__(self, key):
+        if key not in self.elements:
+            raise KeyError(key)
+        return key
+
+    def __contains__(self, key):
+        return key in self.elements
+
+    def __iter__(self):
+        return iter(self.elements)
+
+    def __len__(self):
+        return len(self.elements)
+
+
+class DeltaMapping(MutableMapping):
+    """Mapping given by a base mapping and a delta.
+
+    The base mapping is never modified: the assigned keys are
+    kept in `local` and the deleted keys of the base in `removed`,
+    so the cost of the modifications does not depend on the size
+    of the base. For example, `DeltaMapping(IdentityMapping(g.node))`
+    is the identity on the nodes of a graph `g` in which only
+    the changed nodes are stored.
+    """
+
+    def __init__(self, base, local=None, removed=None):
+        self.base = base
+        self.local = dict() if local is None else local
+        self.removed = set() if removed is None else removed
+
+    @classmethod
+    def layer(cls, mapping):
+        """Create a new layer of changes over a mapping.
+
+        If `mapping` is itself a `DeltaMapping`, the new layer shares
+        its base and copies its delta (the layers are not stacked).
+        The modifications of the new layer do not affect `mapping`.
+        """
+        if isinstance(mapping, IndexedMapping):
+            mapping = mapping.data
+        if isinstance(mapping, DeltaMapping):
+            return cls(mapping.base, dict(mapping.local),
+                       set(mapping.removed))
+        return cls(mapping)
+
+    def delta_size(self):
+        """Return the number of the keys changed with respect to the base."""
+        return len(self.local) + len(self.removed)
+
+    def compact(self):
+        """Fold the delta into a new base dictionary.
+
+        The previous base is not modified (it may be shared with other
+        layers), the cost of the compaction is linear in the size
+        of the mapping.
+        """
+        self.base = dict(self.items())
+        self.local = dict()
+        self.removed = set()
+
+    def __getitem__(self, key):
+        if key in self.local:
+            return self.local[key]
+        if key in self.removed:
+            raise KeyError(key)
+        return self.base[key]
+
+    def __setitem__(self, key, value):
+        self.local[key] = value
+        self.removed.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.local.pop(key, None)
+        if key in self.base:
+            self.removed.add(key)
+
+    def __contains__(self, key):
+        if key in self.local:
+            return True
+        return key not in self.removed and key in self.base
+
+    def __iter__(self):
+        for key in self.base:
+            if key not in self.removed and key not in self.local:
+                yield key
+        for key in self.local:
+            yield key
+
+    def __len__(self):
+        hidden = len([k for k in self.removed if k in self.base])
+        overridden = len([k for k in self.local if k in self.base])
+        return len(self.base) - hidden - overridden + len(self.local)
+
+
+class IndexedMapping(MutableMapping):
+    """Mapping maintaining the inverse multimap of its values.
+
+    The inverse multimap (a value -> the keys mapped to it) is built
+    at the first call of `preimage` and is then kept in sync by the
+    modifications of the mapping. The wrapped mapping (`data`) is
+    either a dictionary or a `DeltaMapping`, it should only be
+    modified through the `IndexedMapping`.
+    """
+
+    def __init__(self, data=None):
+        self.data = dict() if data is None else data
+        # value -> dict of keys (used as an ordered set)
+        self._inverse = None
+
+    @classmethod
+    def of(cls, mapping):
+        """Return `mapping` if it is indexed, index it otherwise."""
+        if isinstance(mapping, IndexedMapping):
+            return mapping
+        return cls(mapping)
+
+    def preimage(self, value):
+        """Return the list of the keys mapped to a value."""
+        if self._inverse is None:
+            self._inverse = dict()
+            for key, val in self.data.items():
+                self._inverse.setdefault(val, dict())[key] = None
+        return list(self._inverse.get(value, ()))
+
+    def adopt_inverse(self, other):
+        """Take over the inverse of a mapping of which this one is a layer.
+
+        If the data of the mapping is a `DeltaMapping` layered over the
+        data of `other` (see `DeltaMapping.layer`) and the inverse of
+        `other` is built, the inverse is updated with the keys changed
+        by the layers and handed over (`other` rebuilds its own at the
+        next call of `preimage`). The cost is proportional to the size
+        of the deltas.
+        """
+        if not isinstance(other, IndexedMapping) or other._inverse is None:
+            return
+        data = self.data
+        old_data = other.data
+        if not isinstance(data, DeltaMapping):
+            return
+        if isinstance(old_data, DeltaMapping):
+            if data.base is not old_data.base:
+                return
+            changed = set(old_data.local).union(old_data.removed)
+        elif data.base is old_data:
+            changed = set()
+        else:
+            return
+        changed.update(data.local)
+        changed.update(data.removed)
+
+        self._inverse = other._inverse
+        other._inverse = None
+        for key in changed:
+            if key in old_data:
+                self._unindex(key, old_data[key])
+            if key in data:
+                self._inverse.setdefault(data[key], dict())[key] = None
+
+    def _unindex(self, key, value):
+        keys = self._inverse[value]
+        del keys[key]
+        if len(keys) == 0:
+            del self._inverse[value]
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        if self._inverse is not None:
+            if key in self.data:
+                self._unindex(key, self.data[key])
+            self._inverse.setdefault(value, dict())[key] = None
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        value = self.data[key]
+        del self.data[key]
+        if self._inverse is not None:
+            self._unindex(key, value)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
 def restrict_mapping(nodes, mapping):
     new_mapping = {}
     for node in nodes:
@@ -97,6 +97,13 @@ class TestCategoryUtils:
         assert_equals(homAB, self.homAB)
         assert_equals(homAC, self.homAC)
 
+        A2, homAB2, homAC2 = pullback(
+            self.B, self.C, self.D, self.homBD, self.homCD, check=False)
+        assert_equals(set(A2.nodes()), set(A.nodes()))
+        assert_equals(set(A2.edges()), set(A.edges()))
+        assert_equals(homAB2, homAB)
+        assert_equals(homAC2, homAC)
+
     def test_pullback_complement(self):
         C, homAC, homCD = pullback_complement(
             self.A, self.B, self.D, self.homAB, self.homBD
@@ -120,6 +127,35 @@ class TestCategoryUtils:
         assert_graph_eq(test_graph, C)
         assert(id(D_copy) == id(C))
 
+    def test_pullback_complement_delta(self):
+        A = nx.DiGraph()
+        A.add_nodes_from([2, "2_clone", 3])
+        A.add_edges_from([(2, 3), ("2_clone", 3)])
+        a_b = {2: 2, "2_clone": 2, 3: 3}
+        C, homAC, homCD = pullback_complement(
+            A, self.B, self.D, a_b, self.homBD)
+        # Only the removed node and the clone are stored
+        assert_equals(homCD.local, {homAC["2_clone"]: "circle"})
+        assert_equals(homCD.removed, {"square"})
+        expected = dict(
+            [(n, n) for n in self.D.nodes() if n != "square"] +
+            [(homAC["2_clone"], "circle")])
+        assert_equals(dict(homCD), expected)
+        assert_equals(set(homCD.keys()), set(C.nodes()))
+
+    def test_pullback_complement_inplace_removal(self):
+        D_copy = copy.deepcopy(self.D)
+        A = nx.DiGraph()
+        A.add_nodes_from([2, 3])
+        C, homAC, homCD = pullback_complement(
+            A, self.B, D_copy, {2: 2, 3: 3}, self.homBD, inplace=True)
+        assert(id(D_copy) == id(C))
+        assert("square" not in C.nodes())
+        assert_equals(dict(homCD), dict((n, n) for n in C.nodes()))
+        # further modifications of the graph do not affect the typing
+        C.add_node("new_node")
+        assert("new_node" not in homCD)
+
     def test_pushout(self):
         D, homBD, homCD = pushout(
             self.A, self.B, self.C, self.homAB, self.homAC
@@ -147,6 +183,23 @@ class TestCategoryUtils:
                       len(self.D.edges()))
         assert(id(B_copy) == id(D))
 
+    def test_pushout_overlapping_merges(self):
+        # b1 ~ b2 (through c1) and b2 ~ b3 (through c2 and c3)
+        A = nx.DiGraph()
+        A.add_nodes_from(["a1", "a2", "a3", "a4", "a5"])
+        B = nx.DiGraph()
+        B.add_nodes_from(["b1", "b2", "b3"])
+        B.add_edges_from([("b1", "b3")])
+        C = nx.DiGraph()
+        C.add_nodes_from(["c1", "c2", "c3"])
+        homAB = {"a1": "b1", "a2": "b2", "a3": "b2", "a4": "b3", "a5": "b3"}
+        homAC = {"a1": "c1", "a2": "c1", "a3": "c2", "a4": "c2", "a5": "c3"}
+        D, homBD, homCD = pushout(A, B, C, homAB, homAC)
+        assert_equals(len(D.nodes()), 1)
+        assert_equals(len(D.edges()), 1)
+        assert_equals(len(set(homBD.values())), 1)
+        assert_equals(set(homCD.values()), set(homBD.values()))
+
     def test_pushout_symmetry_directed(self):
 
         A = nx.DiGraph()
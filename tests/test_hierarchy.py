@@ -7,8 +7,10 @@ from nose.tools import raises
 
 from regraph import Rule
 from regraph import NetworkXHierarchy
-from regraph import (HierarchyError)
+from regraph import IncrementalMatcher
+from regraph import (HierarchyError, ReGraphError)
 import regraph.networkx.primitives as prim
+from regraph.utils import DeltaMapping, IndexedMapping
 
 
 class TestHierarchy(object):
@@ -192,6 +194,51 @@ class TestHierarchy(object):
              "square": "white_square",
              "triangle": "black_triangle"})
 
+    @raises(HierarchyError)
+    def test_add_typing_not_commuting(self):
+        g2_g0 = dict(
+            (n, self.hierarchy.typing["g1"]["g0"][t])
+            for n, t in self.hierarchy.typing["g2"]["g1"].items())
+        h = copy.deepcopy(self.hierarchy)
+        h.add_typing("g2", "g0", g2_g0)
+        assert(dict(h.get_typing("g2", "g0")) == g2_g0)
+
+        self.hierarchy.add_typing(
+            "g2", "g0", dict((n, "circle") for n in g2_g0.keys()))
+
+    def _add_partially_typed_rule(self):
+        g = nx.DiGraph()
+        prim.add_nodes_from(g, [
+            ("n", {"a": {1, 2, 3}}),
+            ("m", {"a": {1, 2, 3}})
+        ])
+        prim.add_edges_from(g, [
+            ("n", "n"), ("m", "m"), ("n", "m"), ("m", "n")])
+        self.hierarchy.add_graph("gx", g)
+
+        lhs = nx.DiGraph()
+        prim.add_nodes_from(lhs, ["x", "y"])
+        prim.add_edges_from(lhs, [("x", "y")])
+        self.hierarchy.add_rule("r", Rule.from_transform(lhs))
+        self.hierarchy.add_rule_typing(
+            "r", "g1", {"x": "black_circle"}, {"x": "black_circle"})
+        self.hierarchy.add_rule_typing("r", "gx", {"x": "n"}, {"x": "n"})
+
+    def test_add_typing_partially_typed_rule(self):
+        self._add_partially_typed_rule()
+        self.hierarchy.add_typing(
+            "g1", "gx",
+            dict((n, "n") for n in self.hierarchy.graph["g1"].nodes()))
+        assert(dict(self.hierarchy.get_typing("g2", "gx")) == dict(
+            (n, "n") for n in self.hierarchy.graph["g2"].nodes()))
+
+    @raises(HierarchyError)
+    def test_add_typing_not_commuting_rule(self):
+        self._add_partially_typed_rule()
+        self.hierarchy.add_typing(
+            "g1", "gx",
+            dict((n, "m") for n in self.hierarchy.graph["g1"].nodes()))
+
     def test_remove_graph(self):
         h = copy.deepcopy(self.hierarchy)
         h.remove_node("g1", reconnect=True)
@@ -221,6 +268,69 @@ class TestHierarchy(object):
         )
         assert(len(instances) == 1)
 
+        instance = self.hierarchy.find_first_matching(
+            graph_id="g1",
+            pattern=pattern,
+            pattern_typing={"g0": pattern_typing}
+        )
+        assert(instance in self.hierarchy.find_matching(
+            "g1", pattern, {"g0": pattern_typing}))
+        assert(len(list(self.hierarchy.iter_matching(
+            "g1", pattern, limit=1))) == 1)
+
+        cycle = nx.DiGraph()
+        prim.add_nodes_from(cycle, ["x", "y"])
+        prim.add_edges_from(cycle, [("x", "y"), ("y", "x")])
+        instances = self.hierarchy.find_matching("g1", cycle)
+        distinct = self.hierarchy.find_matching(
+            "g1", cycle, distinct_embeddings=True)
+        assert(len(distinct) * 2 == len(instances))
+        typed_distinct = self.hierarchy.find_matching(
+            "g1", cycle, {"g00": {"x": "black", "y": "white"}},
+            distinct_embeddings=True)
+        assert(len(typed_distinct) == len(self.hierarchy.find_matching(
+            "g1", cycle, {"g00": {"x": "black", "y": "white"}})))
+        indexed_typing = {"g0": IndexedMapping({"x": "circle", "y": "circle"})}
+        typed_distinct = self.hierarchy.find_matching(
+            "g1", cycle, indexed_typing, distinct_embeddings=True)
+        assert(len(typed_distinct) * 2 == len(self.hierarchy.find_matching(
+            "g1", cycle, indexed_typing)))
+        assert(len(typed_distinct) == 1)
+
+        partial = self.hierarchy.find_matching("g1", cycle, max_steps=1)
+        assert(partial.truncated and partial.steps == 1)
+
+    def test_typing_index(self):
+        index = self.hierarchy.get_typing_index("g2", "g0")
+        assert(index.instances_of("circle") == {1, 2, 4})
+        assert(index.instances_of("triangle") == {6, 7})
+        assert(self.hierarchy.get_typing_index("g2", "g0") is index)
+
+        pattern = nx.DiGraph()
+        prim.add_nodes_from(pattern, ["x", "y"])
+        prim.add_edges_from(pattern, [("x", "y")])
+        instances = self.hierarchy.find_matching(
+            "g2", pattern, {"g0": {"x": "circle", "y": "square"}})
+        assert(len(instances) == 2)
+        assert({"x": 2, "y": 3} in instances)
+
+        self.hierarchy.rename_node("g2", 2, "two")
+        index = self.hierarchy.get_typing_index("g2", "g0")
+        assert(index.instances_of("circle") == {1, "two", 4})
+        instances = self.hierarchy.find_matching(
+            "g2", pattern, {"g0": {"x": "circle", "y": "square"}})
+        assert({"x": "two", "y": 3} in instances)
+
+        g2 = self.hierarchy.graph["g2"]
+        index = self.hierarchy.get_typing_index("g2", "g0")
+        assert(index.untyped_nodes() == set())
+        prim.add_node(g2, "new_node")
+        assert(index.untyped_nodes() == {"new_node"})
+        prim.remove_node(g2, "new_node")
+        prim.remove_node(g2, "two")
+        assert(index.untyped_nodes() == set())
+        assert(index.instances_of("circle") == {1, 4})
+
     def test_rewrite(self):
         pattern = nx.DiGraph()
         prim.add_nodes_from(pattern, [
@@ -322,6 +432,32 @@ class TestHierarchy(object):
         new_h = NetworkXHierarchy.from_json(res)
         assert(self.hierarchy == new_h)
 
+    def test_bulk_load(self):
+        hierarchy = NetworkXHierarchy()
+        with hierarchy.bulk_load():
+            hierarchy.add_graph("t", nx.DiGraph([("a", "b")]))
+            hierarchy.add_graph("m", nx.DiGraph([(1, 2)]))
+            hierarchy.add_graph("g", nx.DiGraph([("x", "y")]))
+            hierarchy.add_typing("m", "t", {1: "a", 2: "b"})
+            hierarchy.add_typing("g", "m", {"x": 1, "y": 2})
+            hierarchy.add_typing("g", "t", {"x": "a", "y": "b"})
+        assert(hierarchy.get_ancestors("g")["t"] == {"x": "a", "y": "b"})
+
+        hierarchy = NetworkXHierarchy()
+        try:
+            with hierarchy.bulk_load():
+                hierarchy.add_graph("t", nx.DiGraph([("a", "a")]))
+                hierarchy.add_graph("m", nx.DiGraph([(1, 1)]))
+                hierarchy.add_graph("g", nx.DiGraph([("x", "x")]))
+                hierarchy.add_graph("t2", nx.DiGraph([("c", "c"), ("d", "d")]))
+                hierarchy.add_typing("t", "t2", {"a": "c"})
+                hierarchy.add_typing("m", "t2", {1: "d"})
+                hierarchy.add_typing("g", "t", {"x": "a"})
+                hierarchy.add_typing("g", "m", {"x": 1})
+            assert(False)
+        except HierarchyError:
+            pass
+
     def test_add_rule(self):
         lhs = nx.DiGraph()
         prim.add_nodes_from(lhs, [
@@ -435,6 +571,340 @@ class TestHierarchy(object):
         self.hierarchy.rewrite(
             "g1", rule, instances[0], lhs_typing, rhs_typing)
 
+    def test_find_rule_matching(self):
+        lhs = nx.DiGraph()
+        prim.add_nodes_from(lhs, ["x", "y"])
+        prim.add_edges_from(lhs, [("x", "y")])
+        rule = Rule.from_transform(lhs)
+        self.hierarchy.add_rule("r", rule)
+        self.hierarchy.add_rule_typing(
+            "r", "g1",
+            {"x": "black_circle", "y": "black_square"},
+            {"x": "black_circle", "y": "black_square"})
+
+        instances = self.hierarchy.find_rule_matching("g2", "r")
+        assert(instances == [{"x": 2, "y": 3}])
+
+        compiled = self.hierarchy.node["r"].compiled_lhs()
+        assert(compiled.pattern is self.hierarchy.node["r"].rule.lhs)
+        assert(self.hierarchy.node["r"].compiled_lhs() is compiled)
+        self.hierarchy.find_rule_matching("g2", "r")
+        assert(self.hierarchy.node["r"].compiled_lhs() is compiled)
+
+        self.hierarchy.node["r"].rule = copy.deepcopy(rule)
+        assert(self.hierarchy.node["r"].compiled_lhs() is not compiled)
+        assert(self.hierarchy.find_rule_matching("g2", "r") == instances)
+
+    def test_rule_typing_by_rule_typing(self):
+        lhs = nx.DiGraph()
+        prim.add_nodes_from(lhs, ["x", "y"])
+        prim.add_edges_from(lhs, [("x", "y")])
+        rule = Rule.from_transform(lhs)
+        self.hierarchy.add_rule("r", rule)
+        self.hierarchy.add_rule_typing(
+            "r", "g1",
+            {"x": "black_circle", "y": "black_square"},
+            {"x": "black_circle", "y": "black_square"})
+        typing = self.hierarchy.edge["r"]["g1"]
+
+        self.hierarchy.add_rule("r2", copy.deepcopy(rule))
+        self.hierarchy.add_rule_typing(
+            "r2", "g1", typing.lhs_mapping, typing.rhs_mapping)
+        assert(dict(self.hierarchy.edge["r2"]["g1"].lhs_mapping) ==
+               dict(typing.lhs_mapping))
+
+        instances = self.hierarchy.find_matching(
+            "g2", rule.lhs, {"g1": typing.lhs_mapping})
+        assert(instances == [{"x": 2, "y": 3}])
+        assert(self.hierarchy.find_rule_matching("g2", "r2") == instances)
+
+    def test_incremental_matcher(self):
+        def _sorted(instances):
+            return sorted([sorted(i.items()) for i in instances])
+
+        pattern = nx.DiGraph()
+        prim.add_nodes_from(pattern, ["x", "y"])
+        prim.add_edges_from(pattern, [("x", "y")])
+        matcher = IncrementalMatcher(self.hierarchy, "g2")
+        matcher.add_pattern("edge", pattern)
+        matcher.add_pattern(
+            "typed_edge", pattern, {"g0": {"x": "circle", "y": "square"}})
+
+        lhs = nx.DiGraph()
+        prim.add_nodes_from(lhs, ["a", "b"])
+        prim.add_edges_from(lhs, [("a", "b")])
+        rule = Rule.from_transform(lhs)
+        rule.inject_clone_node("a")
+        rule.inject_remove_edge("a", "b")
+        instance = self.hierarchy.find_matching("g2", lhs)[0]
+        self.hierarchy.rewrite("g2", rule, instance)
+
+        for key in ["edge", "typed_edge"]:
+            pattern, pattern_typing = matcher._get_pattern(key)
+            assert(_sorted(matcher.instances(key)) == _sorted(
+                self.hierarchy.find_matching(
+                    "g2", pattern, pattern_typing)))
+
+        matcher.detach()
+        assert(len(self.hierarchy._incremental_matchers) == 0)
+
+    def test_transaction(self):
+        original = copy.deepcopy(self.hierarchy)
+        g1 = self.hierarchy.node["g1"].graph
+
+        lhs = nx.DiGraph()
+        prim.add_nodes_from(lhs, ["a", "b"])
+        prim.add_edges_from(lhs, [("a", "b")])
+        rule = Rule.from_transform(lhs)
+        rule.inject_clone_node("a")
+        rule.inject_remove_node("b")
+        rule.inject_add_node("c")
+        instance = self.hierarchy.find_matching("g1", lhs)[0]
+        expected, _ = self.hierarchy.rewrite(
+            "g1", rule, instance, inplace=False)
+
+        with self.hierarchy.transaction() as tx:
+            self.hierarchy.rewrite("g1", rule, instance)
+            assert(self.hierarchy == expected)
+            tx.rollback()
+        assert(self.hierarchy == original)
+        assert(self.hierarchy.node["g1"].graph is g1)
+
+        try:
+            with self.hierarchy.transaction():
+                self.hierarchy.rewrite("g1", rule, instance)
+                raise ValueError()
+        except ValueError:
+            pass
+        assert(self.hierarchy == original)
+
+        with self.hierarchy.transaction() as tx:
+            try:
+                self.hierarchy.transaction()
+                raise ValueError()
+            except ReGraphError:
+                pass
+            self.hierarchy.rewrite("g1", rule, instance)
+        assert(not tx.active)
+        assert(self.hierarchy == expected)
+        assert(self.hierarchy.node["g1"].graph is g1)
+        assert(type(g1) == nx.DiGraph)
+
+    def test_transaction_typed_matching(self):
+        pattern = nx.DiGraph()
+        prim.add_nodes_from(pattern, ["x", "y"])
+        prim.add_edges_from(pattern, [("x", "y")])
+        pattern_typing = {"g0": {"x": "circle", "y": "square"}}
+        assert(len(self.hierarchy.find_matching(
+            "g2", pattern, pattern_typing)) == 2)
+
+        with self.hierarchy.transaction():
+            g2 = self.hierarchy.graph["g2"]
+            prim.add_node(g2, "new")
+            prim.add_edge(g2, 1, "new")
+            instances = self.hierarchy.find_matching(
+                "g2", pattern, pattern_typing)
+            assert({"x": 1, "y": "new"} in instances)
+            assert(len(instances) == 3)
+
+        g2 = self.hierarchy.graph["g2"]
+        prim.add_node(g2, "other")
+        prim.add_edge(g2, 4, "other")
+        instances = self.hierarchy.find_matching(
+            "g2", pattern, pattern_typing)
+        assert({"x": 1, "y": "new"} in instances)
+        assert({"x": 4, "y": "other"} in instances)
+        assert(len(instances) == 4)
+
+    def test_layered_typing(self):
+        original = copy.deepcopy(self.hierarchy)
+        g1_g0 = self.hierarchy.edge["g1"]["g0"].mapping.data
+
+        lhs = nx.DiGraph()
+        prim.add_nodes_from(lhs, ["a"])
+        rule = Rule.from_transform(lhs)
+        rule.inject_remove_node("a")
+        instance = {"a": "white_triangle"}
+
+        new_hierarchy, _ = self.hierarchy.rewrite(
+            "g1", rule, instance, inplace=False)
+        typing = new_hierarchy.edge["g1"]["g0"].mapping.data
+        assert(isinstance(typing, DeltaMapping))
+        assert(typing.removed == {"white_triangle"})
+        assert(typing.delta_size() == 1)
+        assert(typing.base is not g1_g0)
+        assert("white_triangle" not in typing)
+        assert(self.hierarchy == original)
+        new_hierarchy.to_json()
+
+        self.hierarchy.rewrite("g1", rule, instance)
+        typing = self.hierarchy.edge["g1"]["g0"].mapping.data
+        assert(isinstance(typing, DeltaMapping))
+        assert(typing.base is g1_g0)
+        assert(typing.removed == {"white_triangle"})
+        assert(typing.delta_size() == 1)
+        assert("white_triangle" in g1_g0)
+        assert("white_triangle" not in self.hierarchy.graph["g1"].nodes())
+        assert(self.hierarchy.typing["g1"]["g0"] is
+               self.hierarchy.edge["g1"]["g0"].mapping)
+        assert(self.hierarchy == new_hierarchy)
+
+        self.hierarchy.edge["g1"]["g0"].compact()
+        assert(typing.delta_size() == 0)
+        assert(typing.base is not g1_g0)
+        assert(len(typing) == 5)
+
+    def test_layered_typing_inverse(self):
+        typing = self.hierarchy.edge["g1"]["g0"].mapping
+        assert(typing.preimage("triangle") == [
+            "black_triangle", "white_triangle"])
+
+        lhs = nx.DiGraph()
+        prim.add_nodes_from(lhs, ["a"])
+        rule = Rule.from_transform(lhs)
+        rule.inject_remove_node("a")
+        self.hierarchy.rewrite("g1", rule, {"a": "white_triangle"})
+
+        new_typing = self.hierarchy.edge["g1"]["g0"].mapping
+        assert(new_typing is not typing)
+        assert(new_typing._inverse is not None)
+        assert(new_typing.preimage("triangle") == ["black_triangle"])
+        assert(set(new_typing.preimage("circle")) == {
+            "black_circle", "white_circle"})
+        assert(typing.preimage("triangle") == [
+            "black_triangle", "white_triangle"])
+
+    def test_propagate_removed_edge_attrs(self):
+        prim.add_edge_attrs(
+            self.hierarchy.graph["g1"], "black_square", "white_triangle",
+            {"new_attrs": {3, 4}})
+
+        lhs = nx.DiGraph()
+        prim.add_nodes_from(lhs, ["s", "t"])
+        prim.add_edges_from(lhs, [("s", "t", {"new_attrs": {3}})])
+        rule = Rule.from_transform(lhs)
+        rule.inject_remove_edge_attrs("s", "t", {"new_attrs": {3}})
+        self.hierarchy.rewrite("g0", rule, {"s": "square", "t": "triangle"})
+
+        assert(prim.get_edge(
+            self.hierarchy.graph["g0"], "square", "triangle") ==
+            {"new_attrs": {4}})
+        assert(prim.get_edge(
+            self.hierarchy.graph["g1"], "black_square", "white_triangle") ==
+            {"new_attrs": {4}})
+
+    def test_typing_inverse(self):
+        typing = self.hierarchy.edge["g1"]["g0"]
+        instances = set(typing.mapping.preimage("circle"))
+        assert(instances == set(
+            n for n, t in typing.mapping.items() if t == "circle"))
+        node = instances.pop()
+        typing.mapping[node] = "square"
+        assert(node not in typing.mapping.preimage("circle"))
+        assert(node in typing.mapping.preimage("square"))
+        del typing.mapping[node]
+        assert(node not in typing.mapping.preimage("square"))
+
+        typing.rename_target("circle", "round")
+        assert(typing.mapping.preimage("circle") == [])
+        assert(set(typing.mapping.preimage("round")) == instances)
+
+    def test_rewrite_workers(self):
+        pattern = nx.DiGraph()
+        prim.add_nodes_from(pattern, ["x", "y"])
+        prim.add_edges_from(pattern, [("x", "y")])
+        rule = Rule.from_transform(pattern)
+        rule.inject_clone_node("x")
+        rule.inject_remove_node("y")
+        instance = self.hierarchy.find_first_matching("g0", pattern)
+
+        expected, _ = self.hierarchy.rewrite(
+            "g0", rule, instance, inplace=False)
+        new_hierarchy, _ = self.hierarchy.rewrite(
+            "g0", rule, instance, inplace=False, workers=2)
+        assert(new_hierarchy == expected)
+
+    def test_rewrite_many(self):
+        pattern = nx.DiGraph()
+        prim.add_nodes_from(pattern, ["x"])
+        rule = Rule.from_transform(pattern)
+        rule.inject_clone_node("x")
+        rule.inject_add_node("new")
+        rule.inject_add_edge("new", "x")
+        lhs_typing = {"g0": {"x": "circle"}}
+        instances = self.hierarchy.find_matching("g1", pattern, lhs_typing)
+
+        expected = copy.deepcopy(self.hierarchy)
+        for instance in instances:
+            expected.rewrite("g1", rule, instance, lhs_typing)
+        new_hierarchy, rhs_g_primes = self.hierarchy.rewrite_many(
+            "g1", rule, instances, lhs_typing, inplace=False)
+        # The propagated clones are symmetric: compare the typings
+        # by the numbers of instances of the types
+        for graph_id in expected.graphs():
+            assert(prim.equal(
+                new_hierarchy.node[graph_id].graph,
+                expected.node[graph_id].graph))
+        for s, t in expected.edges():
+            assert(
+                sorted(map(str, new_hierarchy.edge[s][t].mapping.values())) ==
+                sorted(map(str, expected.edge[s][t].mapping.values())))
+        assert(len(rhs_g_primes) == len(instances))
+        for rhs_g_prime in rhs_g_primes:
+            assert(rhs_g_prime["new"] in new_hierarchy.node["g1"].graph.nodes())
+
+    def test_run_rules(self):
+        lhs = nx.DiGraph()
+        prim.add_nodes_from(lhs, ["a", "b"])
+        prim.add_edge(lhs, "a", "b")
+        remove_edge = Rule.from_transform(lhs)
+        remove_edge.inject_remove_edge("a", "b")
+
+        lhs = nx.DiGraph()
+        prim.add_node(lhs, "a", {"tmp": True})
+        remove_tmp = Rule.from_transform(lhs)
+        remove_tmp.inject_remove_node("a")
+
+        for strategy in ["alap", "priority", "random"]:
+            hierarchy = NetworkXHierarchy()
+            graph = nx.DiGraph()
+            prim.add_nodes_from(graph, range(10))
+            prim.add_node(graph, "t", {"tmp": True})
+            prim.add_edges_from(graph, [(i, i + 1) for i in range(9)])
+            hierarchy.add_graph("g", graph)
+            hierarchy.add_rule("remove_edge", remove_edge)
+            hierarchy.add_rule("remove_tmp", remove_tmp)
+
+            report = hierarchy.run_rules(
+                "g", ["remove_tmp", "remove_edge"], strategy, seed=1)
+            g = hierarchy.node["g"].graph
+            assert(report.fixpoint)
+            assert(len(g.edges()) == 0)
+            assert("t" not in g.nodes())
+            assert(report.applications["remove_tmp"] == 1)
+            assert(report.applications["remove_edge"] == 9)
+            if strategy == "random":
+                assert(report.steps == 10)
+            else:
+                assert(report.steps == 2)
+            assert(len(hierarchy._incremental_matchers) == 0)
+
+        graph = nx.DiGraph()
+        prim.add_nodes_from(graph, range(10))
+        prim.add_edges_from(graph, [(i, i + 1) for i in range(9)])
+        hierarchy = NetworkXHierarchy()
+        hierarchy.add_graph("g", graph)
+        hierarchy.add_rule("remove_edge", remove_edge)
+        report = hierarchy.run_rules(
+            "g", ["remove_edge"], "random", max_steps=3)
+        assert(not report.fixpoint)
+        assert(report.steps == 3)
+        assert(len(hierarchy.node["g"].graph.edges()) == 6)
+
+    @raises(ReGraphError)
+    def test_run_rules_strategy(self):
+        self.hierarchy.run_rules("g1", [], "unknown")
+
     def test_add_rule_multiple_typing(self):
 
         lhs = nx.DiGraph()
@@ -556,6 +1026,24 @@ class TestHierarchy(object):
         assert("g1" in anc.keys())
         assert("g0" in anc.keys())
         assert("g00" in anc.keys())
+        assert(self.hierarchy.get_ancestors("g2") is anc)
+        g1_anc = self.hierarchy.get_ancestors("g1")
+
+        self.hierarchy.rename_node("g2", 2, "two")
+        assert(self.hierarchy.get_ancestors("g1") is g1_anc)
+        anc = self.hierarchy.get_ancestors("g2")
+        assert("two" in anc["g0"].keys())
+        assert(2 not in anc["g0"].keys())
+
+        self.hierarchy.rename_node("g1", "black_circle", "bc")
+        assert(self.hierarchy.get_ancestors("g1") is not g1_anc)
+        assert(self.hierarchy.get_ancestors("g2") is not anc)
+        assert(self.hierarchy.get_ancestors("g2")["g1"]["two"] == "bc")
+
+        new = self.hierarchy.duplicate_subgraph(["g1"], "_copy")
+        anc = self.hierarchy.get_ancestors("g2")
+        assert(new["g1"] in anc.keys())
+        assert(anc[new["g1"]] == anc["g1"])
 
     @raises(HierarchyError)
     def test_add_typing_advanced(self):
@@ -1,7 +1,11 @@
 """Collection of tests for ReGraph_neo4j graphs."""
 
+import networkx as nx
+
 from regraph.neo4j import Neo4jGraph
+from regraph.rules import Rule
 from regraph.neo4j.cypher_utils import *
+from regraph.neo4j.cypher_utils import rewriting
 
 
 class TestNeo4jGraph(object):
@@ -236,6 +240,60 @@ class TestNeo4jGraph(object):
                     for v in attrs_edge_out_n2[k][kk]:
                         assert(v in attrs_edge_out_merged[merged_node][kk])
 
+    def test_rewrite_many(self):
+        self.g.add_nodes_from(["p1", "p2", "q1", "q2"])
+        self.g.add_edges_from([("p1", "q1"), ("p2", "q2")])
+        pattern = nx.DiGraph()
+        pattern.add_nodes_from(["p", "q"])
+        pattern.add_edge("p", "q")
+        rule = Rule.from_transform(pattern)
+        p_clone, clone = rule.inject_clone_node("p")
+        rule.inject_remove_edge(p_clone, "q")
+        instances = [{"p": "p1", "q": "q1"}, {"p": "p2", "q": "q2"}]
+        rhs_gs = self.g.rewrite_many(rule, instances)
+        assert(len(rhs_gs) == 2)
+        for instance, rhs_g in zip(instances, rhs_gs):
+            assert(rhs_g["q"] == instance["q"])
+            assert(rhs_g[clone] in self.g.nodes())
+            assert(rhs_g[clone] not in self.g.predecessors(instance["q"]))
+            assert(rhs_g["p"] in self.g.predecessors(instance["q"]))
+
+
+
+class TestCypherQueries(object):
+    """Tests of the generated queries (no database required)."""
+
+    def test_matching_template(self):
+        p1 = nx.DiGraph()
+        p1.add_nodes_from([("a", {"name": "EGFR"}), "b"])
+        p1.add_edge("a", "b")
+        p2 = nx.DiGraph()
+        p2.add_nodes_from([("x", {"name": "Grb2"}), "y"])
+        p2.add_edge("x", "y")
+
+        query1, parameters1, variables1 = rewriting.find_matching(
+            p1, "node", "edge", nodes=["n1", "n2"],
+            pattern_typing={"meta": {"a": "protein"}})
+        query2, parameters2, variables2 = rewriting.find_matching(
+            p2, "node", "edge", nodes=["n3"],
+            pattern_typing={"meta": {"x": "region"}})
+        assert(query1 is query2)
+        assert("EGFR" not in query1 and "protein" not in query1)
+
+        assert(parameters1 == {
+            "nodes": ["n1", "n2"],
+            "type_0_0": "protein",
+            "attr_0_0": ["EGFR"]})
+        assert(parameters2 == {
+            "nodes": ["n3"],
+            "type_0_0": "region",
+            "attr_0_0": ["Grb2"]})
+        assert(variables1 == {"n0": "a", "n1": "b"})
+        assert(variables2 == {"n0": "x", "n1": "y"})
+
+        query3, _, _ = rewriting.find_matching(
+            p2, "node", "edge", nodes=["n3"])
+        assert(query3 != query1)
 
 #t = TestGraphs()
 #t.test_merge_nodes()
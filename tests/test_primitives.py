@@ -287,8 +287,112 @@ class TestPrimitives(object):
              (3, 2, {'s': 'u'}),
              (3, 4)]
         )
-        find_matching(self.graph, pattern)
-        # assert smth here
+        instances = find_matching(self.graph, pattern)
+        assert(len(instances) == 2)
+        assert({1: '1', 2: '2', 3: '4', 4: '3'} in instances)
+        assert({1: '1', 2: '2', 3: '5', 4: '6'} in instances)
+
+    def test_find_matching_cycles(self):
+        pattern = nx.DiGraph()
+        add_nodes_from(pattern, ["x", "y"])
+        add_edges_from(pattern, [("x", "y"), ("y", "x")])
+        instances = find_matching(self.graph, pattern)
+        assert(len(instances) == 8)
+        for instance in instances:
+            assert(instance["x"] != instance["y"])
+
+        instances = find_matching(
+            self.graph, pattern, nodes=['11', '12', '13'])
+        assert(len(instances) == 6)
+
+        add_edge(pattern, "x", "x")
+        assert(len(find_matching(self.graph, pattern)) == 0)
+
+    def test_find_matching_workers(self):
+        pattern = nx.DiGraph()
+        add_nodes_from(pattern, ["x", "y", "z"])
+        add_edges_from(pattern, [("x", "y"), ("y", "z")])
+
+        def _sorted(instances):
+            return sorted([sorted(i.items()) for i in instances])
+
+        instances = find_matching(self.graph, pattern)
+        parallel_instances = find_matching(self.graph, pattern, workers=2)
+        assert(_sorted(parallel_instances) == _sorted(instances))
+        assert(find_matching(self.graph, pattern, workers=2) ==
+               parallel_instances)
+
+    def test_find_matching_distinct_embeddings(self):
+        pattern = nx.DiGraph()
+        add_nodes_from(pattern, ["x", "y"])
+        add_edges_from(pattern, [("x", "y"), ("y", "x")])
+        instances = find_matching(self.graph, pattern)
+        distinct = find_matching(
+            self.graph, pattern, distinct_embeddings=True)
+        assert(len(distinct) * 2 == len(instances))
+        assert(set(frozenset(i.values()) for i in distinct) ==
+               set(frozenset(i.values()) for i in instances))
+
+        add_node_attrs(pattern, "x", {"name": "BND"})
+        assert(len(find_matching(
+            self.graph, pattern, distinct_embeddings=True)) ==
+            len(find_matching(self.graph, pattern)))
+
+    def test_find_matching_budget(self):
+        pattern = nx.DiGraph()
+        add_nodes_from(pattern, ["x", "y", "z"])
+        add_edges_from(pattern, [("x", "y"), ("y", "z")])
+        instances = find_matching(self.graph, pattern)
+        assert(not instances.truncated)
+        assert(instances.steps > 0)
+
+        partial = find_matching(self.graph, pattern, max_steps=5)
+        assert(partial.truncated)
+        assert(partial.steps == 5)
+        assert(len(partial) < len(instances))
+        for instance in partial:
+            assert(instance in instances)
+
+        assert(not find_matching(self.graph, pattern, timeout=60).truncated)
+
+    def test_iter_matching(self):
+        pattern = nx.DiGraph()
+        add_nodes_from(pattern, ["x", "y"])
+        add_edges_from(pattern, [("x", "y"), ("y", "x")])
+        instances = list(iter_matching(self.graph, pattern, limit=3))
+        assert(len(instances) == 3)
+        assert(find_first_matching(self.graph, pattern) == instances[0])
+
+        add_node_attrs(pattern, "x", {"name": "EGFR"})
+        assert(find_first_matching(self.graph, pattern) is None)
+
+    def test_attribute_index(self):
+        pattern = nx.DiGraph()
+        add_nodes_from(pattern, [("x", {"name": "BND"}), "y"])
+        add_edges_from(pattern, [("x", "y")])
+        instances = find_matching(self.graph, pattern)
+
+        index = build_attribute_index(self.graph)
+        assert(index.candidates({"name": {"BND"}}) == {'2', '6', '9'})
+        assert(len(find_matching(self.graph, pattern)) == len(instances))
+
+        add_node_attrs(self.graph, '8', {"name": "BND"})
+        remove_node_attrs(self.graph, '9', {"name": "BND"})
+        assert(index.candidates({"name": {"BND"}}) == {'2', '6', '8'})
+        clone_node(self.graph, '8', '8_clone')
+        merge_nodes(self.graph, ['2', '6'], 'merged')
+        assert(index.candidates({"name": {"BND"}}) ==
+               {'merged', '8', '8_clone'})
+        update_node_attrs(self.graph, '8', {"name": "SH2"})
+        assert(index.candidates({"name": {"BND", "WAF1"}}) == {'8_clone'})
+        remove_node(self.graph, '8_clone')
+        assert(index.candidates({"name": {"BND"}}) == {'merged'})
+        assert(index.candidates({}) is None)
+
+        add_edge(self.graph, 'merged', '8')
+        assert(find_matching(self.graph, pattern) == [{'x': 'merged', 'y': '8'}])
+        drop_attribute_index(self.graph)
+        assert(find_matching(self.graph, pattern) == [{'x': 'merged', 'y': '8'}])
 
     def test_rewrite(self):
         pattern = nx.DiGraph()
@@ -1,9 +1,12 @@
+import copy
+
 import networkx as nx
 
 from regraph import Rule
 from regraph import keys_by_value
-from regraph import RuleError
+from regraph import RuleError, RewritingError
 from regraph.networkx.category_utils import check_homomorphism
+from regraph.networkx.overlay import OverlayDiGraph
 import regraph.networkx.primitives as prim
 
 
@@ -354,3 +357,112 @@ class TestRule(object):
         assert((5, 3) in rule2.rhs.edges())
         assert(5 in rule2.rhs.nodes() and 5 not in rule2.p.nodes())
         assert((2, 4) in rule2.rhs.edges())
+
+    def test_apply_to_overlay(self):
+        graph = nx.DiGraph()
+        prim.add_nodes_from(
+            graph, [(1, {'a': {1}}), 2, 3, (4, {'b': {2}}), 5])
+        prim.add_edges_from(
+            graph, [(1, 2, {'w': {1}}), (2, 3), (3, 4), (4, 5)])
+        original = copy.deepcopy(graph)
+
+        rule = Rule.from_transform(graph.subgraph([1, 2]))
+        rule.inject_clone_node(1)
+        rule.inject_remove_edge(1, 2)
+        rule.inject_add_node('new', {'c': {3}})
+        rule.inject_add_edge('new', 2)
+        instance = {1: 1, 2: 2}
+
+        expected, _ = rule.apply_to(graph, instance)
+        result, _ = rule.apply_to(graph, instance, overlay=True)
+        assert(isinstance(result, OverlayDiGraph))
+        assert(prim.equal(graph, original))
+        assert(prim.equal(result, expected))
+
+        materialized = result.materialize()
+        assert(type(materialized) == nx.DiGraph)
+        assert(prim.equal(materialized, expected))
+        assert(prim.equal(copy.deepcopy(result), expected))
+
+        result.commit()
+        assert(prim.equal(graph, expected))
+        assert(prim.equal(result, expected))
+        assert(graph.pred == expected.pred)
+
+    def test_apply_to_all(self):
+        graph = nx.DiGraph()
+        prim.add_nodes_from(graph, [1, 2, 3, 4, 5])
+        prim.add_edges_from(graph, [(1, 2), (3, 2), (4, 5)])
+
+        lhs = nx.DiGraph()
+        prim.add_nodes_from(lhs, ['x', 'y'])
+        prim.add_edges_from(lhs, [('x', 'y')])
+        rule = Rule.from_transform(lhs)
+        rule.inject_clone_node('x')
+        rule.inject_add_node('new')
+        rule.inject_add_edge('new', 'y')
+        instances = [{'x': 1, 'y': 2}, {'x': 3, 'y': 2}, {'x': 4, 'y': 5}]
+
+        expected = copy.deepcopy(graph)
+        for instance in instances:
+            rule.apply_to(expected, instance, inplace=True)
+        result, rhs_g_primes = rule.apply_to_all(graph, instances)
+        assert(prim.equal(result, expected))
+        assert(len(rhs_g_primes) == 3)
+        assert(rhs_g_primes[0]['y'] == rhs_g_primes[1]['y'] == 2)
+        for rhs_g_prime in rhs_g_primes:
+            for s, t in rule.rhs.edges():
+                assert((rhs_g_prime[s], rhs_g_prime[t]) in result.edges())
+
+        # Instances removing a shared node are not independent
+        rule = Rule.from_transform(lhs)
+        rule.inject_remove_node('y')
+        try:
+            rule.apply_to_all(graph, instances)
+            raise ValueError()
+        except RewritingError:
+            pass
+        try:
+            rule.to_cypher_batch(instances)
+            raise ValueError()
+        except RewritingError:
+            pass
+        _, parameters, _ = rule.to_cypher_batch([instances[0], instances[2]])
+        assert(len(parameters["instances"]) == 2)
+
+        # An edge added by an instance cannot be removed by another
+        graph = nx.DiGraph()
+        prim.add_nodes_from(graph, [1, 2, 3])
+        prim.add_edges_from(graph, [(1, 2), (2, 3)])
+        lhs.add_node('z')
+        rule = Rule.from_transform(lhs)
+        rule.inject_remove_edge('x', 'y')
+        rule.inject_add_edge('y', 'z')
+        instances = [{'x': 1, 'y': 2, 'z': 3}, {'x': 2, 'y': 3, 'z': 1}]
+        try:
+            rule.apply_to_all(graph, instances)
+            raise ValueError()
+        except RewritingError:
+            pass
+        assert(rule.independent_instances(instances) == instances[:1])
+
+    def test_plan(self):
+        rule = Rule(self.p, self.pattern, self.rhs, self.p_lhs, self.p_rhs)
+        plan = rule.plan()
+        assert(rule.plan() is plan)
+        assert(plan.lhs_preimages[1] == ('a',))
+        assert(plan.rhs_preimages['t'] == ())
+        assert(plan.added_nodes == {'t'})
+        assert(rule.added_nodes() == {'t'})
+        assert(plan.removed_edges == {('c', 'b')})
+        assert(plan.is_relaxing and plan.is_restrictive)
+
+        # The plan is invalidated by the modifications of the rule
+        rule.inject_clone_node(2)
+        new_plan = rule.plan()
+        assert(new_plan is not plan)
+        assert(len(new_plan.cloned_nodes[2]) == 2)
+        assert(rule.cloned_nodes() == {2: set(new_plan.cloned_nodes[2])})
+
+        rule.rhs = copy.deepcopy(rule.rhs)
+        assert(rule.plan() is not new_plan)